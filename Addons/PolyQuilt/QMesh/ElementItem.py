@@ -22,7 +22,13 @@ from ..utils import pqutil
 from ..utils import draw_util
 from ..utils.dpi import *
 
-__all__ = ['ElementItem']
+__all__ = ['ElementItem', 'ElementCandidate']
+
+# PickElement の候補. 採用されたものだけ ElementItem にする
+ElementCandidate = collections.namedtuple('ElementCandidate', ('element', 'coord', 'hitPosition', 'dist'))
+
+# ミラーが未解決であることを示す
+_UNRESOLVED = object()
 
 class EmptyElement :
     def __init__(self) :
@@ -44,11 +50,9 @@ class ElementItem :
         self.__hitPosition: Vector = copy.copy(hitPosition)
         self.__coord: Vector = copy.copy(coord)
         self.__dist: float = dist
-        self.__mirror = None
         self.__qmesh = qmesh
-        self.__mirror = None
+        self.__mirror = _UNRESOLVED
         self.__div = 0
-        self.setup_mirror()
 
     @property
     def bm( self ) :
@@ -79,12 +83,10 @@ class ElementItem :
 
 
     def setup_mirror(self):
+        self.__mirror = None
         if self.__qmesh is not None :
-            is_mirror_mode = self.__qmesh.is_mirror_mode
             if self.__qmesh.is_mirror_mode :
                 self.__mirror = self.__qmesh.find_mirror( self.element )
-        else :
-            self.__mirror = None
 
     def set_snap_div( self , div : int ) :
         self.__div = div
@@ -111,6 +113,9 @@ class ElementItem :
 
     @property
     def mirror(self):
+        # 最初に参照されたときに探す
+        if self.__mirror is _UNRESOLVED :
+            self.setup_mirror()
         return self.__mirror
 
     @property
@@ -178,7 +183,7 @@ class ElementItem :
 
     @property
     def is_straddle_x_zero(self) -> bool :
-        if self.__qmesh.is_mirror_mode and self.__mirror == None and self.element != None :
+        if self.__qmesh.is_mirror_mode and self.mirror == None and self.element != None :
             if self.element == self.__qmesh.find_mirror( self.element , False ) :
                 return True
         return False
@@ -194,12 +199,13 @@ class ElementItem :
 
     @property
     def mirror_verts( self ) -> bmesh.types.BMVert:
-        if self.__mirror is None :
+        mirror = self.mirror
+        if mirror is None :
             return []
-        elif isinstance( self.__mirror , bmesh.types.BMVert ) :
-            return [self.__mirror]
+        elif isinstance( mirror , bmesh.types.BMVert ) :
+            return [mirror]
         else :
-            return self.__mirror.verts
+            return mirror.verts
 
     @property
     def local_co( self ) -> Vector:
@@ -232,6 +238,10 @@ class ElementItem :
     def Empty():
         return ElementItem( None , EmptyElement() , None , None , 0.0 )
 
+    @staticmethod
+    def FromCandidate(qmesh, candidate : ElementCandidate):
+        return ElementItem(qmesh, candidate.element, candidate.coord, candidate.hitPosition, candidate.dist)
+
     @staticmethod
     def FormVert(qmesh, v):
         p = pqutil.location_3d_to_region_2d(v.co)
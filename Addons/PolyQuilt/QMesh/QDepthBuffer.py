@@ -0,0 +1,186 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+__all__ = ['QDepthBuffer']
+
+class QDepthBuffer :
+    """Depth buffer of the region, or of a window of it at origin, rasterized on the CPU.
+
+    Depth is the NDC z of the nearest triangle at each pixel center, which
+    interpolates linearly in screen space for both perspective and ortho views.
+    Pixels touched by a triangle too small to cover any pixel center are marked
+    as covered with unknown depth. Points are tested against the 3x3 pixels
+    around them so that answers near silhouettes and shared edges come back as
+    AMBIGUOUS instead of guessed.
+    """
+
+    VISIBLE = 1
+    AMBIGUOUS = 0
+    OCCLUDED = -1
+
+    # 一度に展開するフラグメント数の上限
+    chunk_size = 1 << 22
+
+    def __init__(self, width, height, with_ids = False, origin = (0, 0)) :
+        self.width = int(width)
+        self.height = int(height)
+        # バッファの左下のピクセルがリージョンのどこか
+        self.origin = np.array((int(origin[0]), int(origin[1])), dtype = np.float64)
+        self.depth = np.full(self.width * self.height, np.inf, dtype = np.float32)
+        self.ids = np.full(self.width * self.height, -1, dtype = np.int32) if with_ids else None
+        self.covered = np.zeros(self.width * self.height, dtype = bool)
+        # カメラの後ろにまたがる三角形は描けないので,何も言い切れなくなる
+        self.complete = True
+
+    def add_triangles(self, xy, depth, front, tris, ids = None) :
+        """Rasterize tris (T,3) indexing xy (N,2) region coordinates, depth (N,) NDC z and front (N,) w > 0."""
+        if ids is None :
+            ids = np.arange(len(tris))
+        tf = front[tris]
+        inside = tf.all(axis = 1)
+        if not inside[tf.any(axis = 1)].all() :
+            self.complete = False
+        tris = tris[inside]
+        ids = ids[inside]
+
+        p = xy[tris].astype(np.float64) - self.origin
+        # 窓にかからない三角形は先に落とす
+        lo = p.min(axis = 1)
+        hi = p.max(axis = 1)
+        overlap = (hi[:, 0] >= 0.0) & (lo[:, 0] < self.width) & (hi[:, 1] >= 0.0) & (lo[:, 1] < self.height)
+        if not overlap.all() :
+            tris = tris[overlap]
+            ids = ids[overlap]
+            p = p[overlap]
+        z = depth[tris].astype(np.float64)
+        ax, ay = p[:, 0, 0], p[:, 0, 1]
+        bx, by = p[:, 1, 0], p[:, 1, 1]
+        cx, cy = p[:, 2, 0], p[:, 2, 1]
+        area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+        # 三角形に含まれうるピクセル中心の範囲
+        lo_x = np.maximum(np.ceil(np.minimum(np.minimum(ax, bx), cx) - 0.5), 0).astype(np.int64)
+        lo_y = np.maximum(np.ceil(np.minimum(np.minimum(ay, by), cy) - 0.5), 0).astype(np.int64)
+        hi_x = np.minimum(np.floor(np.maximum(np.maximum(ax, bx), cx) - 0.5), self.width - 1).astype(np.int64)
+        hi_y = np.minimum(np.floor(np.maximum(np.maximum(ay, by), cy) - 0.5), self.height - 1).astype(np.int64)
+        span_x = np.maximum(hi_x - lo_x + 1, 0)
+        counts = span_x * np.maximum(hi_y - lo_y + 1, 0)
+
+        # ピクセル中心にかからない小さな三角形も頂点のあるピクセルは塞いでおく
+        cells = np.floor(p).astype(np.int64)
+        on_screen = (cells[..., 0] >= 0) & (cells[..., 0] < self.width) & (cells[..., 1] >= 0) & (cells[..., 1] < self.height)
+        self.covered[cells[..., 1][on_screen] * self.width + cells[..., 0][on_screen]] = True
+
+        keep = (counts > 0) & (area != 0.0)
+        with np.errstate(divide = 'ignore') :
+            inv_area = 1.0 / area[keep]
+        ax, ay, bx, by, cx, cy = ax[keep], ay[keep], bx[keep], by[keep], cx[keep], cy[keep]
+        z = z[keep]
+
+        # 重心座標と深度をピクセル中心の一次式 (x, y, 1) の係数にしておく
+        l0 = np.stack((by - cy, cx - bx, bx * cy - by * cx), axis = 1) * inv_area[:, None]
+        l1 = np.stack((cy - ay, ax - cx, cx * ay - cy * ax), axis = 1) * inv_area[:, None]
+        l2 = -l0 - l1
+        l2[:, 2] += 1.0
+        zc = l0 * z[:, 0:1] + l1 * z[:, 1:2] + l2 * z[:, 2:3]
+        self.__coef = np.concatenate((l0, l1, l2, zc), axis = 1)
+        self.__lo_x = lo_x[keep]
+        self.__lo_y = lo_y[keep]
+        self.__span_x = span_x[keep]
+        self.__counts = counts[keep]
+        self.__ids = ids[keep]
+
+        # 深度を書いてから,一番手前だったフラグメントのIDを書く
+        chunks = self.__chunks(self.__counts)
+        fragments = None
+        for start, end in chunks :
+            fragments = self.__fragments(start, end)
+            np.minimum.at(self.depth, fragments[0], fragments[1])
+            self.covered[fragments[0]] = True
+        if self.ids is not None :
+            for start, end in chunks :
+                if len(chunks) > 1 :
+                    fragments = self.__fragments(start, end)
+                pixel, fz, fi = fragments
+                nearest = fz <= self.depth[pixel]
+                self.ids[pixel[nearest]] = fi[nearest]
+        self.__coef = None
+
+    def __chunks(self, counts) :
+        chunks = []
+        total = np.cumsum(counts)
+        start = 0
+        while start < len(counts) :
+            base = total[start - 1] if start > 0 else 0
+            end = int(np.searchsorted(total, base + self.chunk_size, side = 'right'))
+            end = max(end, start + 1)
+            chunks.append((start, end))
+            start = end
+        return chunks
+
+    def __fragments(self, start, end) :
+        count = self.__counts[start:end]
+        rep = np.repeat(np.arange(start, end), count)
+        offset = np.arange(int(count.sum())) - np.repeat(np.cumsum(count) - count, count)
+        sx = self.__span_x[rep]
+        px = self.__lo_x[rep] + offset % sx
+        py = self.__lo_y[rep] + offset // sx
+
+        coef = self.__coef[rep]
+        fx = px + 0.5
+        fy = py + 0.5
+        inside = coef[:, 0] * fx + coef[:, 1] * fy + coef[:, 2] >= 0.0
+        inside &= coef[:, 3] * fx + coef[:, 4] * fy + coef[:, 5] >= 0.0
+        inside &= coef[:, 6] * fx + coef[:, 7] * fy + coef[:, 8] >= 0.0
+
+        coef = coef[inside]
+        fz = (coef[:, 9] * fx[inside] + coef[:, 10] * fy[inside] + coef[:, 11]).astype(np.float32)
+        pixel = py[inside] * self.width + px[inside]
+        return pixel, fz, self.__ids[rep[inside]]
+
+    def samples(self, coords) :
+        """Depth, coverage and ids of the 3x3 pixels around each coord, shaped (K,9)."""
+        coords = np.asarray(coords, dtype = np.float64).reshape((-1, 2)) - self.origin
+        px = np.floor(coords[:, 0]).astype(np.int64)
+        py = np.floor(coords[:, 1]).astype(np.int64)
+        ox = np.array((-1, 0, 1, -1, 0, 1, -1, 0, 1))
+        oy = np.array((-1, -1, -1, 0, 0, 0, 1, 1, 1))
+        sx = np.clip(px[:, None] + ox, 0, self.width - 1)
+        sy = np.clip(py[:, None] + oy, 0, self.height - 1)
+        pixel = sy * self.width + sx
+        ids = self.ids[pixel] if self.ids is not None else None
+        return self.depth[pixel], self.covered[pixel], ids
+
+    def compare(self, coords, depth, tolerance = 1e-6) :
+        """Per sample masks (visible, occluded) of points at NDC z depth, shaped (K,9)."""
+        samples, covered, ids = self.samples(coords)
+        depth = np.asarray(depth, dtype = np.float64).reshape((-1, 1))
+        empty = np.isinf(samples)
+        visible = (depth <= samples + tolerance) & ~(empty & covered)
+        occluded = ~empty & (depth > samples + tolerance)
+        return visible, occluded, ids
+
+    def test(self, coords, depth, tolerance = 1e-6) :
+        """VISIBLE / OCCLUDED when every sample agrees, AMBIGUOUS otherwise."""
+        visible, occluded, ids = self.compare(coords, depth, tolerance)
+        return self.classify(visible, occluded)
+
+    def classify(self, visible, occluded) :
+        state = np.full(len(visible), QDepthBuffer.AMBIGUOUS, dtype = np.int8)
+        state[visible.all(axis = 1)] = QDepthBuffer.VISIBLE
+        state[occluded.all(axis = 1)] = QDepthBuffer.OCCLUDED
+        if not self.complete :
+            state[:] = QDepthBuffer.AMBIGUOUS
+        return state
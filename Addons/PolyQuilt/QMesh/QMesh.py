@@ -22,6 +22,8 @@ from ..utils.dpi import *
 from .ElementItem import ElementItem
 from .QMeshOperators import QMeshOperators
 from .QMeshHighlight import QMeshHighlight
+from .QMeshJournal import QMeshJournal
+from .QDepthBuffer import QDepthBuffer
 
 __all__ = ['QMesh', 'SelectStack']
 
@@ -31,19 +33,71 @@ class QMesh(QMeshOperators) :
         self.highlight = QMeshHighlight(self)
         self.invalid = False
 
-    def UpdateMesh(self, updateHighLight = True) :
-        super().UpdateMesh()
-        if updateHighLight :
-            self.highlight.setDirty()
+    def UpdateMesh(self, updateHighLight = True, changes = None, verts = None) :
+        self.MarkDirty(updateHighLight, changes, verts)
+        self.FlushUpdate()
+
+    def MarkDirty(self, updateHighLight = True, changes = None, verts = None) :
+        super().MarkDirty(changes, verts)
+        if not updateHighLight :
+            # トポロジが変わらないならハイライトは古いまま使う
+            if changes is not None and QMeshJournal.TOPOLOGY not in changes :
+                self.highlight.acknowledge()
+
+    def write_co(self, indices, co) :
+        """arrays.write_co that also moves the projected verts of the highlight instead of dropping the projection."""
+        patch = self.highlight.is_valid
+        self.arrays.write_co(indices, co)
+        if patch :
+            self.highlight.moveVerts(indices)
 
     def CheckValid(self, context) :
         val = super()._CheckValid(context)
-        if val == False or self.invalid:
+        if val == False :
             self.highlight.setDirty()
             self.reload_obj(context)
-            self.invalid = False
+        elif self.invalid :
+            # 同じBMeshが外で編集されたのでジャーナルを進めるだけにしてキャッシュは必要になったときに作り直す
+            self.ensure_lookup_table()
+            self.journal.mark()
+            self.current_matrix = None
+            self.highlight.setDirty()
+        self.invalid = False
         return val
 
+    def depsgraph_updated(self, depsgraph = None) :
+        """Record the changes of a depsgraph update of this mesh that was not sent by a FlushUpdate."""
+        # 前の更新から後にFlushUpdateがあればこの評価に含まれている. 何回送っても1回の評価にまとまる
+        flushes = self.journal.flushes
+        own = flushes != self.seen_flushes
+        self.seen_flushes = flushes
+        if depsgraph is None :
+            self.invalid = True
+            return
+        try :
+            keys = { self.obj.as_pointer() , self.mesh.as_pointer() }
+        except (ReferenceError, AttributeError) :
+            self.invalid = True
+            return
+        updated = False
+        geometry = False
+        transform = False
+        for update in depsgraph.updates :
+            if update.id.original.as_pointer() in keys :
+                updated = True
+                geometry |= update.is_updated_geometry
+                transform |= update.is_updated_transform
+        if not updated :
+            return
+        if not own :
+            if geometry :
+                self.invalid = True
+            else :
+                # 選択や表示だけの変更はどちらのフラグも立たないので,外から来た更新なら選択と表示は変わったものとする
+                self.journal.mark((QMeshJournal.SELECT, QMeshJournal.HIDE))
+        if transform :
+            self.highlight.setDirty()
+
     def UpdateViewQM(self, context):
         self.highlight.UpdatViewHighlight(context, False)
 
@@ -63,27 +117,33 @@ class QMesh(QMeshOperators) :
         if 'VERT' in elements:
             ignoreVerts =  [ i for i in ignore if isinstance(i, bmesh.types.BMVert) ]
             candidateVerts = self.highlight.CollectVerts(coord, radius, ignoreVerts, edgering, backface_culling = backface_culling)
-            for vert in candidateVerts:
-                # 各点からRayを飛ばす
+            states = self.highlight.CheckVisibility(candidateVerts, ignoreFaces)
+            for vert, state in zip(candidateVerts, states):
                 if not QSnap.is_target(vert.hitPosition, bpy.context.active_object):
                     continue
+                # 深度バッファで決まらなければ各点からRayを飛ばす
+                if state == QDepthBuffer.OCCLUDED:
+                    continue
+                if state == QDepthBuffer.VISIBLE:
+                    hitVert = ElementItem.FromCandidate(self, vert)
+                    break
                 hitTemp = self.highlight.PickFace(vert.coord, ignoreFaces, backface_culling = False)
 
                 # 何の面にもヒットしないなら採択
                 if hitTemp.isEmpty:
-                    hitVert = vert
+                    hitVert = ElementItem.FromCandidate(self, vert)
                     break
 
                 # ヒットした面に含まれているなら採択
                 if vert.element in hitTemp.element.verts:
-                    hitVert = vert
+                    hitVert = ElementItem.FromCandidate(self, vert)
                     break
 
                 # ヒットしたポイントより後ろなら採択
                 v1 = matrix @ vert.hitPosition
                 v2 = matrix @ hitTemp.hitPosition
                 if v1.z <= v2.z:
-                    hitVert = vert
+                    hitVert = ElementItem.FromCandidate(self, vert)
                     break
 
         # Todo:ヒットするエッジを探す
@@ -92,24 +152,30 @@ class QMesh(QMeshOperators) :
             ignoreEdges =  [ i for i in ignore if isinstance( i , bmesh.types.BMEdge ) ]
             candidateEdges = self.highlight.CollectEdge( coord , radius , ignoreEdges , backface_culling = backface_culling , edgering= edgering )
 
-            for edge in candidateEdges :
+            states = self.highlight.CheckVisibility( candidateEdges , ignoreFaces )
+            for edge , state in zip( candidateEdges , states ) :
                 if not QSnap.is_target(edge.hitPosition, bpy.context.active_object):
                     continue
+                if state == QDepthBuffer.OCCLUDED :
+                    continue
+                if state == QDepthBuffer.VISIBLE :
+                    hitEdge = ElementItem.FromCandidate( self , edge )
+                    break
                 hitTemp = self.highlight.PickFace( edge.coord , ignoreFaces , backface_culling = False )
                 if hitTemp.isEmpty :
-                    hitEdge = edge
+                    hitEdge = ElementItem.FromCandidate( self , edge )
                     break
 
                 # ヒットした面に含まれているなら採択
                 if edge.element in hitTemp.element.edges:
-                    hitEdge = edge
+                    hitEdge = ElementItem.FromCandidate( self , edge )
                     break
 
                 # ヒットしたポイントより後ろなら採択
                 v1 = matrix @ edge.hitPosition
                 v2 = matrix @ hitTemp.hitPosition
                 if v1.z <= v2.z :
-                    hitEdge = edge
+                    hitEdge = ElementItem.FromCandidate( self , edge )
                     break
 
         if hitVert.isEmpty and hitEdge.isEmpty :
@@ -138,25 +204,43 @@ class QMesh(QMeshOperators) :
 
 
 class SelectStack:
-    def __init__(self, context, bm):
+    """Snapshot of the select flags of a BMesh, put back by pop().
+
+    The flags are kept in NumPy bool buffers. In delta mode pop only
+    writes the elements that differ from it.
+    """
+
+    def __init__(self, context, bm, delta = True):
         self.context = context
         self.bm = bm
+        self.delta = delta
         self.mesh_select_mode = context.tool_settings.mesh_select_mode[0:3]
-        self.vert_selection = [ v.select for v in self.bm.verts ]
-        self.face_selection = [ f.select for f in self.bm.faces ]
-        self.edge_selection = [ e.select for e in self.bm.edges ]
         self.select_history = self.bm.select_history[:]
+        self.vert_selection = self.__read(bm.verts)
+        self.edge_selection = self.__read(bm.edges)
+        self.face_selection = self.__read(bm.faces)
+
+    @staticmethod
+    def __read(seq):
+        return np.fromiter((e.select for e in seq), dtype = bool, count = len(seq))
 
     def select_mode(self, vert, edge, face):
         self.context.tool_settings.mesh_select_mode = (vert, edge, face)
 
     def pop(self):
-        for select, f in zip(self.face_selection, self.bm.faces):
-            f.select = select
-        for select, e in zip(self.edge_selection, self.bm.edges):
-            e.select = select
-        for select, v in zip(self.vert_selection, self.bm.verts):
-            v.select = select
+        bm = self.bm
+        bm.faces.ensure_lookup_table()
+        bm.edges.ensure_lookup_table()
+        bm.verts.ensure_lookup_table()
+
+        # 面の選択は辺と頂点にも波及するので面,辺,頂点の順に戻す
+        for seq, selection in ((bm.faces, self.face_selection), (bm.edges, self.edge_selection), (bm.verts, self.vert_selection)):
+            if self.delta and len(seq) == len(selection):
+                changed = np.flatnonzero(self.__read(seq) != selection).tolist()
+            else:
+                changed = range(min(len(seq), len(selection)))
+            for i in changed:
+                seq[i].select = bool(selection[i])
 
         self.bm.select_history = self.select_history
 
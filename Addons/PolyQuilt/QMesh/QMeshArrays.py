@@ -0,0 +1,154 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import collections
+import numpy as np
+from .QMeshJournal import QMeshJournal, JournalCache
+
+__all__ = ['QMeshArrays', 'ViewProjection', 'project_points']
+
+# verts       : (N,2) float32 region coordinates
+# valid_verts : (N,) bool   in front of the view and not hidden
+# edges       : (E,2) int32  vertex indices of each edge
+# valid_edges : (E,) bool   both ends in front of the view and not hidden
+# depth       : (N,) float32 NDC z
+# front       : (N,) bool   in front of the view (w > 0)
+ViewProjection = collections.namedtuple('ViewProjection', ('verts', 'valid_verts', 'edges', 'valid_edges', 'depth', 'front'))
+
+def project_points(co, matrix, width, height) :
+    """Region xy (N,2), NDC z (N,) and w > 0 (N,) of points co (N,3) under a 4x4 matrix."""
+    m = np.array(matrix, dtype = np.float32)
+    pv = co @ m[:, :3].T + m[:, 3]
+    w = pv[:, 3]
+    front = w > 0.0
+
+    half = np.array((width / 2.0, height / 2.0), dtype = np.float32)
+    safe_w = np.where(front, w, 1.0)
+    xy = pv[:, :2] / safe_w[:, None] * half + half
+    depth = pv[:, 2] / safe_w
+    return xy, depth, front
+
+class QMeshArrays :
+    """Contiguous copies of the BMesh data used by the bulk (NumPy) paths."""
+
+    def __init__(self, bm, journal : QMeshJournal) :
+        self.bm = bm
+        self.journal = journal
+        self.__co = JournalCache(QMeshJournal.COORD, QMeshJournal.TOPOLOGY)
+        self.__vert_hide = JournalCache(QMeshJournal.HIDE, QMeshJournal.TOPOLOGY)
+        self.__vert_select = JournalCache(QMeshJournal.SELECT, QMeshJournal.TOPOLOGY)
+        self.__edge_verts = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__edge_hide = JournalCache(QMeshJournal.HIDE, QMeshJournal.TOPOLOGY)
+        self.__edge_select = JournalCache(QMeshJournal.SELECT, QMeshJournal.TOPOLOGY)
+        self.__edge_bounds = JournalCache(QMeshJournal.COORD, QMeshJournal.TOPOLOGY)
+        self.__face_hide = JournalCache(QMeshJournal.HIDE, QMeshJournal.TOPOLOGY)
+
+    def clear(self) :
+        self.__co.clear()
+        self.__vert_hide.clear()
+        self.__vert_select.clear()
+        self.__edge_verts.clear()
+        self.__edge_hide.clear()
+        self.__edge_select.clear()
+        self.__edge_bounds.clear()
+        self.__face_hide.clear()
+
+    @property
+    def co(self) :
+        def build() :
+            verts = self.bm.verts
+            n = len(verts)
+            co = np.fromiter(itertools.chain.from_iterable(v.co for v in verts), dtype = np.float32, count = n * 3)
+            return co.reshape((n, 3))
+        return self.__co.get(self.journal, build)
+
+    def write_co(self, indices, co) :
+        """Move the verts indices (K,) to co (K,3) and record a COORD change, keeping the cached array."""
+        verts = self.bm.verts
+        for i, c in zip(indices.tolist(), co.tolist()) :
+            verts[i].co = c
+        valid = self.__co.is_valid(self.journal)
+        self.journal.mark((QMeshJournal.COORD,))
+        if valid :
+            # 書いた所だけ更新すれば作り直さなくて済む
+            self.__co.value[indices] = co
+            self.__co.acknowledge(self.journal)
+
+    @property
+    def vert_hide(self) :
+        def build() :
+            verts = self.bm.verts
+            return np.fromiter((v.hide for v in verts), dtype = bool, count = len(verts))
+        return self.__vert_hide.get(self.journal, build)
+
+    @property
+    def vert_select(self) :
+        def build() :
+            verts = self.bm.verts
+            return np.fromiter((v.select for v in verts), dtype = bool, count = len(verts))
+        return self.__vert_select.get(self.journal, build)
+
+    @property
+    def edge_verts(self) :
+        def build() :
+            # 配列はインデックスで引くので振り直しておく
+            self.bm.verts.index_update()
+            self.bm.edges.index_update()
+            edges = self.bm.edges
+            n = len(edges)
+            ev = np.fromiter((v.index for e in edges for v in e.verts), dtype = np.int32, count = n * 2)
+            return ev.reshape((n, 2))
+        return self.__edge_verts.get(self.journal, build)
+
+    @property
+    def edge_hide(self) :
+        def build() :
+            edges = self.bm.edges
+            return np.fromiter((e.hide for e in edges), dtype = bool, count = len(edges))
+        return self.__edge_hide.get(self.journal, build)
+
+    @property
+    def edge_select(self) :
+        def build() :
+            edges = self.bm.edges
+            return np.fromiter((e.select for e in edges), dtype = bool, count = len(edges))
+        return self.__edge_select.get(self.journal, build)
+
+    @property
+    def edge_bounds(self) :
+        """Center (E,3) and half size (E,3) of the bounding box of each edge, float64."""
+        def build() :
+            co = self.co.astype(np.float64)
+            ev = self.edge_verts
+            p0 = co[ev[:, 0]]
+            p1 = co[ev[:, 1]]
+            return (p0 + p1) * 0.5, np.abs(p1 - p0) * 0.5
+        return self.__edge_bounds.get(self.journal, build)
+
+    @property
+    def face_hide(self) :
+        def build() :
+            faces = self.bm.faces
+            return np.fromiter((f.hide for f in faces), dtype = bool, count = len(faces))
+        return self.__face_hide.get(self.journal, build)
+
+    def project(self, matrix, width, height) -> ViewProjection :
+        """Project every vertex with one matmul. matrix is perspective_matrix @ matrix_world."""
+        edge_verts = self.edge_verts
+        xy, depth, front = project_points(self.co, matrix, width, height)
+
+        valid_verts = front & ~self.vert_hide
+        valid_edges = ~self.edge_hide & front[edge_verts[:, 0]] & front[edge_verts[:, 1]]
+
+        return ViewProjection(xy, valid_verts, edge_verts, valid_edges, depth, front)
@@ -17,34 +17,98 @@ from mathutils import *
 import numpy as np
 from ..utils import pqutil
 from ..utils.dpi import *
-from .ElementItem import ElementItem
+from .ElementItem import ElementItem, ElementCandidate
+from .QScreenGrid import QScreenGrid
+from .QMeshJournal import QMeshJournal, JournalCache
+from .QDepthBuffer import QDepthBuffer
+from .QMeshArrays import project_points
 
 __all__ = ['QMeshHighlight']
 
 class QMeshHighlight :
-    __grobal_tag__ = 0
+    # 投影位置や境界のキャッシュが依存する変更
+    depends = (QMeshJournal.COORD, QMeshJournal.TOPOLOGY, QMeshJournal.HIDE)
+    # レイ1本のコストを三角形いくつ分のラスタライズとみなすか
+    triangles_per_ray = 1000
 
     def __init__(self, pqo) :
         self.pqo = pqo
+        self.__viewProjection = None
+        self.__viewGrid = None
+        self.__depthBuffer = None
+        self.__rayCount = 0
+        self.__vertFaceKeys = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__region_size = (0, 0)
         self.__viewPosVerts = None
         self.__viewPosEdges = None
         self.current_matrix = None
         self.__boundaryViewPosVerts = None
         self.__boundaryViewPosEdges = None
-        self.__local_tag__ = 0
+        self.__version = None
+
+    @property
+    def viewProjection(self):
+        self.checkDirty()
+        if self.__viewProjection is None :
+            self.UpdatViewHighlight(bpy.context, True)
+        return self.__viewProjection
+
+    @property
+    def viewGrid(self) -> QScreenGrid :
+        proj = self.viewProjection
+        if self.__viewGrid is None :
+            self.__viewGrid = QScreenGrid(proj, *self.__region_size)
+        return self.__viewGrid
+
+    @property
+    def depthBuffer(self) -> QDepthBuffer :
+        """Depth buffer of the unhidden faces, None until this view has cast enough rays to pay for it."""
+        return self.getDepthBuffer(False)
+
+    def getDepthBuffer(self, forced) -> QDepthBuffer :
+        proj = self.viewProjection
+        if self.__depthBuffer is None :
+            tree = self.pqo.triangles
+            if not forced and self.__rayCount * QMeshHighlight.triangles_per_ray < len(tree.tris) :
+                return None
+            visible = np.flatnonzero(~self.pqo.arrays.face_hide[tree.tri_face])
+            buffer = QDepthBuffer(*self.__region_size, with_ids = True)
+            buffer.add_triangles(proj.verts, proj.depth, proj.front, tree.tris[visible], visible)
+            self.__depthBuffer = buffer
+        return self.__depthBuffer
+
+    def __windowDepthBuffer(self, points) -> QDepthBuffer :
+        # 3x3の周りも読めるように少し広げる
+        width, height = self.__region_size
+        lo = np.maximum(np.floor(points.min(axis = 0)) - 2, 0).astype(np.int64)
+        hi = np.minimum(np.ceil(points.max(axis = 0)) + 2, (width, height)).astype(np.int64)
+        size = np.maximum(hi - lo, 1)
+        proj = self.viewProjection
+        tree = self.pqo.triangles
+        visible = np.flatnonzero(~self.pqo.arrays.face_hide[tree.tri_face])
+        buffer = QDepthBuffer(size[0], size[1], with_ids = True, origin = lo)
+        buffer.add_triangles(proj.verts, proj.depth, proj.front, tree.tris[visible], visible)
+        return buffer
 
     @property
     def viewPosVerts(self):
         self.checkDirty()
         if self.__viewPosVerts == None :
-            self.UpdatViewHighlight(bpy.context, True)
+            proj = self.viewProjection
+            verts = self.pqo.bm.verts
+            xy = proj.verts
+            self.__viewPosVerts = { verts[i] : Vector(xy[i]) for i in np.flatnonzero(proj.valid_verts).tolist() }
         return self.__viewPosVerts
 
     @property
     def viewPosEdges(self):
         self.checkDirty()
         if self.__viewPosEdges == None:
-            self.UpdatViewHighlight(bpy.context, True)
+            proj = self.viewProjection
+            edges = self.pqo.bm.edges
+            xy = proj.verts
+            ev = proj.edges
+            self.__viewPosEdges = { edges[i] : [Vector(xy[ev[i, 0]]), Vector(xy[ev[i, 1]])] for i in np.flatnonzero(proj.valid_edges).tolist() }
         return self.__viewPosEdges
 
     @property
@@ -62,12 +126,51 @@ class QMeshHighlight :
         return self.__boundaryViewPosEdges
 
     def setDirty(self):
-        QMeshHighlight.__grobal_tag__ = QMeshHighlight.__grobal_tag__ + 1
+        self.__version = None
         self.checkDirty()
 
     def checkDirty(self):
-        if QMeshHighlight.__grobal_tag__ == self.__local_tag__:
+        version = self.pqo.journal.version(*QMeshHighlight.depends)
+        if version == self.__version:
             return
+        self.__viewProjection = None
+        self.__viewGrid = None
+        self.__depthBuffer = None
+        self.__rayCount = 0
+        self.clearViewPos()
+        self.current_matrix = None
+        self.__version = version
+
+    def acknowledge(self):
+        # 今の変更を反映せずにキャッシュを使い続ける
+        self.__version = self.pqo.journal.version(*QMeshHighlight.depends)
+
+    @property
+    def is_valid(self) -> bool :
+        return self.__viewProjection is not None and self.__version == self.pqo.journal.version(*QMeshHighlight.depends)
+
+    def moveVerts(self, indices) :
+        """Project again only the verts indices after their coordinates were written, keeping the rest."""
+        proj = self.__viewProjection
+        arrays = self.pqo.arrays
+        xy, depth, front = project_points(arrays.co[indices], self.current_matrix, *self.__region_size)
+        changed = (proj.front[indices] != front).any()
+        proj.verts[indices] = xy
+        proj.depth[indices] = depth
+        proj.front[indices] = front
+        proj.valid_verts[indices] = front & ~arrays.vert_hide[indices]
+        if changed :
+            ev = proj.edges
+            proj.valid_edges[:] = ~arrays.edge_hide & proj.front[ev[:, 0]] & proj.front[ev[:, 1]]
+        if self.__viewGrid is not None and not self.__viewGrid.move_verts(indices) :
+            self.__viewGrid = None
+        # 全体の深度バッファは描き直しになるので捨てる
+        self.__depthBuffer = None
+        self.__rayCount = 0
+        self.clearViewPos()
+        self.acknowledge()
+
+    def clearViewPos(self):
         if self.__viewPosVerts:
             del self.__viewPosVerts
         self.__viewPosVerts = None
@@ -84,9 +187,6 @@ class QMeshHighlight :
             del self.__boundaryViewPosEdges
         self.__boundaryViewPosEdges = None
 
-        self.current_matrix = None
-        self.__local_tag__ = QMeshHighlight.__grobal_tag__
-
     def UpdatViewHighlight(self, context, forced):
         rv3d = context.region_data
         pj_matrix = rv3d.perspective_matrix @ self.pqo.obj.matrix_world
@@ -96,60 +196,39 @@ class QMeshHighlight :
             return
 
         region = context.region
-        halfW = region.width / 2.0
-        halfH = region.height / 2.0
-        mat_scaleX = mathutils.Matrix.Scale(halfW, 4, (1.0, 0.0, 0.0))
-        mat_scaleY = mathutils.Matrix.Scale(halfH, 4, (0.0, 1.0, 0.0))
-        matrix = mat_scaleX @ mat_scaleY @ pj_matrix
-        halfWH = Vector((halfW, halfH))
-
-        pqbm = self.pqo.bm
-
-        viewPos = {}
-        for p in pqbm.verts:
-            pv = matrix @ p.co.to_4d()
-            if pv[3] > 0.0:
-                v2 = pv.to_2d() / pv[3] + halfWH
-                viewPos[p] = v2
-
-        viewEdges = {}
-        for e in pqbm.edges:
-            if e.hide:
-                continue
-            ev0 = e.verts[0]
-            ev1 = e.verts[1]
-            if not ev0 in viewPos or not ev1 in viewPos:
-                continue
-            p0 = viewPos[ev0]
-            p1 = viewPos[ev1]
-            viewEdges[e] = [p0, p1]
-
-        self.__viewPosEdges = viewEdges
-        self.__viewPosVerts = { v : p for v, p in viewPos.items() if p and not v.hide }
-        self.__boundaryViewPosEdges = None
-        self.__boundaryViewPosVerts = None
+        self.pqo.ensure_lookup_table()
+        self.__viewProjection = self.pqo.arrays.project(pj_matrix, region.width, region.height)
+        self.__region_size = (region.width, region.height)
+        self.__viewGrid = None
+        self.__depthBuffer = None
+        self.__rayCount = 0
+        self.clearViewPos()
 
         self.current_matrix = pj_matrix
 
 
-    def CollectVerts(self, coord, radius : float, ignore = [], edgering = False, backface_culling = True) -> ElementItem :
-        p = Vector(coord)
-        rr = Vector((radius, 0))
+    def CollectVerts(self, coord, radius : float, ignore = [], edgering = False, backface_culling = True) -> ElementCandidate :
+        p = np.array((coord[0], coord[1]), dtype = np.float32)
 
         pqbm = self.pqo.bm
         verts = pqbm.verts
-        viewPos = self.viewPosVerts
+        proj = self.viewProjection
 
         ray = None
         if backface_culling:
             ray = pqutil.Ray.from_screen(bpy.context, coord).world_to_object(self.pqo.obj)
 
+        candidates = self.viewGrid.query_verts(coord, radius)
+        d2 = ((proj.verts[candidates] - p) ** 2).sum(axis = 1)
+        hits = d2 <= radius * radius
+        candidates = candidates[hits]
+        d2 = d2[hits]
+
         s = []
-        for v, vs in viewPos.items():
+        for i in candidates[np.argsort(d2, kind = 'stable')].tolist() :
+            v = verts[i]
             if v in ignore:
                 continue
-            if not (vs - p <= rr and v in verts):
-                continue
             if edgering:
                 if not (v.is_boundary or not v.is_manifold):
                     continue
@@ -157,48 +236,51 @@ class QMeshHighlight :
                 if v.is_manifold:
                     if not v.is_boundary and v.normal.dot(ray.vector) >= 0:
                         continue
-            s.append([v, vs])
+            s.append([v, Vector(proj.verts[i])])
 
-        r = sorted(s, key=lambda i:(i[1] - p).length_squared)
         matrix_world = self.pqo.obj.matrix_world
 
         tr = []
-        for i in r:
-            trv = ElementItem(self.pqo, i[0], i[1], matrix_world @ i[0].co)
+        for i in s:
+            trv = ElementCandidate(i[0], i[1], matrix_world @ i[0].co, 0)
             tr.append(trv)
         return tr
 
 
-    def CollectEdge( self ,coord , radius : float , ignore = [] , backface_culling = True , edgering = False ) -> ElementItem :
+    def CollectEdge( self ,coord , radius : float , ignore = [] , backface_culling = True , edgering = False ) -> ElementCandidate :
         p = Vector( coord )
-        viewPosEdge = self.viewPosEdges
+        proj = self.viewProjection
         ray = pqutil.Ray.from_screen( bpy.context , coord )
         ray_distance = ray.distance
         location_3d_to_region_2d = pqutil.location_3d_to_region_2d
-        intersect_point_line = geometry.intersect_point_line
         matrix_world = self.pqo.obj.matrix_world      
-        rr = Vector( (radius,0) )
 
-        def Conv( edge ) -> ElementItem :
+        def Conv( edge ) -> ElementCandidate :
             v1 = matrix_world @ edge.verts[0].co
             v2 = matrix_world @ edge.verts[1].co
             h0 , h1 , d = ray_distance( pqutil.Ray( v1 , (v1-v2) ) )
             c = location_3d_to_region_2d(h1)
-            return ElementItem( self.pqo , edge , c , h1 , d )
-
-        def intersect( p1 , p2 ) :
-            hit , pt = intersect_point_line( p , p1 , p2 )
-            if pt > 0 and pt < 1 :
-                if hit - p <= rr :
-                    return True
-            return False
-
-        pqbm = self.pqo.bm
-        edges = pqbm.edges
+            return ElementCandidate( edge , c , h1 , d )
+
+        # 線分と点の距離をまとめて計算する
+        candidates = self.viewGrid.query_edges( coord , radius )
+        ev = proj.edges[candidates]
+        p0 = proj.verts[ev[:, 0]]
+        p1 = proj.verts[ev[:, 1]]
+        pt = np.array( (coord[0], coord[1]) , dtype = np.float32 )
+        vec = p1 - p0
+        len2 = ( vec * vec ).sum( axis = 1 )
+        with np.errstate( divide = 'ignore' , invalid = 'ignore' ) :
+            t = ( ( pt - p0 ) * vec ).sum( axis = 1 ) / len2
+        hit = p0 + vec * t[:, None]
+        d2 = ( ( hit - pt ) ** 2 ).sum( axis = 1 )
+        candidates = candidates[ ( t > 0 ) & ( t < 1 ) & ( d2 <= radius * radius ) ]
+
+        edges = self.pqo.bm.edges
         if edgering :
-            r = [ Conv(e) for e,(p1,p2) in viewPosEdge.items() if len(e.link_faces) <= 1 and intersect( p1 , p2 ) and e not in ignore ]
+            r = [ Conv(e) for e in ( edges[i] for i in candidates.tolist() ) if len(e.link_faces) <= 1 and e not in ignore ]
         else :
-            r = [ Conv(e) for e,(p1,p2) in viewPosEdge.items() if intersect( p1 , p2 ) and e in edges and e not in ignore ]
+            r = [ Conv(e) for e in ( edges[i] for i in candidates.tolist() ) if e not in ignore ]
 
         if backface_culling :
             ray2 = ray.world_to_object( self.pqo.obj )
@@ -212,25 +294,115 @@ class QMeshHighlight :
 
     def PickFace(self, coord, ignore = [], backface_culling = True) -> ElementItem:
         ray = pqutil.Ray.from_screen(bpy.context, coord).world_to_object(self.pqo.obj)
-        pos, nrm, index, dist = self.pqo.btree.ray_cast(ray.origin, ray.vector)
-        prePos = ray.origin
         pqbm = self.pqo.bm
-        while (index is not None):
+
+        # 隠れている面と無視する面を飛ばした最初の面
+        def is_pickable(index):
+            face = pqbm.faces[index]
+            return face.hide is False and face not in ignore
+
+        self.__rayCount += 1
+        hits = self.pqo.btree.ray_cast_all(ray.origin, ray.vector, filter_func = is_pickable, limit = 1)
+        if hits:
+            pos, nrm, index, dist = hits[0]
             face = pqbm.faces[index]
-            if (prePos - pos).length < 0.00001:
-                break
-            prePos = pos
-            if face.hide is False and face not in ignore:
-                if backface_culling == False or face.normal.dot(ray.vector) < 0:
-                    return ElementItem(self.pqo, face, coord, self.pqo.obj.matrix_world @ pos, dist)
-                else:
-                    return ElementItem.Empty()
-            ray.origin = ray.origin + ray.vector * 0.00001
-            pos, nrm, index, dist = self.pqo.btree.ray_cast(ray.origin, ray.vector)
+            if backface_culling == False or face.normal.dot(ray.vector) < 0:
+                return ElementItem(self.pqo, face, coord, self.pqo.obj.matrix_world @ pos, dist)
 
         return ElementItem.Empty()
 
 
+    def CheckVisibility(self, candidates, ignore = []) :
+        """QDepthBuffer state of each candidate. Own faces do not hide it, as in PickElement."""
+        states = [QDepthBuffer.AMBIGUOUS] * len(candidates)
+        if not candidates or ignore :
+            return states
+        buffer = self.depthBuffer
+        if buffer is None :
+            return states
+
+        matrix = bpy.context.region_data.perspective_matrix
+        targets = []
+        coords = []
+        depths = []
+        for i, c in enumerate(candidates) :
+            pv = matrix @ c.hitPosition.to_4d()
+            if c.coord is None or pv.w <= 0.0 :
+                continue
+            targets.append(i)
+            coords.append(c.coord.to_tuple())
+            depths.append(pv.z / pv.w)
+        if not targets :
+            return states
+        visible, occluded, ids = buffer.compare(coords, depths)
+
+        # 手前にあるのが自分を含む面ならヒット扱い
+        tri_face = self.pqo.btree.tri_face
+        for k in np.flatnonzero(occluded.any(axis = 1)).tolist() :
+            own = { f.index for f in candidates[targets[k]].element.link_faces }
+            for j in np.flatnonzero(occluded[k]).tolist() :
+                if int(tri_face[ids[k, j]]) in own :
+                    occluded[k, j] = False
+                    visible[k, j] = True
+
+        for k, state in enumerate(buffer.classify(visible, occluded).tolist()) :
+            states[targets[k]] = state
+        return states
+
+    def CheckVertsVisibility(self, indices) -> np.ndarray :
+        """QDepthBuffer state of each vertex index. Faces using the vertex do not hide it."""
+        states = np.full(len(indices), QDepthBuffer.AMBIGUOUS, dtype = np.int8)
+        proj = self.viewProjection
+        front = np.flatnonzero(proj.front[indices])
+        if len(front) == 0 :
+            return states
+        target = indices[front]
+        buffer = self.getDepthBuffer(False)
+        if buffer is None :
+            # 全体のバッファが無ければ頂点を囲む範囲だけ描く
+            buffer = self.__windowDepthBuffer(proj.verts[target])
+        visible, occluded, ids = buffer.compare(proj.verts[target], proj.depth[target])
+
+        # 手前にあるのが自分を含む面ならヒット扱い
+        tree = self.pqo.triangles
+        count = len(proj.verts)
+        def build() :
+            return np.unique((tree.tri_face.astype(np.int64)[:, None] * count + tree.tris).ravel())
+        keys = self.__vertFaceKeys.get(self.pqo.journal, build)
+        face = tree.tri_face[np.maximum(ids, 0)].astype(np.int64)
+        k = face * count + target[:, None]
+        pos = np.minimum(np.searchsorted(keys, k), len(keys) - 1)
+        own = occluded & (ids >= 0) & (keys[pos] == k)
+        occluded &= ~own
+        visible |= own
+
+        states[front] = buffer.classify(visible, occluded)
+        return states
+
+    def CollectBrushVerts(self, coord, radius : float, only_select = False, occlusion = True) :
+        """Indices and region positions of the unhidden verts within radius of coord, without touching the selection."""
+        p = np.array((coord[0], coord[1]), dtype = np.float32)
+        proj = self.viewProjection
+
+        indices = self.viewGrid.query_verts(coord, radius)
+        d2 = ((proj.verts[indices] - p) ** 2).sum(axis = 1)
+        indices = indices[d2 <= radius * radius]
+        if only_select :
+            indices = indices[self.pqo.arrays.vert_select[indices]]
+
+        if occlusion and len(indices) :
+            # 深度バッファで決まらない頂点だけRayを飛ばす
+            states = self.CheckVertsVisibility(indices)
+            verts = self.pqo.bm.verts
+            for k in np.flatnonzero(states == QDepthBuffer.AMBIGUOUS).tolist() :
+                v = verts[int(indices[k])]
+                hit = self.PickFace(Vector(proj.verts[indices[k]]), backface_culling = False)
+                if hit.isEmpty or v in hit.element.verts :
+                    states[k] = QDepthBuffer.VISIBLE
+            indices = indices[states == QDepthBuffer.VISIBLE]
+
+        return indices, proj.verts[indices]
+
     def check_hit_element_vert( self , element , mouse_pos ,radius ) :
         rv3d = bpy.context.region_data
         region = bpy.context.region
@@ -0,0 +1,84 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import weakref
+import itertools
+
+__all__ = ['QMeshJournal', 'JournalCache']
+
+class QMeshJournal :
+    """Change counters of one mesh, shared by every QMesh that edits it."""
+
+    COORD = 'COORD'
+    TOPOLOGY = 'TOPOLOGY'
+    SELECT = 'SELECT'
+    HIDE = 'HIDE'
+    ALL = (COORD, TOPOLOGY, SELECT, HIDE)
+
+    # 作り直したジャーナルでも古い値と被らないように通し番号で数える
+    __serial = itertools.count(1)
+    # メッシュを使っているQMeshが無くなったら消えるように弱参照で持つ
+    __journals = weakref.WeakValueDictionary()
+
+    def __init__(self) :
+        self.__counters = { kind : next(QMeshJournal.__serial) for kind in QMeshJournal.ALL }
+        # update_edit_meshを呼んだ回数. depsgraphの更新が自分の送ったものか見分けるのに使う
+        self.flushes = 0
+
+    @staticmethod
+    def get(mesh) -> 'QMeshJournal' :
+        if mesh is None :
+            return QMeshJournal()
+        key = mesh.as_pointer()
+        journal = QMeshJournal.__journals.get(key)
+        if journal is None :
+            journal = QMeshJournal()
+            QMeshJournal.__journals[key] = journal
+        return journal
+
+    def mark(self, changes = None) :
+        """Record a change. changes is a sequence of kinds, None means everything."""
+        if changes is None :
+            changes = QMeshJournal.ALL
+        for kind in changes :
+            self.__counters[kind] = next(QMeshJournal.__serial)
+
+    def version(self, *kinds) :
+        return tuple(self.__counters[kind] for kind in kinds)
+
+
+class JournalCache :
+    """A cached value rebuilt only when the journal counters it depends on change."""
+
+    def __init__(self, *depends) :
+        self.depends = depends
+        self.value = None
+        self.__version = None
+
+    def get(self, journal : QMeshJournal, build) :
+        version = journal.version(*self.depends)
+        if self.value is None or self.__version != version :
+            self.value = build()
+            self.__version = version
+        return self.value
+
+    def is_valid(self, journal : QMeshJournal) -> bool :
+        return self.value is not None and self.__version == journal.version(*self.depends)
+
+    def acknowledge(self, journal : QMeshJournal) :
+        """Accept the current counters without rebuilding the value."""
+        self.__version = journal.version(*self.depends)
+
+    def clear(self) :
+        self.value = None
+        self.__version = None
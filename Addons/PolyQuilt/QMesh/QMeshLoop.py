@@ -0,0 +1,285 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import numpy as np
+from .QMeshJournal import QMeshJournal, JournalCache
+
+__all__ = ['QMeshLoop', 'QuadRing']
+
+# split_edges (S,)   , split_refs (S,)  : edges a loop cut splits and which of their verts the rate is measured from
+# draw_edges  (D,2)  , draw_refs  (D,2) : entry and exit edge of each quad of the ring and their reference verts
+# end_triangles                         : BMFace -> vertex indices of the triangles closing the ring
+QuadRing = collections.namedtuple('QuadRing', ('split_edges', 'split_refs', 'draw_edges', 'draw_refs', 'end_triangles'))
+
+class QMeshLoop :
+    """Edge loops walked once per topology version.
+
+    A loop is stored as arrays of edge and vertex indices and every edge of
+    the loop points to the same entry, so hovering along a loop walks it
+    only once. Mirror partners are added in one pass over QMirrorMap.
+    Quad rings for loop cuts are cached the same way.
+    """
+
+    # リングを辿る面数の上限
+    max_ring_steps = 4096
+
+    def __init__(self, qmesh) :
+        self.qmesh = qmesh
+        self.__loops = JournalCache(QMeshJournal.TOPOLOGY)
+        # ミラーは頂点の位置で決まるので別に持つ
+        self.__mirror_loops = JournalCache(QMeshJournal.COORD, QMeshJournal.TOPOLOGY)
+        self.__rings = JournalCache(QMeshJournal.TOPOLOGY)
+
+    def clear(self) :
+        self.__loops.clear()
+        self.__mirror_loops.clear()
+        self.__rings.clear()
+
+    def __prepare(self, start) :
+        qmesh = self.qmesh
+        qmesh.ensure_lookup_table()
+        if not self.__is_indexed(start) or len(qmesh.arrays.edge_verts) != len(qmesh.bm.edges) :
+            qmesh.reload_tree()
+            qmesh.bm.verts.index_update()
+            qmesh.bm.edges.index_update()
+            qmesh.bm.faces.index_update()
+
+    def __is_indexed(self, edge) :
+        edges = self.qmesh.bm.edges
+        i = edge.index
+        return 0 <= i < len(edges) and edges[i] == edge
+
+    def edge_loop(self, start, check_func = None) :
+        """Edges and verts of the loop through start as lists of BMesh elements."""
+        qmesh = self.qmesh
+        self.__prepare(start)
+
+        if check_func is not None :
+            # 判定関数があるときは毎回辿る
+            edges, verts = self.walk(start, check_func)
+        else :
+            loops = self.__loops.get(qmesh.journal, dict)
+            loop = loops.get(start.index)
+            if loop is None :
+                loop = self.walk(start)
+                for i in loop[0].tolist() :
+                    loops[i] = loop
+            edges, verts = loop
+
+        if qmesh.is_mirror_mode :
+            if check_func is not None :
+                edges, verts = self.__with_mirror(edges, verts)
+            else :
+                mirror_loops = self.__mirror_loops.get(qmesh.journal, dict)
+                loop = mirror_loops.get(start.index)
+                if loop is None :
+                    loop = self.__with_mirror(edges, verts)
+                    for i in loop[0].tolist() :
+                        mirror_loops[i] = loop
+                edges, verts = loop
+
+        bm = qmesh.bm
+        return [ bm.edges[i] for i in edges.tolist() ], [ bm.verts[i] for i in verts.tolist() ]
+
+    def __with_mirror(self, edges, verts) :
+        mirror_map = self.qmesh.mirror_map
+        me = mirror_map.edges_of(edges)
+        mv = mirror_map.verts[verts]
+        me = me[(me >= 0) & (me != edges)]
+        mv = mv[(mv >= 0) & (mv != verts)]
+        edges = np.concatenate((edges, me[~np.isin(me, edges)]))
+        verts = np.concatenate((verts, mv[~np.isin(mv, verts)]))
+        return edges, verts
+
+    @staticmethod
+    def walk(start, check_func = None) :
+        """Edge and vertex indices of the loop through start.
+
+        The verts are the ones a loop dissolve has to remove: where the
+        loop crosses a quad junction and the corners it ends on.
+        """
+        edges = []
+        verts = []
+        edge_set = set()
+        vert_set = set()
+
+        for vert in start.verts :
+            preEdge = start
+            currentV = vert
+            closed = False
+            while currentV is not None :
+                if preEdge not in edge_set :
+                    edge_set.add(preEdge)
+                    edges.append(preEdge.index)
+
+                link_faces = currentV.link_faces
+                if currentV.is_boundary :
+                    if len(link_faces) == 2 and not any(len(f.verts) == 3 for f in link_faces) :
+                        if currentV not in vert_set :
+                            vert_set.add(currentV)
+                            verts.append(currentV.index)
+                    break
+
+                if len(link_faces) == 4 :
+                    faces = set(link_faces) ^ set(preEdge.link_faces)
+                    if len(faces) != 2 :
+                        break
+                    f0, f1 = faces
+                    share_edges = set(f0.edges) & set(f1.edges) & set(currentV.link_edges)
+                    if len(share_edges) != 1 :
+                        break
+
+                    if check_func and check_func(preEdge, currentV) == False :
+                        break
+
+                    preEdge = share_edges.pop()
+                    if currentV not in vert_set :
+                        vert_set.add(currentV)
+                        verts.append(currentV.index)
+
+                elif len(link_faces) == 2 :
+                    share_edges = [ e for e in currentV.link_edges if e != preEdge ]
+                    if len(share_edges) != 1 :
+                        break
+                    preEdge = share_edges[0]
+                else :
+                    break
+
+                currentV = preEdge.other_vert(currentV)
+                if currentV == vert :
+                    closed = True
+                    break
+                if preEdge in edge_set :
+                    break
+
+            if closed :
+                # 一周したので逆向きに辿る必要はない
+                if preEdge not in edge_set :
+                    edge_set.add(preEdge)
+                    edges.append(preEdge.index)
+                break
+
+        return np.array(edges, dtype = np.int64), np.array(verts, dtype = np.int64)
+
+    def quad_ring(self, start) :
+        """QuadRing through start, measured from start.verts[0], with the mirror ring in mirror mode.
+
+        Also returns whether start lies on the mirror plane.
+        """
+        qmesh = self.qmesh
+        self.__prepare(start)
+        ring = self.__oriented_ring(start, 0)
+        on_center = False
+        if qmesh.is_mirror_mode :
+            mirror_edge = qmesh.find_mirror(start, False)
+            if mirror_edge is not None :
+                if mirror_edge == start :
+                    on_center = True
+                elif not np.any(ring.split_edges == mirror_edge.index) :
+                    # ミラー側の辺の向きは元の辺の0番目の頂点のミラーに合わせる
+                    mirror_vert = qmesh.find_mirror(start.verts[0])
+                    ring = self.__merge(ring, self.__oriented_ring(mirror_edge, 0 if mirror_edge.verts[0] == mirror_vert else 1))
+        return ring, on_center
+
+    def __oriented_ring(self, start, ref) :
+        rings = self.__rings.get(self.qmesh.journal, dict)
+        entry = rings.get(start.index)
+        if entry is None :
+            ring = self.walk_ring(start)
+            if len(start.link_faces) <= 2 :
+                # リング上のどの辺から引いても同じリングを向きだけ変えて使う
+                for e, r in zip(ring.split_edges.tolist(), ring.split_refs.tolist()) :
+                    if e not in rings :
+                        rings[e] = (ring, r)
+            entry = rings.get(start.index, (ring, 0))
+        ring, r = entry
+        if r == ref :
+            return ring
+        return ring._replace(split_refs = 1 - ring.split_refs, draw_refs = 1 - ring.draw_refs)
+
+    @staticmethod
+    def __merge(a, b) :
+        keep = ~np.isin(b.split_edges, a.split_edges)
+        end_triangles = dict(a.end_triangles)
+        for f, tri in b.end_triangles.items() :
+            end_triangles[f] = None if f in end_triangles else tri
+        return QuadRing(
+            np.concatenate((a.split_edges, b.split_edges[keep])),
+            np.concatenate((a.split_refs, b.split_refs[keep])),
+            np.concatenate((a.draw_edges, b.draw_edges)),
+            np.concatenate((a.draw_refs, b.draw_refs)),
+            end_triangles)
+
+    @classmethod
+    def walk_ring(cls, start) :
+        """QuadRing of the quads across start, measured from start.verts[0]."""
+        split_edges = []
+        split_refs = []
+        draw_edges = []
+        draw_refs = []
+        end_triangles = {}
+        checked = set()
+
+        def split(edge, ref) :
+            if edge not in checked :
+                checked.add(edge)
+                split_edges.append(edge.index)
+                split_refs.append(ref)
+
+        link_faces = start.link_faces if len(start.link_faces) <= 2 else ()
+        for startFace in link_faces :
+            vidx = 0
+            face = startFace
+            edge = start
+            closed = False
+            for i in range(cls.max_ring_steps) :
+                if face is None or edge is None :
+                    break
+                split(edge, vidx)
+
+                if len(face.loops) != 4 :
+                    if len(face.loops) == 3 :
+                        if face not in end_triangles :
+                            end_triangles[face] = (edge.verts[0].index, edge.verts[1].index, [ v for v in face.verts if v not in edge.verts ][0].index)
+                        else :
+                            end_triangles[face] = None
+                    break
+
+                loop = [ l for l in face.loops if l.edge == edge ][-1]
+                opposite = loop.link_loop_next.link_loop_next
+                pidx = 1 if (loop.vert == edge.verts[vidx]) == (opposite.edge.verts[0] == opposite.vert) else 0
+                draw_edges.append((loop.edge.index, opposite.edge.index))
+                draw_refs.append((vidx, pidx))
+                vidx = pidx
+
+                if len(opposite.edge.link_faces) == 2 :
+                    face = [ f for f in opposite.edge.link_faces if f != face ][-1]
+                    edge = opposite.edge
+                else :
+                    split(opposite.edge, vidx)
+                    break
+
+                if edge == start :
+                    closed = True
+                    break
+            if closed :
+                # 一周したので反対側の面から辿っても同じ
+                break
+
+        return QuadRing(
+            np.array(split_edges, dtype = np.int64),
+            np.array(split_refs, dtype = np.int64),
+            np.array(draw_edges, dtype = np.int64).reshape((-1, 2)),
+            np.array(draw_refs, dtype = np.int64).reshape((-1, 2)),
+            end_triangles)
@@ -19,6 +19,13 @@ from mathutils import *
 from ..utils import pqutil
 from ..utils import draw_util
 from .ElementItem import *
+from .QMeshArrays import QMeshArrays
+from .QMirrorMap import QMirrorMap
+from .QMeshJournal import QMeshJournal, JournalCache
+from .QTriangleBVH import QTriangleBVH
+from .QMeshPath import QMeshPath
+from .QMeshRelax import QMeshRelax
+from .QMeshLoop import QMeshLoop
 from ..utils.dpi import *
 
 class QMeshOperators :
@@ -26,9 +33,22 @@ class QMeshOperators :
         self.obj = obj
         self.mesh = obj.data
         self.bm = bmesh.from_edit_mesh(self.mesh)
+        self.journal = QMeshJournal.get(self.mesh)
         self.current_matrix = None
-        self.__btree = None
-        self.__kdtree = None
+        self.__btree = JournalCache(QMeshJournal.COORD, QMeshJournal.TOPOLOGY)
+        self.__btree_topology = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__kdtree = JournalCache(QMeshJournal.COORD, QMeshJournal.TOPOLOGY)
+        self.__arrays = None
+        self.__mirror_map = None
+        self.__path = None
+        self.__relax = None
+        self.__loops = None
+        self.mirror_query_count = 0
+        self.__dirty = False
+        self.__dirty_normals = set()
+        self.flush_count = 0
+        # 最後にdepsgraphの更新を受け取ったときのjournal.flushes
+        self.seen_flushes = self.journal.flushes
         self.preferences = preferences
 
     def _CheckValid(self, context):
@@ -58,46 +78,144 @@ class QMeshOperators :
         else:
             self.mesh = None
             self.bm = None
+        self.journal = QMeshJournal.get(self.mesh)
+        self.seen_flushes = self.journal.flushes
         self.current_matrix = None
         self.reload_tree()
 
     def reload_tree( self ) :
-        if self.__btree :
-            del self.__btree
-            self.__btree = None
-        if self.__kdtree :
-            del self.__kdtree
-            self.__kdtree = None
+        self.__btree.clear()
+        self.__btree_topology.clear()
+        self.__kdtree.clear()
+        self.__arrays = None
+        if self.__mirror_map :
+            self.__mirror_map.clear()
+        if self.__path :
+            self.__path.clear()
+        if self.__relax :
+            self.__relax.clear()
+        if self.__loops :
+            self.__loops.clear()
+
+
+    def UpdateMesh( self , changes = None , verts = None ) :
+        # changes : 変更の種類(QMeshJournal.COORDなど) Noneなら全て
+        # verts : 動いた頂点. トポロジが変わっていなければその周りの法線だけ計算し直す
+        QMeshOperators.MarkDirty( self , changes , verts )
+        self.FlushUpdate()
+
+    def MarkDirty( self , changes = None , verts = None ) :
+        # 編集を記録するだけでビューへの反映はFlushUpdateまで遅らせる
+        self.ScheduleUpdate( changes , verts )
+        self.journal.mark( changes )
+        self.current_matrix = None
 
+    def ScheduleUpdate( self , changes = None , verts = None ) :
+        """MarkDirty for changes already recorded in the journal (e.g. by arrays.write_co)."""
+        topology = changes is None or QMeshJournal.TOPOLOGY in changes
+        if topology :
+            self.ensure_lookup_table()
+        if topology or ( QMeshJournal.COORD in changes and verts is None ) :
+            self.__dirty_normals = True
+        elif QMeshJournal.COORD in changes and self.__dirty_normals is not True :
+            self.__dirty_normals.update( verts )
+        self.__dirty = True
 
-    def UpdateMesh( self ) :
-        self.ensure_lookup_table()
-        self.bm.normal_update()
+    @property
+    def is_dirty( self ) -> bool :
+        return self.__dirty
+
+    def FlushUpdate( self ) :
+        # 溜まった法線の計算とビューへの反映をまとめて一度だけ行う
+        if not self.__dirty :
+            return False
+        if self.__dirty_normals is True :
+            self.bm.normal_update()
+        elif self.__dirty_normals :
+            self.partial_normal_update( self.__dirty_normals )
+        self.__dirty_normals = set()
+        self.__dirty = False
 
         self.obj.data.update_gpu_tag()
         self.obj.data.update_tag()
         self.obj.update_tag()
+        self.journal.flushes += 1
         bmesh.update_edit_mesh(self.obj.data)
 #       self.obj.update_from_editmode()
-        self.__btree = None
-        self.__kdtree = None
-        self.current_matrix = None
+        self.flush_count += 1
+        return True
+
+    @staticmethod
+    def partial_normal_update( verts ) :
+        # 動いた頂点を含む面と,その面の頂点の法線
+        faces = { f for v in verts for f in v.link_faces }
+        for f in faces :
+            f.normal_update()
+        for v in { v for f in faces for v in f.verts }.union( verts ) :
+            v.normal_update()
 
     @property
-    def btree(self):
-        if self.__btree == None :
-            self.__btree = bvhtree.BVHTree.FromBMesh(self.bm)
-        return self.__btree
+    def btree(self) -> QTriangleBVH :
+        # 頂点が動いただけなら木はそのままでバウンディングだけ合わせる
+        def build() :
+            refit = self.__btree_topology.is_valid(self.journal)
+            tree = self.__btree_topology.get(self.journal, lambda : QTriangleBVH.FromBMesh(self.bm, self.arrays.co))
+            if refit :
+                tree.refit(self.arrays.co)
+            return tree
+        return self.__btree.get(self.journal, build)
+
+    @property
+    def triangles(self) -> QTriangleBVH :
+        """btree for its tris and tri_face only, without refitting the bounds after vertex moves."""
+        if self.__btree.is_valid(self.journal) :
+            return self.__btree.value
+        return self.__btree_topology.get(self.journal, lambda : QTriangleBVH.FromBMesh(self.bm, self.arrays.co))
 
     @property
     def kdtree(self):
-        if self.__kdtree == None :
+        def build() :
             size = len(self.bm.verts)
-            self.__kdtree = mathutils.kdtree.KDTree(size)
+            kdtree = mathutils.kdtree.KDTree(size)
             for i, v in enumerate(self.bm.verts):
-                self.__kdtree.insert(v.co, i)
-            self.__kdtree.balance()
-        return self.__kdtree
+                kdtree.insert(v.co, i)
+            kdtree.balance()
+            return kdtree
+        return self.__kdtree.get(self.journal, build)
+
+    @property
+    def arrays(self) -> QMeshArrays :
+        if self.__arrays == None :
+            self.__arrays = QMeshArrays(self.bm, self.journal)
+        return self.__arrays
+
+    @property
+    def path(self) -> QMeshPath :
+        if self.__path == None :
+            self.__path = QMeshPath(self)
+        return self.__path
+
+    @property
+    def relax(self) -> QMeshRelax :
+        if self.__relax == None :
+            self.__relax = QMeshRelax(self)
+        return self.__relax
+
+    @property
+    def loops(self) -> QMeshLoop :
+        if self.__loops == None :
+            self.__loops = QMeshLoop(self)
+        return self.__loops
+
+    @property
+    def mirror_map(self) -> QMirrorMap :
+        threshold = bpy.context.scene.tool_settings.double_threshold
+        if self.__mirror_map == None :
+            self.__mirror_map = QMirrorMap(self, threshold)
+        elif self.__mirror_map.threshold != threshold :
+            self.__mirror_map.clear()
+            self.__mirror_map.threshold = threshold
+        return self.__mirror_map
 
     @property
     def verts(self): 
@@ -436,46 +554,30 @@ class QMeshOperators :
 
 
     def find_mirror( self , geom , check_same = True ) :
+        self.mirror_query_count += 1
+        return self.mirror_map.find( geom , check_same )
+
+    def find_mirror_vert_kdtree( self , geom ) :
         result = None
         dist = bpy.context.scene.tool_settings.double_threshold
+        co = self.mirror_pos( geom.co )
 
-        if isinstance( geom , bmesh.types.BMVert ) :
-            co = self.mirror_pos( geom.co )
-
-            hits = self.kdtree.find_range(co, dist )
-
-            if hits != None :
-                if len(hits) == 1 :
-                    result = self.bm.verts[hits[0][1]] 
-                elif len(hits) > 0 :
-                    hits = sorted( hits , key=lambda x:x[2])
-                    result = self.bm.verts[ hits[0][1] ] 
-                    for h in hits :
-                        hitV = self.bm.verts[h[1]]
-                        for edge in geom.link_edges :
-                            if not any( [ self.test_mirror_geom(edge,e) for e in hitV.link_edges ]):
-                                break
-                        else :
-                            result = hitV
-                            break
-        elif isinstance( geom , bmesh.types.BMFace ) or isinstance( geom , bmesh.types.BMEdge ):
-            mirror_cos = [ self.mirror_pos( v.co ) for v in geom.verts ]
-
-            hits = self.kdtree.find_range(mirror_cos[0], dist )
-            if hits != None :
-                for hit in hits :
-                    hitvert = self.bm.verts[hit[1]]                    
-                    links = hitvert.link_edges if isinstance( geom , bmesh.types.BMEdge ) else hitvert.link_faces
-                    for link in links :
-                        if self.test_mirror_geom( link , geom ) :
-                            result = link
+        hits = self.kdtree.find_range(co, dist )
+
+        if hits != None :
+            if len(hits) == 1 :
+                result = self.bm.verts[hits[0][1]] 
+            elif len(hits) > 0 :
+                hits = sorted( hits , key=lambda x:x[2])
+                result = self.bm.verts[ hits[0][1] ] 
+                for h in hits :
+                    hitV = self.bm.verts[h[1]]
+                    for edge in geom.link_edges :
+                        if not any( [ self.test_mirror_geom(edge,e) for e in hitV.link_edges ]):
                             break
                     else :
-                        continue
-                    break
-
-        if check_same and result is not None and result.index == geom.index :
-            return None
+                        result = hitV
+                        break
 
         return result
 
@@ -527,64 +629,9 @@ class QMeshOperators :
         return edges , verts
 
     def calc_edge_loop( self , startEdge , check_func = None ) :
-        edges = []
-        verts = []
-
         if not isinstance( startEdge , bmesh.types.BMEdge ) :
-            return edges , verts
-
-        def append( lst , geom ) :
-            if geom not in lst :
-                lst.append(geom)
-                if self.is_mirror_mode :
-                    mirror =self.find_mirror( geom )
-                    if mirror :
-                        lst.append( mirror )
-
-        for vert in startEdge.verts :
-            preEdge = startEdge
-            currentV = vert
-            while currentV != None :
-                append(edges , preEdge)
-
-                if currentV.is_boundary :
-                    if len( currentV.link_faces )== 2 :
-                        if not any( [ len(f.verts) == 3 for f in currentV.link_faces ] ):
-                            if currentV not in verts :
-                                append(verts , currentV)
-                    break
-
-                if len(currentV.link_faces) == 4 :
-                    faces = set(currentV.link_faces ) ^ set(preEdge.link_faces )
-                    if len( faces ) != 2 :
-                        break
-                    faces = list(faces)
-                    share_edges = set(faces[0].edges) & set(faces[1].edges) & set(currentV.link_edges )
-                    if len(share_edges) != 1 :
-                        break
-
-                    if check_func :
-                        if check_func( preEdge , currentV ) == False :
-                            break
-
-                    preEdge = list(share_edges)[0]
-
-                    if currentV not in verts :
-                        append(verts , currentV)
-
-                elif len(currentV.link_faces) == 2 :
-                    share_edges = [ e for e in currentV.link_edges if e != preEdge ]
-                    if len(share_edges) != 1 :
-                        break
-                    preEdge = share_edges[0]
-                else :
-                    break
-
-
-                currentV = preEdge.other_vert(currentV)
-                if currentV == vert:
-                    break
-        return edges , verts
+            return [] , []
+        return self.loops.edge_loop( startEdge , check_func )
 
     def do_edge_loop_cut( self , edges , verts ) :
         bmesh.ops.dissolve_edges( self.bm , edges = edges , use_verts = False , use_face_split = False )  
@@ -622,9 +669,7 @@ class QMeshOperators :
         return loops
 
 
-    def calc_shortest_pass( self , bm , start , end ) :
-        from .QMesh import SelectStack
-
+    def calc_shortest_pass( self , bm , start , end , topology_distance = False ) :
         if isinstance( start , bmesh.types.BMFace ):
             for edge in start.edges :
                 if end in edge.link_faces :
@@ -642,33 +687,14 @@ class QMeshOperators :
             if s == e :
                 return [s]
 
-            if isinstance( e , bmesh.types.BMVert ) and isinstance( s , bmesh.types.BMVert ) :
-                for le in s.link_edges :
-                    if le.other_vert( s ) == e :
-                        return [le]
-
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bm.select_history = []
-            s.select = True
-            e.select = True
-            bpy.context.tool_settings.mesh_select_mode = ( isinstance( s , bmesh.types.BMVert ) , isinstance( s , bmesh.types.BMEdge ) , isinstance( s , bmesh.types.BMFace ) )
-            bpy.ops.mesh.shortest_path_select( edge_mode = 'SELECT' , use_face_step = False , use_topology_distance = False , use_fill = False )
-
-            ss = []
-            if isinstance( s , bmesh.types.BMFace ) :
-                ss = [ f for f in bm.faces if f.select ]
-            elif isinstance( s , bmesh.types.BMEdge ) :
-                ss = [ f for f in bm.edges if f.select ]
-            elif isinstance( s , bmesh.types.BMVert ) :
-                ss = [ f for f in bm.edges if f.select ]
-                if not ss :
-                    ss = [ f for f in bm.verts if f.select ]
-
-            bpy.ops.mesh.select_all(action='DESELECT')
-
-            return ss
-
-        select = SelectStack(bpy.context, bm)
+            path = self.path.find( s , e , topology_distance )
+            if path is None :
+                # 繋がっていなければ両端だけ
+                return [s, e]
+            nodes , links = path
+            if isinstance( s , bmesh.types.BMVert ) :
+                return links
+            return nodes
 
         if isinstance( start , bmesh.types.BMVert ) and isinstance( end , bmesh.types.BMEdge ) :
             c0 = calc( start , end.verts[0] )
@@ -689,5 +715,4 @@ class QMeshOperators :
         else :
             collect = calc(start, end)
 
-        select.pop()
         return (collect, [])
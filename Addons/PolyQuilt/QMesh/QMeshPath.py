@@ -0,0 +1,268 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import heapq
+import itertools
+import bmesh
+import numpy as np
+from .QMeshJournal import QMeshJournal, JournalCache
+
+__all__ = ['QMeshPath']
+
+# indptr, indices, links : CSR of the neighbours of each node and the element linking them
+# *_list                 : the same as Python lists for the search loop
+PathGraph = collections.namedtuple('PathGraph', ('indptr', 'indices', 'links', 'indptr_list', 'indices_list', 'links_list'))
+
+def _shared_csr(group, member, count) :
+    """CSR over count members, neighbours being the other members of the same group."""
+    order = np.argsort(group, kind = 'stable')
+    g = group[order]
+    m = member[order]
+    if len(g) == 0 :
+        empty = np.zeros(0, dtype = np.int64)
+        return np.zeros(count + 1, dtype = np.int64), empty, empty
+
+    starts = np.flatnonzero(np.concatenate(((True,), g[1:] != g[:-1])))
+    sizes = np.diff(np.append(starts, len(g)))
+    run = np.repeat(np.arange(len(starts)), sizes)
+    reps = sizes[run]
+    src = np.repeat(np.arange(len(g)), reps)
+    dst = starts[run[src]] + np.arange(int(reps.sum())) - np.repeat(np.cumsum(reps) - reps, reps)
+    keep = src != dst
+    a = m[src[keep]]
+    b = m[dst[keep]]
+    link = g[src[keep]]
+
+    order = np.argsort(a, kind = 'stable')
+    indptr = np.zeros(count + 1, dtype = np.int64)
+    np.cumsum(np.bincount(a, minlength = count), out = indptr[1:])
+    return indptr, b[order].astype(np.int64), link[order].astype(np.int64)
+
+
+class _Search :
+    """Open Dijkstra search from one node. Settled nodes keep their parents."""
+
+    def __init__(self, start) :
+        self.dist = { start : 0.0 }
+        self.prev = { start : (-1, -1) }
+        self.done = set()
+        self.heap = [(0.0, start)]
+
+
+class QMeshPath :
+    """Shortest paths between verts, edges or faces without the selection operators.
+
+    Verts are linked by edges, edges by shared verts and faces by shared
+    edges. The adjacency is CSR and only rebuilt on topology changes. Costs
+    are the distance between vert positions, edge midpoints or face centers,
+    or one per step in topology distance mode. Searches stay open, so a drag
+    that keeps its start only expands the frontier up to the new end.
+    """
+
+    VERT = 'VERT'
+    EDGE = 'EDGE'
+    FACE = 'FACE'
+
+    # 同時に保持する探索の数(辺と頂点の組み合わせでは始点が2つになる)
+    max_searches = 4
+
+    def __init__(self, qmesh) :
+        self.qmesh = qmesh
+        self.__graphs = { kind : JournalCache(QMeshJournal.TOPOLOGY) for kind in (QMeshPath.VERT, QMeshPath.EDGE, QMeshPath.FACE) }
+        self.__face_verts = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__weights = {}
+        self.__searches = collections.OrderedDict()
+
+    def clear(self) :
+        for cache in self.__graphs.values() :
+            cache.clear()
+        self.__face_verts.clear()
+        self.__weights = {}
+        self.__searches.clear()
+
+    @staticmethod
+    def kind_of(element) :
+        if isinstance(element, bmesh.types.BMVert) :
+            return QMeshPath.VERT
+        if isinstance(element, bmesh.types.BMEdge) :
+            return QMeshPath.EDGE
+        if isinstance(element, bmesh.types.BMFace) :
+            return QMeshPath.FACE
+        return None
+
+    def __sequence(self, kind) :
+        bm = self.qmesh.bm
+        return { QMeshPath.VERT : bm.verts, QMeshPath.EDGE : bm.edges, QMeshPath.FACE : bm.faces }[kind]
+
+    def graph(self, kind) -> PathGraph :
+        def build() :
+            arrays = self.qmesh.arrays
+            ev = arrays.edge_verts.astype(np.int64)
+            edge_index = np.repeat(np.arange(len(ev)), 2)
+            if kind == QMeshPath.VERT :
+                csr = _shared_csr(edge_index, ev.ravel(), len(arrays.co))
+            elif kind == QMeshPath.EDGE :
+                csr = _shared_csr(ev.ravel(), edge_index, len(ev))
+            else :
+                fe = self.__face_edges()
+                csr = _shared_csr(fe[:, 1], fe[:, 0], len(self.qmesh.bm.faces))
+            return PathGraph(*csr, *(a.tolist() for a in csr))
+        return self.__graphs[kind].get(self.qmesh.journal, build)
+
+    def __face_edges(self) :
+        bm = self.qmesh.bm
+        bm.faces.index_update()
+        count = sum(len(f.edges) for f in bm.faces)
+        fe = np.fromiter(itertools.chain.from_iterable((f.index, e.index) for f in bm.faces for e in f.edges), dtype = np.int64, count = count * 2)
+        return fe.reshape((count, 2))
+
+    def __face_centers(self) :
+        def build() :
+            bm = self.qmesh.bm
+            bm.faces.index_update()
+            counts = np.fromiter((len(f.verts) for f in bm.faces), dtype = np.int64, count = len(bm.faces))
+            indices = np.fromiter((v.index for f in bm.faces for v in f.verts), dtype = np.int64, count = int(counts.sum()))
+            return counts, indices
+        counts, indices = self.__face_verts.get(self.qmesh.journal, build)
+        if len(counts) == 0 :
+            return np.zeros((0, 3))
+        co = self.qmesh.arrays.co.astype(np.float64)
+        starts = np.cumsum(counts) - counts
+        return np.add.reduceat(co[indices], starts, axis = 0) / counts[:, None]
+
+    def __points(self, kind) :
+        arrays = self.qmesh.arrays
+        if kind == QMeshPath.VERT :
+            return arrays.co.astype(np.float64)
+        if kind == QMeshPath.EDGE :
+            co = arrays.co.astype(np.float64)
+            ev = arrays.edge_verts
+            return (co[ev[:, 0]] + co[ev[:, 1]]) * 0.5
+        return self.__face_centers()
+
+    def weights(self, kind, topology_distance = False) :
+        """Cost of each CSR entry of graph(kind), inf where the step crosses hidden geometry."""
+        key = (kind, topology_distance)
+        cache = self.__weights.get(key)
+        if cache is None :
+            if topology_distance :
+                cache = JournalCache(QMeshJournal.TOPOLOGY, QMeshJournal.HIDE)
+            else :
+                cache = JournalCache(QMeshJournal.COORD, QMeshJournal.TOPOLOGY, QMeshJournal.HIDE)
+            self.__weights[key] = cache
+
+        def build() :
+            graph = self.graph(kind)
+            arrays = self.qmesh.arrays
+            src = np.repeat(np.arange(len(graph.indptr) - 1), np.diff(graph.indptr))
+            if topology_distance :
+                w = np.ones(len(graph.indices))
+            else :
+                points = self.__points(kind)
+                d = points[graph.indices] - points[src]
+                w = np.sqrt((d * d).sum(axis = 1))
+
+            # 隠れた要素を通る一歩は通れない
+            if kind == QMeshPath.VERT :
+                blocked = arrays.vert_hide[graph.indices] | arrays.edge_hide[graph.links]
+            elif kind == QMeshPath.EDGE :
+                blocked = arrays.edge_hide[graph.indices] | arrays.vert_hide[graph.links]
+            else :
+                blocked = arrays.face_hide[graph.indices] | arrays.edge_hide[graph.links]
+            w[blocked] = np.inf
+            return w.tolist()
+        return cache.get(self.qmesh.journal, build)
+
+    def __is_indexed(self, element, kind) :
+        seq = self.__sequence(kind)
+        i = element.index
+        return 0 <= i < len(seq) and seq[i] == element
+
+    def find(self, start, end, topology_distance = False) :
+        """Path from start to end as (nodes, links) of BMesh elements, None when unreachable."""
+        kind = QMeshPath.kind_of(start)
+        if kind is None or kind != QMeshPath.kind_of(end) :
+            return None
+        qmesh = self.qmesh
+        qmesh.ensure_lookup_table()
+
+        # インデックスが振り直されていなければ作り直す
+        graph = self.graph(kind)
+        if len(graph.indptr) - 1 != len(self.__sequence(kind)) or not self.__is_indexed(start, kind) or not self.__is_indexed(end, kind) :
+            qmesh.reload_tree()
+            graph = self.graph(kind)
+        weights = self.weights(kind, topology_distance)
+
+        journal = qmesh.journal
+        key = (kind, start.index, topology_distance, journal.version(QMeshJournal.COORD, QMeshJournal.TOPOLOGY, QMeshJournal.HIDE))
+        search = self.__searches.pop(key, None)
+        if search is None :
+            search = _Search(start.index)
+            while len(self.__searches) >= self.max_searches :
+                self.__searches.popitem(last = False)
+        self.__searches[key] = search
+
+        target = end.index
+        if not self.__advance(search, graph, weights, target) :
+            return None
+
+        nodes = []
+        links = []
+        node = target
+        while node >= 0 :
+            nodes.append(node)
+            node, link = search.prev[node]
+            if link >= 0 :
+                links.append(link)
+        nodes.reverse()
+        links.reverse()
+
+        seq = self.__sequence(kind)
+        link_seq = self.__sequence(QMeshPath.VERT if kind == QMeshPath.EDGE else QMeshPath.EDGE)
+        return [ seq[i] for i in nodes ], [ link_seq[i] for i in links ]
+
+    @staticmethod
+    def __advance(search, graph, weights, target) :
+        done = search.done
+        if target in done :
+            return True
+        dist = search.dist
+        prev = search.prev
+        heap = search.heap
+        indptr = graph.indptr_list
+        indices = graph.indices_list
+        links = graph.links_list
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+        inf = float('inf')
+
+        while heap :
+            d, node = heappop(heap)
+            if node in done :
+                continue
+            done.add(node)
+            for k in range(indptr[node], indptr[node + 1]) :
+                w = weights[k]
+                if w == inf :
+                    continue
+                nb = indices[k]
+                nd = d + w
+                if nd < dist.get(nb, inf) :
+                    dist[nb] = nd
+                    prev[nb] = (node, links[k])
+                    heappush(heap, (nd, nb))
+            if node == target :
+                # 残りのフロンティアは次の問い合わせで続きから探す
+                return True
+        return False
@@ -0,0 +1,145 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from .QMeshJournal import QMeshJournal, JournalCache
+from .QMeshPath import QMeshPath
+
+__all__ = ['QMeshRelax']
+
+class QMeshRelax :
+    """Laplacian relax of a set of vertices on the vertex CSR of QMeshPath.
+
+    Works like the relax brush did with bmesh.ops.smooth_vert: boundary
+    verts move to the average of their boundary neighbours, the others to
+    the average of all neighbours, and the result is blended by a per
+    vertex falloff. Everything is computed from the positions before the
+    step, except that interior verts see the moved boundary.
+    """
+
+    def __init__(self, qmesh) :
+        self.qmesh = qmesh
+        # 辺のフラグ(境界,スムーズ)と頂点の面数
+        self.__edge_flags = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__vert_faces = JournalCache(QMeshJournal.TOPOLOGY)
+
+    def clear(self) :
+        self.__edge_flags.clear()
+        self.__vert_faces.clear()
+
+    @property
+    def edge_boundary(self) -> np.ndarray :
+        return self.__flags()[0]
+
+    @property
+    def edge_smooth(self) -> np.ndarray :
+        return self.__flags()[1]
+
+    def __flags(self) :
+        def build() :
+            edges = self.qmesh.bm.edges
+            n = len(edges)
+            boundary = np.fromiter((e.is_boundary for e in edges), dtype = bool, count = n)
+            smooth = np.fromiter((e.smooth for e in edges), dtype = bool, count = n)
+            return boundary, smooth
+        return self.__edge_flags.get(self.qmesh.journal, build)
+
+    @property
+    def vert_face_count(self) -> np.ndarray :
+        def build() :
+            verts = self.qmesh.bm.verts
+            return np.fromiter((len(v.link_faces) for v in verts), dtype = np.int64, count = len(verts))
+        return self.__vert_faces.get(self.qmesh.journal, build)
+
+    def __rows(self, indices) :
+        # indicesの各行のCSRエントリと,それがどの行のものか
+        graph = self.qmesh.path.graph(QMeshPath.VERT)
+        start = graph.indptr[indices]
+        count = graph.indptr[indices + 1] - start
+        row = np.repeat(np.arange(len(indices)), count)
+        entry = np.repeat(start - (np.cumsum(count) - count), count) + np.arange(int(count.sum()))
+        return graph, row, entry, count
+
+    def fixed_mask(self, indices, path_end = False, sharp = False, boundary = False) -> np.ndarray :
+        """Verts that the brush must leave alone: ends of paths, on sharp edges or on boundary edges."""
+        indices = np.asarray(indices, dtype = np.int64)
+        graph, row, entry, count = self.__rows(indices)
+        fixed = np.zeros(len(indices), dtype = bool)
+        if path_end :
+            fixed |= count == 1
+        if sharp or boundary :
+            bad = np.zeros(len(entry), dtype = bool)
+            links = graph.links[entry]
+            if sharp :
+                bad |= ~self.edge_smooth[links]
+            if boundary :
+                bad |= self.edge_boundary[links]
+            fixed |= np.bincount(row[bad], minlength = len(indices)) > 0
+        return fixed
+
+    def relax(self, indices, co, strength, effective_boundary, clip_x = False, clip_dist = 0.0001) -> np.ndarray :
+        """Relaxed positions (K,3) of the verts indices (K,) given every position co (N,3)."""
+        indices = np.asarray(indices, dtype = np.int64)
+        graph, row, entry, count = self.__rows(indices)
+        k = len(indices)
+        # 全体を写すとサンプルごとにO(N)になるので,使う頂点と隣だけを取り出す
+        ids, local = np.unique(np.concatenate((indices, graph.indices[entry])), return_inverse = True)
+        co = co[ids].astype(np.float64)
+        own = local[:k]
+        nb = local[k:]
+        result = co[own]
+
+        vert_boundary = self.edge_boundary[graph.links[entry]]
+        is_boundary = np.bincount(row[vert_boundary], minlength = k) > 0
+
+        def average(mask) :
+            n = np.bincount(row[mask], minlength = k)
+            s = np.stack([ np.bincount(row[mask], weights = co[nb[mask], axis], minlength = k) for axis in range(3) ], axis = 1)
+            return s / np.maximum(n, 1)[:, None], n
+
+        if effective_boundary :
+            # 境界の頂点は境界辺の隣だけの平均に置く(角は動かさない)
+            avg, n = average(vert_boundary)
+            move = is_boundary & (self.vert_face_count[indices] != 1) & (n > 0)
+            result[move] = avg[move]
+            co[own[move]] = avg[move]
+
+        # 内側の頂点は全ての隣の平均へstrengthだけ寄せる
+        inner = ~is_boundary & (count > 0)
+        avg, n = average(np.ones(len(entry), dtype = bool))
+        smoothed = result + (avg - result) * strength
+        if clip_x :
+            smoothed[np.abs(result[:, 0]) <= clip_dist, 0] = 0.0
+        result[inner] = smoothed[inner]
+        return result
+
+    def mirror_targets(self, indices, weights) :
+        """Rows of indices and the vertex indices that take their x mirror.
+
+        A vert mirrors onto its partner unless the partner is also relaxed
+        with a larger weight, in which case the partner wins.
+        """
+        indices = np.asarray(indices, dtype = np.int64)
+        weights = np.asarray(weights, dtype = np.float64)
+        mirror = self.qmesh.mirror_map.verts[indices]
+        has = (mirror >= 0) & (mirror != indices)
+
+        position = np.full(len(self.qmesh.mirror_map.verts), -1, dtype = np.int64)
+        position[indices] = np.arange(len(indices))
+        partner = np.where(has, position[np.maximum(mirror, 0)], -1)
+        partner_weight = np.where(partner >= 0, weights[np.maximum(partner, 0)], -np.inf)
+        wins = has & (weights >= partner_weight)
+        # 同じ重みなら先に来た方を使う
+        tie = wins & (partner >= 0) & (weights == partner_weight) & (partner < np.arange(len(indices)))
+        wins &= ~tie
+        return np.flatnonzero(wins), mirror[wins]
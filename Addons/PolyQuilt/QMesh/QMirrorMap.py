@@ -0,0 +1,186 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import bmesh
+import numpy as np
+from .QMeshJournal import QMeshJournal, JournalCache
+
+__all__ = ['QMirrorMap']
+
+class QMirrorMap :
+    """X-mirror partners of every vert, edge and face, resolved in one pass."""
+
+    # 1軸あたりのセル数の上限(キーをint64に収めるため)
+    max_cells = 1 << 20
+
+    def __init__(self, qmesh, threshold) :
+        self.qmesh = qmesh
+        self.threshold = threshold
+        self.__verts = JournalCache(QMeshJournal.COORD, QMeshJournal.TOPOLOGY)
+        self.__edges = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__faces = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__edge_keys = JournalCache(QMeshJournal.TOPOLOGY)
+        self.__counts = None
+
+    @property
+    def verts(self) :
+        """Mirror vertex index for each vertex, -1 when there is none."""
+        return self.__verts.get(self.qmesh.journal, self.__build_verts)
+
+    def __build_verts(self) :
+        qmesh = self.qmesh
+        bm = qmesh.bm
+        qmesh.ensure_lookup_table()
+        bm.verts.index_update()
+        self.__counts = (len(bm.verts), len(bm.edges), len(bm.faces))
+        if len(qmesh.arrays.co) != len(bm.verts) :
+            qmesh.arrays.clear()
+
+        co = qmesh.arrays.co.astype(np.float64)
+        n = len(co)
+        result = np.full(n, -1, dtype = np.int64)
+        if n == 0 :
+            return result
+
+        dist = self.threshold
+        mco = co * np.array((-1.0, 1.0, 1.0))
+
+        # 距離dist以内の点は隣接セルまでに必ず入る大きさでセルを切る
+        lo = np.minimum(co.min(axis = 0), mco.min(axis = 0))
+        hi = np.maximum(co.max(axis = 0), mco.max(axis = 0))
+        cell = max(dist, float((hi - lo).max()) / self.max_cells, 1e-12)
+        q = np.floor((co - lo) / cell).astype(np.int64)
+        mq = np.floor((mco - lo) / cell).astype(np.int64)
+        size = q.max(axis = 0)
+        size = np.maximum(size, mq.max(axis = 0)) + 1
+
+        def encode(c) :
+            return (c[:, 0] * size[1] + c[:, 1]) * size[2] + c[:, 2]
+
+        keys = encode(q)
+        order = np.argsort(keys, kind = 'stable')
+        sorted_keys = keys[order]
+
+        hits = np.zeros(n, dtype = np.int64)
+        ambiguous = np.zeros(n, dtype = bool)
+        for offset in itertools.product((-1, 0, 1), repeat = 3) :
+            c = mq + np.array(offset)
+            inside = np.all((c >= 0) & (c < size), axis = 1)
+            k = np.where(inside, encode(c), -1)
+            first = np.searchsorted(sorted_keys, k, side = 'left')
+            last = np.searchsorted(sorted_keys, k, side = 'right')
+            count = np.where(inside, last - first, 0)
+
+            # 同じセルに複数の点がある場合は個別に判定する
+            ambiguous |= count > 1
+            single = np.flatnonzero(count == 1)
+            other = order[first[single]]
+            near = ((co[other] - mco[single]) ** 2).sum(axis = 1) <= dist * dist
+            result[single[near]] = other[near]
+            hits[single[near]] += 1
+
+        ambiguous |= hits > 1
+        result[ambiguous] = -1
+        verts = bm.verts
+        find = self.qmesh.find_mirror_vert_kdtree
+        for i in np.flatnonzero(ambiguous).tolist() :
+            mirror = find(verts[i])
+            result[i] = mirror.index if mirror is not None else -1
+
+        return result
+
+    def __build_edges(self) :
+        ev = self.qmesh.arrays.edge_verts
+        a = np.minimum(ev[:, 0], ev[:, 1]).tolist()
+        b = np.maximum(ev[:, 0], ev[:, 1]).tolist()
+        return { key : i for i, key in enumerate(zip(a, b)) }
+
+    def __build_edge_keys(self) :
+        # 両端の頂点から作ったキーを並べておき二分探索で辺を引く
+        ev = self.qmesh.arrays.edge_verts.astype(np.int64)
+        n = len(self.qmesh.bm.verts)
+        keys = np.minimum(ev[:, 0], ev[:, 1]) * n + np.maximum(ev[:, 0], ev[:, 1])
+        order = np.argsort(keys, kind = 'stable')
+        return keys[order], order
+
+    def edges_of(self, indices) :
+        """Mirror edge index for each of the edges indices, -1 when there is none."""
+        indices = np.asarray(indices, dtype = np.int64)
+        verts = self.verts
+        sorted_keys, order = self.__edge_keys.get(self.qmesh.journal, self.__build_edge_keys)
+        if len(indices) == 0 or len(sorted_keys) == 0 :
+            return np.full(len(indices), -1, dtype = np.int64)
+
+        mv = verts[self.qmesh.arrays.edge_verts[indices].astype(np.int64)]
+        keys = np.minimum(mv[:, 0], mv[:, 1]) * len(verts) + np.maximum(mv[:, 0], mv[:, 1])
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        hit = (mv >= 0).all(axis = 1) & (sorted_keys[pos] == keys)
+        return np.where(hit, order[pos], -1)
+
+    def __build_faces(self) :
+        self.qmesh.bm.faces.index_update()
+        return { tuple(sorted(v.index for v in f.verts)) : f.index for f in self.qmesh.bm.faces }
+
+    def is_valid(self) :
+        bm = self.qmesh.bm
+        return self.__counts == (len(bm.verts), len(bm.edges), len(bm.faces))
+
+    def clear(self) :
+        self.__verts.clear()
+        self.__edges.clear()
+        self.__faces.clear()
+        self.__edge_keys.clear()
+        self.__counts = None
+
+    def find(self, geom, check_same = True) :
+        qmesh = self.qmesh
+        bm = qmesh.bm
+        qmesh.ensure_lookup_table()
+
+        if isinstance(geom, bmesh.types.BMVert) :
+            geom_verts = (geom,)
+        elif isinstance(geom, bmesh.types.BMEdge) or isinstance(geom, bmesh.types.BMFace) :
+            geom_verts = geom.verts
+        else :
+            return None
+
+        # トポロジが変わっているか作成直後でインデックスが振られていない要素があれば作り直す
+        bm_verts = bm.verts
+        if self.__verts.is_valid(qmesh.journal) :
+            if not self.is_valid() or not all(0 <= v.index < len(bm_verts) and bm_verts[v.index] == v for v in geom_verts) :
+                qmesh.reload_tree()
+        verts = self.verts
+
+        key = []
+        for v in geom_verts :
+            i = v.index
+            if i < 0 or i >= len(verts) :
+                return None
+            m = int(verts[i])
+            if m < 0 :
+                return None
+            key.append(m)
+
+        if isinstance(geom, bmesh.types.BMVert) :
+            result = bm_verts[key[0]]
+        elif isinstance(geom, bmesh.types.BMEdge) :
+            m = self.__edges.get(qmesh.journal, self.__build_edges).get(tuple(sorted(key)))
+            result = bm.edges[m] if m is not None else None
+        else :
+            m = self.__faces.get(qmesh.journal, self.__build_faces).get(tuple(sorted(key)))
+            result = bm.faces[m] if m is not None else None
+
+        if check_same and result is not None and result == geom :
+            return None
+        return result
@@ -0,0 +1,152 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import numpy as np
+
+__all__ = ['QScreenGrid']
+
+class QScreenGrid :
+    """Uniform grid over the projected vertices and edge segments of a ViewProjection."""
+
+    # これより多くのセルにまたがるエッジはセルに登録せず常に判定する
+    max_edge_cells = 64
+    # 動いた頂点がこれ(か頂点数のmoved_ratio)より多くなったら作り直す
+    max_moved_verts = 4096
+    moved_ratio = 1.0 / 16.0
+
+    def __init__(self, projection, width, height, cell_size = None) :
+        self.projection = projection
+        valid_verts = np.flatnonzero(projection.valid_verts)
+        self.__moved_limit = max(self.max_moved_verts, int(len(valid_verts) * self.moved_ratio))
+        if cell_size is None :
+            # 1セルあたり数頂点になるくらいの大きさ
+            cell_size = math.sqrt(width * height * 4.0 / max(len(valid_verts), 1))
+            cell_size = min(max(cell_size, 8.0), 64.0)
+        self.cell_size = cell_size
+        self.grid_w = int(width // cell_size) + 1
+        self.grid_h = int(height // cell_size) + 1
+
+        cells = self.__cells(projection.verts[valid_verts])
+        self.__vert_keys, self.__vert_items = self.__sort(self.__key(cells[:, 0], cells[:, 1]), valid_verts)
+
+        valid_edges = np.flatnonzero(projection.valid_edges)
+        ev = projection.edges[valid_edges]
+        c0 = self.__cells(projection.verts[ev[:, 0]])
+        c1 = self.__cells(projection.verts[ev[:, 1]])
+        cmin = np.minimum(c0, c1)
+        cmax = np.maximum(c0, c1)
+        span = cmax - cmin + 1
+        counts = span[:, 0] * span[:, 1]
+
+        large = counts > self.max_edge_cells
+        self.__large_edges = valid_edges[large]
+
+        small = ~large
+        counts = counts[small]
+        cmin = cmin[small]
+        span_x = span[small, 0]
+        total = int(counts.sum())
+        rep = np.repeat(np.arange(len(counts)), counts)
+        offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = cmin[rep, 0] + offset % span_x[rep]
+        cy = cmin[rep, 1] + offset // span_x[rep]
+        self.__edge_keys, self.__edge_items = self.__sort(self.__key(cx, cy), valid_edges[small][rep])
+
+        # 作った後に動いた頂点とそのエッジ. セルに関係なく常に候補に入れる
+        self.__moved_verts = np.zeros(0, dtype = np.int64)
+        self.__moved_edges = np.zeros(0, dtype = np.int64)
+        self.__vert_edges = None
+
+    def __cells(self, xy) :
+        # 画面外の点は外周のセルにまとめる
+        cells = np.floor(xy / self.cell_size)
+        cells[:, 0] = np.clip(cells[:, 0], -1, self.grid_w)
+        cells[:, 1] = np.clip(cells[:, 1], -1, self.grid_h)
+        return cells.astype(np.int64)
+
+    def __key(self, cx, cy) :
+        return (cy + 1) * (self.grid_w + 2) + (cx + 1)
+
+    @staticmethod
+    def __sort(keys, items) :
+        order = np.argsort(keys, kind = 'stable')
+        return keys[order], items[order]
+
+    def __query(self, keys, items, coord, radius) :
+        cs = self.cell_size
+        def cell(v, n) :
+            return min(max(int(math.floor(v / cs)), -1), n)
+        x0 = cell(coord[0] - radius, self.grid_w)
+        x1 = cell(coord[0] + radius, self.grid_w)
+        y0 = cell(coord[1] - radius, self.grid_h)
+        y1 = cell(coord[1] + radius, self.grid_h)
+
+        # 同じ行のセルはキーが連続しているので行ごとに範囲で取り出す
+        rows = np.arange(y0, y1 + 1)
+        starts = np.searchsorted(keys, self.__key(x0, rows), side = 'left')
+        ends = np.searchsorted(keys, self.__key(x1, rows), side = 'right')
+        if len(rows) == 1 :
+            return items[starts[0]:ends[0]]
+        return np.concatenate([items[s:e] for s, e in zip(starts.tolist(), ends.tolist())])
+
+    def query_verts(self, coord, radius) :
+        """Indices of the valid vertices in the cells touched by the circle."""
+        hits = self.__query(self.__vert_keys, self.__vert_items, coord, radius)
+        if len(self.__moved_verts) :
+            hits = np.unique(np.concatenate((hits, self.__moved_verts)))
+            hits = hits[self.projection.valid_verts[hits]]
+        return hits
+
+    def query_edges(self, coord, radius) :
+        """Indices of the valid edges whose bounds share a cell with the circle, without duplicates."""
+        hits = self.__query(self.__edge_keys, self.__edge_items, coord, radius)
+        if len(self.__large_edges) or len(self.__moved_edges) :
+            hits = np.concatenate((hits, self.__large_edges, self.__moved_edges))
+        hits = np.unique(hits)
+        if len(self.__moved_edges) :
+            hits = hits[self.projection.valid_edges[hits]]
+        return hits
+
+    def move_verts(self, indices) -> bool :
+        """Keep the grid after the projected positions of indices changed in place.
+
+        The verts and their edges are returned by every query from then on,
+        callers test the distance anyway. False when too many verts have
+        moved and the grid should be built again.
+        """
+        if self.__vert_edges is None :
+            # 頂点 -> エッジ の対応 (ソートしたエッジの端点と各頂点の開始位置)
+            ends = self.projection.edges.ravel().astype(np.int64)
+            order = np.argsort(ends, kind = 'stable')
+            starts = np.searchsorted(ends[order], np.arange(len(self.projection.verts) + 1))
+            self.__vert_edges = (order // 2, starts)
+            self.__vert_moved = np.zeros(len(self.projection.verts), dtype = bool)
+            self.__edge_moved = np.zeros(len(self.projection.edges), dtype = bool)
+        edges, starts = self.__vert_edges
+        # 同じ頂点を何度も書くので,初めて動いた頂点だけ足す
+        indices = np.unique(np.asarray(indices, dtype = np.int64))
+        indices = indices[~self.__vert_moved[indices]]
+        if len(indices) == 0 :
+            return True
+        if len(self.__moved_verts) + len(indices) > self.__moved_limit :
+            return False
+        self.__vert_moved[indices] = True
+        self.__moved_verts = np.concatenate((self.__moved_verts, indices))
+        counts = starts[indices + 1] - starts[indices]
+        offset = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        added = np.unique(edges[np.repeat(starts[indices], counts) + offset])
+        added = added[~self.__edge_moved[added]]
+        self.__edge_moved[added] = True
+        self.__moved_edges = np.concatenate((self.__moved_edges, added))
+        return True
@@ -13,14 +13,30 @@
 
 import bpy
 import math
+import time
+import collections
 import mathutils
+import numpy as np
 from mathutils import *
 from .QMeshOperators import *
+from .QTriangleBVH import QTriangleBVH
+from .QDepthBuffer import QDepthBuffer
+from .QSnapScene import QSnapScene
+from .QMeshArrays import project_points
 from ..utils import pqutil
 
 class QSnap:
     instance = None
     ref = 0
+    # depsgraphでジオメトリが更新されたIDの更新回数
+    geometry_revisions = collections.Counter()
+    depsgraph_serial = 0
+    track_depsgraph = False
+    # この数以上のオブジェクトがあればワールド空間のバウンディングを先に引く(Noneで使わない)
+    scene_min_objects = 2
+    # is_targetの結果を覚えておく位置の刻み(double_thresholdに対する比)と件数の上限
+    visibility_quantum = 0.1
+    visibility_max = 65536
 
     @classmethod
     def add_ref(cls, context):
@@ -46,21 +62,76 @@ class QSnap:
         if cls.instance :
             cls.instance.__update(context)
 
+    @classmethod
+    def begin_frame(cls) :
+        """Forget the is_target results of the previous event."""
+        if cls.instance :
+            cls.instance.visibility = {}
+
+    @classmethod
+    def depsgraph_updated(cls, depsgraph = None) :
+        # ジオメトリが変わったオブジェクトとメッシュの版を上げる
+        if depsgraph is None :
+            cls.depsgraph_serial += 1
+            return
+        cls.track_depsgraph = True
+        # 編集中のメッシュの更新ではスナップ対象は変わらない
+        watched = cls.instance.watched if cls.instance else None
+        changed = False
+        for update in depsgraph.updates :
+            key = update.id.original.as_pointer()
+            if update.is_updated_geometry :
+                cls.geometry_revisions[key] += 1
+                changed |= watched is None or key in watched
+            elif update.is_updated_transform :
+                # 動いたらワールド空間のバウンディングを作り直す
+                changed |= watched is None or key in watched
+        if changed :
+            cls.depsgraph_serial += 1
+
     def __init__(self, context, snap_objects = 'Visible'):
         self.objects_array = None
         self.bvh_list = None
+        self.triangle_bvh_list = {}
+        self.depth_cache = None
+        # as_pointer() -> (fingerprint, BVHTree) 見えなくなったオブジェクトの木も残しておく
+        self.tree_cache = {}
+        self.scene = None
+        self.update_key = None
+        self.watched = set()
+        # as_pointer() -> matrix_world 動いたら見え方の結果を捨てる
+        self.matrices = {}
+        self.rebuild_count = 0
+        self.reuse_count = 0
+        self.rebuild_time = 0.0
+        self.last_rebuild_time = 0.0
+        # (量子化した位置, pickTarget) -> is_target ビュー,スナップ対象の形か位置,フレームが変わったら捨てる
+        self.visibility = {}
+        self.visibility_view = None
+        self.visibility_queries = 0
+        self.visibility_hits = 0
 
     def __update(self, context) :
         if not self.isEnableSnap(context):
             self.remove_tree()
             return
 
-        if self.bvh_list != None:
-            if set(self.bvh_list.keys()) == set(self.snap_objects(context)):
+        objects = self.snap_objects(context)
+        if QSnap.track_depsgraph :
+            # depsgraphから更新が来ていなければ見えるオブジェクトが同じか見るだけでいい
+            key = ( QSnap.depsgraph_serial , tuple( obj.as_pointer() for obj in objects ) )
+            if self.bvh_list != None and self.update_key == key :
                 return
+            self.update_key = key
+        self.update_tree(context, objects)
 
-        self.remove_tree()
-        self.create_tree(context)
+    @staticmethod
+    def fingerprint(obj, depsgraph) :
+        # 評価済みメッシュ,頂点数と面数,モディファイア込みの更新回数
+        data = obj.evaluated_get(depsgraph).data
+        revisions = QSnap.geometry_revisions
+        return ( data.as_pointer() , len(data.vertices) , len(data.polygons) ,
+                 revisions[obj.as_pointer()] , revisions[obj.data.as_pointer()] )
 
     def isEnableSnap(self, context):
         ts = context.scene.tool_settings
@@ -82,18 +153,145 @@ class QSnap:
     def create_tree(self, context):
         if self.bvh_list != None:
             return
-        self.bvh_list = {}
-        for obj in self.snap_objects(context):
-            bvh = mathutils.bvhtree.BVHTree.FromObject(obj, context.evaluated_depsgraph_get(), epsilon = 0.0)
-            self.bvh_list[obj] = bvh
+        self.update_tree(context, self.snap_objects(context))
+
+    def update_tree(self, context, objects) :
+        """Rebuild the trees of the objects whose geometry changed, reuse the others."""
+        depsgraph = context.evaluated_depsgraph_get()
+        bvh_list = {}
+        matrices = {}
+        changed = False
+        self.watched = set()
+        for obj in objects :
+            key = obj.as_pointer()
+            self.watched.add(key)
+            self.watched.add(obj.data.as_pointer())
+            matrices[key] = tuple( tuple(r) for r in obj.matrix_world )
+            fingerprint = self.fingerprint(obj, depsgraph)
+            entry = self.tree_cache.get(key)
+            if entry is None or entry[0] != fingerprint :
+                t = time.perf_counter()
+                bvh = mathutils.bvhtree.BVHTree.FromObject(obj, depsgraph, epsilon = 0.0)
+                self.last_rebuild_time = time.perf_counter() - t
+                self.rebuild_time += self.last_rebuild_time
+                self.rebuild_count += 1
+                self.triangle_bvh_list.pop(key, None)
+                entry = (fingerprint, bvh)
+                self.tree_cache[key] = entry
+                changed = True
+            else :
+                self.reuse_count += 1
+            bvh_list[obj] = entry[1]
+
+        # 消されたオブジェクトの木は捨てる
+        alive = { obj.as_pointer() for obj in context.scene.objects }
+        for key in [ k for k in self.tree_cache.keys() if k not in alive ] :
+            del self.tree_cache[key]
+            self.triangle_bvh_list.pop(key, None)
+
+        # 木は使い回せてもオブジェクトが動いていれば遮蔽は変わる
+        if changed or self.bvh_list is None or matrices != self.matrices :
+            self.depth_cache = None
+            self.visibility = {}
+        self.bvh_list = bvh_list
+        self.matrices = matrices
+
+        min_objects = QSnap.scene_min_objects
+        if min_objects is not None and len(bvh_list) >= min_objects :
+            self.scene = QSnapScene(list(bvh_list.items()), depsgraph)
+        else :
+            self.scene = None
 
     def remove_tree(self) :
+        self.triangle_bvh_list = {}
+        self.tree_cache = {}
+        self.scene = None
+        self.update_key = None
+        self.depth_cache = None
+        self.visibility = {}
+        self.matrices = {}
         if self.bvh_list == None:
             return
         for bvh in self.bvh_list.values():
             del bvh
         self.bvh_list = None
 
+    @classmethod
+    def stats(cls) -> str :
+        """Rebuild counters of the snap trees for the debug overlay."""
+        if cls.instance == None :
+            return "-"
+        i = cls.instance
+        return "{}/{} {:.1f}ms vis {}/{}".format(i.rebuild_count, i.rebuild_count + i.reuse_count, i.rebuild_time * 1000.0, i.visibility_hits, i.visibility_queries)
+
+    def triangle_bvh(self, obj) -> QTriangleBVH :
+        # レイ判定用の木は必要になったときに評価済みメッシュの配列から作る
+        bvh = self.triangle_bvh_list.get(obj.as_pointer())
+        if bvh is None :
+            eval_obj = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+            mesh = eval_obj.to_mesh()
+            mesh.calc_loop_triangles()
+            co = np.empty(len(mesh.vertices) * 3, dtype = np.float32)
+            mesh.vertices.foreach_get('co', co)
+            tris = np.empty(len(mesh.loop_triangles) * 3, dtype = np.int32)
+            mesh.loop_triangles.foreach_get('vertices', tris)
+            tri_face = np.empty(len(mesh.loop_triangles), dtype = np.int32)
+            mesh.loop_triangles.foreach_get('polygon_index', tri_face)
+            eval_obj.to_mesh_clear()
+            bvh = QTriangleBVH(co.reshape((-1, 3)), tris.reshape((-1, 3)), tri_face)
+            self.triangle_bvh_list[obj.as_pointer()] = bvh
+        return bvh
+
+    def __depth_buffer(self, context) -> QDepthBuffer :
+        # ビューかオブジェクトが動いたときだけ描き直す
+        region = context.region
+        rv3d = context.region_data
+        matrix = rv3d.perspective_matrix
+        key = ( tuple( tuple(r) for r in matrix ) , region.width , region.height ,
+                tuple( tuple( tuple(r) for r in obj.matrix_world ) for obj in self.bvh_list.keys() ) )
+        if self.depth_cache is None or self.depth_cache[0] != key :
+            buffer = QDepthBuffer(region.width, region.height)
+            for obj in self.bvh_list.keys() :
+                bvh = self.triangle_bvh(obj)
+                xy, depth, front = project_points(bvh.co, matrix @ obj.matrix_world, region.width, region.height)
+                buffer.add_triangles(xy, depth, front, bvh.tris)
+            self.depth_cache = (key, buffer)
+        return self.depth_cache[1]
+
+    @classmethod
+    def depth_test(cls, context, world_positions) -> np.ndarray :
+        """QDepthBuffer.VISIBLE where the snap objects' depth buffer shows is_target(pos, None) is True, AMBIGUOUS where a ray is still needed."""
+        count = len(world_positions)
+        states = np.full(count, QDepthBuffer.AMBIGUOUS, dtype = np.int8)
+        if cls.instance == None or not cls.instance.bvh_list or count == 0:
+            return states
+        buffer = cls.instance.__depth_buffer(context)
+        if not buffer.complete:
+            return states
+
+        region = context.region
+        rv3d = context.region_data
+        dist = context.scene.tool_settings.double_threshold
+        pos = np.array( [ tuple(p) for p in world_positions ] , dtype = np.float64 )
+        if rv3d.is_perspective:
+            ray = pos - np.array(rv3d.view_matrix.inverted().translation)
+            ray /= np.maximum(np.sqrt((ray * ray).sum(axis = 1)), 1e-12)[:, None]
+        else:
+            ray = np.tile(np.array(rv3d.view_rotation @ Vector((0.0, 0.0, -1.0))), (count, 1))
+
+        matrix = rv3d.perspective_matrix
+        xy, depth, front = project_points(pos, matrix, region.width, region.height)
+        xy_near, near, front_near = project_points(pos - ray * dist, matrix, region.width, region.height)
+        xy_far, far, front_far = project_points(pos + ray * dist, matrix, region.width, region.height)
+        samples, covered, ids = buffer.samples(xy)
+
+        # 何にも当たらないか,最初に当たる面が点からdist以内ならターゲット
+        empty = (np.isinf(samples) & ~covered).all(axis = 1)
+        on_surface = ((samples >= near[:, None]) & (samples <= far[:, None])).all(axis = 1)
+        on_region = (xy[:, 0] >= 0) & (xy[:, 0] < region.width) & (xy[:, 1] >= 0) & (xy[:, 1] < region.height)
+        states[(empty | on_surface) & front & front_near & on_region] = QDepthBuffer.VISIBLE
+        return states
+
 
     @classmethod
     def view_adjust( cls , world_pos : mathutils.Vector ) -> mathutils.Vector :
@@ -125,6 +323,22 @@ class QSnap:
             lp.x = 0
         return lp
 
+    @classmethod
+    def adjust_local_array(cls, matrix_world : mathutils.Matrix, local_positions : np.ndarray, is_fix_to_x_zero) -> np.ndarray :
+        """adjust_local over an (N,3) array."""
+        if cls.instance == None:
+            return local_positions
+        result = np.array(local_positions, dtype = np.float64)
+        if cls.instance.bvh_list:
+            m = np.array(matrix_world, dtype = np.float64)
+            location, normal, index = cls.find_nearest_array(result @ m[:3, :3].T + m[:3, 3])
+            inv = np.array(matrix_world.inverted(), dtype = np.float64)
+            result = location @ inv[:3, :3].T + inv[:3, 3]
+        if is_fix_to_x_zero:
+            dist = bpy.context.scene.tool_settings.double_threshold
+            result[np.abs(local_positions[:, 0]) < dist, 0] = 0.0
+        return result
+
     @classmethod
     def adjust_local_to_world(cls, matrix_world : mathutils.Matrix, local_pos : mathutils.Vector, is_fix_to_x_zero):
         if cls.instance == None:
@@ -141,43 +355,148 @@ class QSnap:
             return
         if not cls.instance.bvh_list:
             return
+        verts = list(verts)
+        if not verts:
+            return
 
-        dist = bpy.context.scene.tool_settings.double_threshold                        
-        find_nearest =  cls.instance.__find_nearest
-        matrix = obj.matrix_world
-        for vert in verts :
-            location , norm , index = find_nearest( matrix @ vert.co )
-            if location != None :
-                lp = obj.matrix_world.inverted() @ location
-                if is_fix_to_x_zero and QMeshOperators.is_x_zero_pos(vert.co) :
-                    lp.x = 0
-                vert.co = lp
+        co = np.array( [ tuple(v.co) for v in verts ] , dtype = np.float64 )
+        m = np.array(obj.matrix_world, dtype = np.float64)
+        inv = np.array(obj.matrix_world.inverted(), dtype = np.float64)
+        location , normal , index = cls.find_nearest_array( co @ m[:3, :3].T + m[:3, 3] )
+        hit = index >= 0
+        lp = co.copy()
+        lp[hit] = location[hit] @ inv[:3, :3].T + inv[:3, 3]
+        if is_fix_to_x_zero :
+            dist = bpy.context.scene.tool_settings.double_threshold
+            lp[np.abs(co[:, 0]) < dist, 0] = 0.0
+        for vert, p in zip(verts, lp.tolist()) :
+            vert.co = p
+
+    @classmethod
+    def find_nearest_array(cls, world_positions) :
+        """Nearest points on the snap objects for many world positions at once.
+
+        Returns locations (N,3), normals (N,3) and indices (N,) as arrays,
+        with the same index as adjust_point's find_nearest. Positions
+        nothing was found for keep their location and get index -1.
+        """
+        if isinstance(world_positions, np.ndarray) :
+            pos = np.array(world_positions, dtype = np.float64).reshape((-1, 3))
+        else :
+            pos = np.array( [ tuple(p) for p in world_positions ] , dtype = np.float64 ).reshape((-1, 3))
+        location = pos.copy()
+        normal = np.zeros(pos.shape, dtype = np.float64)
+        index = np.full(len(pos), -1, dtype = np.int64)
+        if cls.instance == None or not cls.instance.bvh_list or len(pos) == 0:
+            return location, normal, index
+        cls.instance.__find_nearest_array(pos, location, normal, index)
+        return location, normal, index
 
     @classmethod
     def is_target(cls, world_pos : mathutils.Vector, pickTarget) -> bool:
-        dist = bpy.context.scene.tool_settings.double_threshold
         if cls.instance == None:
             return True
+        instance = cls.instance
+        quantum = instance.__visibility_quantum(bpy.context)
+        key = ( pickTarget.as_pointer() if pickTarget else None ,
+                math.floor(world_pos[0] / quantum + 0.5) , math.floor(world_pos[1] / quantum + 0.5) , math.floor(world_pos[2] / quantum + 0.5) )
+        instance.visibility_queries += 1
+        result = instance.visibility.get(key)
+        if result is None:
+            result = cls.__is_target(world_pos, pickTarget)
+            instance.visibility[key] = result
+        else:
+            instance.visibility_hits += 1
+        return result
+
+    @classmethod
+    def is_target_array(cls, context, world_positions, pickTarget = None) -> np.ndarray :
+        """is_target for many world positions at once, as a bool array.
+
+        Cached results are taken first, the depth buffer answers what it
+        can when pickTarget is None and only the rest casts rays.
+        """
+        if isinstance(world_positions, np.ndarray) :
+            pos = np.array(world_positions, dtype = np.float64).reshape((-1, 3))
+        else :
+            pos = np.array( [ tuple(p) for p in world_positions ] , dtype = np.float64 ).reshape((-1, 3))
+        count = len(pos)
+        result = np.ones(count, dtype = bool)
+        if cls.instance == None or count == 0:
+            return result
+        instance = cls.instance
+        quantum = instance.__visibility_quantum(context)
+        target = pickTarget.as_pointer() if pickTarget else None
+        keys = [ (target,) + tuple(q) for q in np.floor(pos / quantum + 0.5).astype(np.int64).tolist() ]
+        visibility = instance.visibility
+        instance.visibility_queries += count
+
+        unknown = []
+        for i, key in enumerate(keys) :
+            cached = visibility.get(key)
+            if cached is None :
+                unknown.append(i)
+            else :
+                result[i] = cached
+        instance.visibility_hits += count - len(unknown)
+        if not unknown :
+            return result
+
+        unknown = np.array(unknown, dtype = np.int64)
+        if pickTarget is None :
+            states = cls.depth_test(context, pos[unknown])
+            for i in unknown[states == QDepthBuffer.VISIBLE].tolist() :
+                visibility[keys[i]] = True
+            unknown = unknown[states != QDepthBuffer.VISIBLE]
+        for i in unknown.tolist() :
+            # 同じ位置が続けて来たら一度だけレイを飛ばす
+            cached = visibility.get(keys[i])
+            if cached is None :
+                cached = cls.__is_target(Vector(pos[i]), pickTarget)
+                visibility[keys[i]] = cached
+            result[i] = cached
+        return result
+
+    def __visibility_quantum(self, context) :
+        # ビューが変わったら覚えている結果を捨てて,位置の刻みを返す
+        region = context.region
+        rv3d = context.region_data
+        view = None
+        if rv3d is not None :
+            view = hash( ( tuple( tuple(r) for r in rv3d.perspective_matrix ) , region.width , region.height ) )
+        if view != self.visibility_view or len(self.visibility) > QSnap.visibility_max :
+            self.visibility_view = view
+            self.visibility = {}
+        return max( context.scene.tool_settings.double_threshold * QSnap.visibility_quantum , 1e-9 )
 
+    @classmethod
+    def __is_target(cls, world_pos : mathutils.Vector, pickTarget) -> bool:
+        dist = bpy.context.scene.tool_settings.double_threshold
         ray = pqutil.Ray.from_world_to_screen(bpy.context, world_pos)
         if ray == None:
             return False
 
-        hit, normal, face = cls.instance.__raycast(ray, pickTarget)
-        if hit == None:
+        hits = cls.instance.__raycast_all(ray, pickTarget)
+        if not hits:
             return True
+        hit, normal, face = hits[0]
 
         v2h = (ray.origin - hit).length
         v2w = (ray.origin - world_pos).length
         if abs(v2h - v2w) <= dist:
             return True
 
-        ray2 = pqutil.Ray(hit + ray.vector * dist, ray.vector)
-        hit2, normal2, face2 = cls.instance.__raycast(ray2, pickTarget)
-        if not hit2:
+        # 最初のヒットからdist進んだ先で次にヒットする位置
+        origin2 = hit + ray.vector * dist
+        hit2 = None
+        for h in hits[1:] :
+            if (h[0] - origin2).dot(ray.vector) >= 0 :
+                hit2 = h[0]
+                break
+        if hit2 is None:
             return False
-        h2h = (ray2.origin - hit2).length
-        w2h0 = (ray2.origin - world_pos).length
+        h2h = (origin2 - hit2).length
+        w2h0 = (origin2 - world_pos).length
         w2h1 = (world_pos - hit2).length
         if w2h0 >= h2h:
             return False
@@ -185,30 +504,62 @@ class QSnap:
             return False
         return True
 
-    def __raycast(self, ray : pqutil.Ray, pickTarget):
-        if not self.bvh_list:
+    def __raycast(self, ray : pqutil.Ray, pickTarget = None):
+        hits = self.__raycast_all(ray, pickTarget, 1)
+        if not hits:
             return None, None, None
+        return hits[0]
 
-        min_dist = math.inf
-        location = None
-        normal = None
-        index = None
-        for obj, bvh in self.bvh_list.items():
+    def __raycast_all(self, ray : pqutil.Ray, pickTarget = None, limit = None):
+        # 全オブジェクトのヒットを手前から順に (location, normal, index) で返す
+        if not self.bvh_list:
+            return []
+        if self.scene is not None and pickTarget is None:
+            return self.__raycast_scene(ray, limit)
+
+        hits = []
+        for obj in self.bvh_list.keys():
             if pickTarget:
                 if not obj is pickTarget:
                     continue
             local_ray = ray.world_to_object(obj)
-            hit = bvh.ray_cast(local_ray.origin, local_ray.vector)
-            if None in hit:
-                continue
-            if hit[3] < min_dist:
-                matrix = obj.matrix_world
+            matrix = obj.matrix_world
+            for hit in self.triangle_bvh(obj).ray_cast_all(local_ray.origin, local_ray.vector, limit = limit):
                 location = pqutil.transform_position( hit[0] , matrix )
                 normal = pqutil.transform_normal( hit[1] , matrix )
                 index =  hit[2] + obj.pass_index * 10000000
-                min_dist = hit[3]
-
-        return location, normal, index
+                hits.append( ( (location - ray.origin).length , location , normal , index ) )
+
+        hits.sort( key = lambda h : h[0] )
+        if limit is not None:
+            hits = hits[:limit]
+        return [ h[1:] for h in hits ]
+
+    def __raycast_scene(self, ray : pqutil.Ray, limit = None):
+        # レイが入るバウンディングのオブジェクトだけを手前から調べる
+        scene = self.scene
+        hits = []
+        target = ray.origin + ray.vector
+        candidates, box_dists = scene.ray_candidates(ray.origin, ray.vector)
+        for i, box_dist in zip(candidates, box_dists):
+            if limit is not None and len(hits) >= limit:
+                hits.sort( key = lambda h : h[0] )
+                if box_dist > hits[limit - 1][0]:
+                    break
+            inv = scene.inverses[i]
+            origin = inv @ ray.origin
+            vector = inv @ target - origin
+            matrix = scene.matrices[i]
+            normal_matrix = scene.normal_matrices[i]
+            offset = scene.pass_indices[i] * 10000000
+            for hit in self.triangle_bvh(scene.objects[i]).ray_cast_all(origin, vector, limit = limit):
+                location = matrix @ hit[0]
+                hits.append( ( (location - ray.origin).length , location , normal_matrix @ hit[1] , hit[2] + offset ) )
+
+        hits.sort( key = lambda h : h[0] )
+        if limit is not None:
+            hits = hits[:limit]
+        return [ h[1:] for h in hits ]
 
     def __smart_find( self , ray : pqutil.Ray ) :
         location_i , normal_i , obj_i = self.__raycast_double( ray )
@@ -243,6 +594,8 @@ class QSnap:
     def __find_nearest(self, pos : mathutils.Vector):
         if not self.bvh_list:
             return pos, None, None
+        if self.scene is not None:
+            return self.__find_nearest_scene(pos)
 
         min_dist = math.inf
         location = pos
@@ -260,3 +613,64 @@ class QSnap:
                     normal = pqutil.transform_normal(hit[1], obj.matrix_world)
                     index =  hit[2] + obj.pass_index * 10000000
         return location, normal, index
+
+    def __find_nearest_array(self, pos, location, normal, index) :
+        # 行列の変換と候補の絞り込みは配列でまとめて行い,木を引くところだけ1点ずつ
+        if self.scene is not None :
+            scene = self.scene
+            targets = list(zip(scene.trees, scene.matrices, scene.normal_matrices, scene.pass_indices))
+            gap = np.maximum(np.maximum(scene.lo[None] - pos[:, None], pos[:, None] - scene.hi[None]), 0.0)
+            box_dists = np.sqrt((gap * gap).sum(axis = 2))
+            # 近くにある点の多いオブジェクトから調べると後の絞り込みが効く
+            order = np.argsort(box_dists.mean(axis = 0), kind = 'stable')
+        else :
+            targets = [ (bvh, obj.matrix_world, obj.matrix_world.transposed().to_3x3(), obj.pass_index) for obj, bvh in self.bvh_list.items() ]
+            box_dists = None
+            order = range(len(targets))
+
+        min_dist = np.full(len(pos), np.inf)
+        for i in order :
+            bvh, matrix, normal_matrix, pass_index = targets[i]
+            rows = np.arange(len(pos)) if box_dists is None else np.flatnonzero(box_dists[:, i] < min_dist)
+            if len(rows) == 0 :
+                continue
+            m = np.array(matrix, dtype = np.float64)
+            inv = np.linalg.inv(m)
+            find_nearest = bvh.find_nearest
+            hits = [ find_nearest(p) for p in (pos[rows] @ inv[:3, :3].T + inv[:3, 3]).tolist() ]
+            found = [ j for j, hit in enumerate(hits) if hit[0] is not None ]
+            if not found :
+                continue
+            rows = rows[found]
+            wp = np.array( [ tuple(hits[j][0]) for j in found ] , dtype = np.float64 ) @ m[:3, :3].T + m[:3, 3]
+            dist = np.sqrt(((wp - pos[rows]) ** 2).sum(axis = 1))
+            better = dist < min_dist[rows]
+            found = [ j for j, b in zip(found, better.tolist()) if b ]
+            rows = rows[better]
+            min_dist[rows] = dist[better]
+            location[rows] = wp[better]
+            n = np.array( [ tuple(hits[j][1]) for j in found ] , dtype = np.float64 ).reshape((-1, 3))
+            normal[rows] = n @ np.array(normal_matrix, dtype = np.float64).T
+            index[rows] = np.array( [ hits[j][2] for j in found ] , dtype = np.int64 ) + pass_index * 10000000
+
+    def __find_nearest_scene(self, pos : mathutils.Vector):
+        # バウンディングが近い順に調べて,それより近い点が見つかったら打ち切る
+        scene = self.scene
+        min_dist = math.inf
+        location = pos
+        normal = None
+        index = None
+        candidates, box_dists = scene.point_candidates(pos)
+        for i, box_dist in zip(candidates, box_dists):
+            if box_dist >= min_dist:
+                break
+            hit = scene.trees[i].find_nearest(scene.inverses[i] @ pos)
+            if None not in hit:
+                wp = scene.matrices[i] @ hit[0]
+                dist = (pos - wp).length
+                if min_dist > dist:
+                    min_dist = dist
+                    location = wp
+                    normal = scene.normal_matrices[i] @ hit[1]
+                    index =  hit[2] + scene.pass_indices[i] * 10000000
+        return location, normal, index
@@ -0,0 +1,70 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from mathutils import Vector
+
+__all__ = ['QSnapScene']
+
+class QSnapScene :
+    """The snap objects in world space: their bounds on top, their own trees below.
+
+    Bounds are world aligned boxes of the evaluated objects, tested all at
+    once, and the matrices and inverses are kept from the build. A query
+    only descends into the objects whose box it can reach, nearest box
+    first, and stops as soon as the remaining boxes are farther than what
+    it already found.
+    """
+
+    def __init__(self, objects, depsgraph) :
+        # objects : [(obj, BVHTree)]
+        self.objects = [ obj for obj, bvh in objects ]
+        self.trees = [ bvh for obj, bvh in objects ]
+        self.matrices = [ obj.matrix_world.copy() for obj in self.objects ]
+        self.inverses = [ m.inverted() for m in self.matrices ]
+        self.normal_matrices = [ m.transposed().to_3x3() for m in self.matrices ]
+        self.pass_indices = [ obj.pass_index for obj in self.objects ]
+
+        lo = np.zeros((len(objects), 3))
+        hi = np.zeros((len(objects), 3))
+        for i, (obj, m) in enumerate(zip(self.objects, self.matrices)) :
+            corners = np.array([ tuple(m @ Vector(c)) for c in obj.evaluated_get(depsgraph).bound_box ])
+            lo[i] = corners.min(axis = 0)
+            hi[i] = corners.max(axis = 0)
+        self.lo = lo
+        self.hi = hi
+
+    def __len__(self) :
+        return len(self.objects)
+
+    def ray_candidates(self, origin, direction) :
+        """Objects whose box the ray enters, nearest first, with the world distance to the box."""
+        o = np.array(tuple(origin), dtype = np.float64)
+        d = np.array(tuple(direction), dtype = np.float64)
+        d /= max(float(np.sqrt(d @ d)), 1e-30)
+        d = np.where(np.abs(d) < 1e-30, 1e-30, d)
+        t0 = (self.lo - o) / d
+        t1 = (self.hi - o) / d
+        near = np.maximum(np.minimum(t0, t1).max(axis = 1), 0.0)
+        far = np.maximum(t0, t1).min(axis = 1)
+        hit = np.flatnonzero(far >= near)
+        order = hit[np.argsort(near[hit], kind = 'stable')]
+        return order.tolist(), near[order].tolist()
+
+    def point_candidates(self, pos) :
+        """Every object, nearest box first, with the world distance to the box."""
+        p = np.array(tuple(pos), dtype = np.float64)
+        gap = np.maximum(np.maximum(self.lo - p, p - self.hi), 0.0)
+        dist = np.sqrt((gap * gap).sum(axis = 1))
+        order = np.argsort(dist, kind = 'stable')
+        return order.tolist(), dist[order].tolist()
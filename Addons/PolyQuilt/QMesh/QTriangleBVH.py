@@ -0,0 +1,205 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from mathutils import Vector
+
+__all__ = ['QTriangleBVH']
+
+def _cross(a, b) :
+    # np.crossは小さい配列だと遅いので成分で書く
+    return np.stack((a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1],
+                     a[..., 2] * b[..., 0] - a[..., 0] * b[..., 2],
+                     a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]), axis = -1)
+
+class QTriangleBVH :
+    """Bounding volume hierarchy over the loop triangles of a mesh.
+
+    The tree shape depends only on the topology, so after vertices move the
+    bounds are refitted in place from the coordinate array instead of
+    building a new tree.
+    """
+
+    leaf_size = 8
+    first_level = 8
+    level_step = 2
+
+    def __init__(self, co, tris, tri_face) :
+        self.tris = tris
+        self.tri_face = tri_face
+        self.co = None
+
+        # 重心のモートン順に並べ,連続するleaf_size個ずつを葉にする
+        count = len(tris)
+        centers = co[tris].mean(axis = 1) if count else np.zeros((0, 3), dtype = np.float32)
+        self.order = np.argsort(self.__morton(centers), kind = 'stable')
+        self.leaf_count = max((count + self.leaf_size - 1) // self.leaf_size, 1)
+        self.depth = max(int(self.leaf_count - 1).bit_length(), 0)
+        self.__leaf_starts = np.arange(0, self.leaf_count) * self.leaf_size
+
+        # 各階層のノードが三角形を持っているか
+        size = 1 << self.depth
+        counts = np.zeros(size, dtype = np.int64)
+        counts[:self.leaf_count] = np.minimum(count - self.__leaf_starts, self.leaf_size)
+        self.__counts = [counts]
+        for _ in range(self.depth) :
+            counts = counts[0::2] + counts[1::2]
+            self.__counts.insert(0, counts)
+
+        self.__lo = None
+        self.__hi = None
+        self.refit(co)
+
+    @staticmethod
+    def FromBMesh(bm, co) -> 'QTriangleBVH' :
+        bm.verts.index_update()
+        bm.faces.index_update()
+        loop_tris = bm.calc_loop_triangles()
+        count = len(loop_tris)
+        tris = np.fromiter((l.vert.index for t in loop_tris for l in t), dtype = np.int32, count = count * 3)
+        tri_face = np.fromiter((t[0].face.index for t in loop_tris), dtype = np.int32, count = count)
+        return QTriangleBVH(co, tris.reshape((count, 3)), tri_face)
+
+    @staticmethod
+    def __morton(centers) :
+        if len(centers) == 0 :
+            return np.zeros(0, dtype = np.int64)
+        lo = centers.min(axis = 0)
+        extent = np.maximum(centers.max(axis = 0) - lo, 1e-12)
+        q = ((centers - lo) / extent * 1023.0).astype(np.int64)
+
+        def spread(v) :
+            v = (v | (v << 16)) & 0x030000FF
+            v = (v | (v << 8)) & 0x0300F00F
+            v = (v | (v << 4)) & 0x030C30C3
+            v = (v | (v << 2)) & 0x09249249
+            return v
+
+        return (spread(q[:, 0]) << 2) | (spread(q[:, 1]) << 1) | spread(q[:, 2])
+
+    def refit(self, co) :
+        """Recompute the bounds for new vertex positions without changing the tree."""
+        # 同じ配列でもwrite_coで中身が書き換わっていることがあるので毎回計算する
+        self.co = co
+        size = 1 << self.depth
+        lo = np.full((size, 3), np.inf, dtype = np.float32)
+        hi = np.full((size, 3), -np.inf, dtype = np.float32)
+        if len(self.tris) :
+            tv = co[self.tris[self.order]]
+            lo[:self.leaf_count] = np.minimum.reduceat(tv.min(axis = 1), self.__leaf_starts, axis = 0)
+            hi[:self.leaf_count] = np.maximum.reduceat(tv.max(axis = 1), self.__leaf_starts, axis = 0)
+
+        self.__lo = [lo]
+        self.__hi = [hi]
+        for _ in range(self.depth) :
+            lo = np.minimum(lo[0::2], lo[1::2])
+            hi = np.maximum(hi[0::2], hi[1::2])
+            self.__lo.insert(0, lo)
+            self.__hi.insert(0, hi)
+
+    def __leaf_triangles(self, origin, direction, max_dist) :
+        # 階層ごとにレイと交差するノードをまとめて絞り込む
+        with np.errstate(divide = 'ignore', invalid = 'ignore') :
+            inv = 1.0 / direction
+        # 上の階層は全ノードをまとめて調べ,そこから2階層ずつ降りる
+        level = min(self.depth, self.first_level)
+        nodes = np.arange(1 << level, dtype = np.int64)
+        while True :
+            nodes = nodes[self.__counts[level][nodes] > 0]
+            lo = self.__lo[level][nodes]
+            hi = self.__hi[level][nodes]
+            with np.errstate(invalid = 'ignore') :
+                t1 = (lo - origin) * inv
+                t2 = (hi - origin) * inv
+            tmin = np.fmin(t1, t2).max(axis = 1)
+            tmax = np.fmax(t1, t2).min(axis = 1)
+            nodes = nodes[(tmax >= np.maximum(tmin, 0.0)) & (tmin <= max_dist)]
+            if len(nodes) == 0 or level == self.depth :
+                break
+            step = min(self.level_step, self.depth - level)
+            nodes = ((nodes << step)[:, None] + np.arange(1 << step)).ravel()
+            level += step
+
+        if len(nodes) == 0 :
+            return np.zeros(0, dtype = np.int64)
+        starts = nodes * self.leaf_size
+        ends = np.minimum(starts + self.leaf_size, len(self.tris))
+        counts = ends - starts
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.order[np.repeat(starts, counts) + offset]
+
+    def __intersect(self, tris, origin, direction) :
+        v = self.co[self.tris[tris]].astype(np.float64)
+        v0 = v[:, 0]
+        e1 = v[:, 1] - v0
+        e2 = v[:, 2] - v0
+        p = _cross(direction, e2)
+        det = (e1 * p).sum(axis = 1)
+        valid = np.abs(det) > 1e-12
+        inv_det = 1.0 / np.where(valid, det, 1.0)
+        s = origin - v0
+        u = (s * p).sum(axis = 1) * inv_det
+        q = _cross(s, e1)
+        w = (q * direction).sum(axis = 1) * inv_det
+        t = (e2 * q).sum(axis = 1) * inv_det
+        hit = valid & (u >= 0.0) & (w >= 0.0) & (u + w <= 1.0) & (t >= 0.0)
+        return hit, t, e1, e2
+
+    def __hits(self, origin, direction, distance) :
+        o = np.array(origin, dtype = np.float64)
+        d = np.array(direction, dtype = np.float64)
+        length = np.sqrt((d * d).sum())
+        if length == 0.0 :
+            return None
+        d = d / length
+
+        tris = self.__leaf_triangles(o, d, distance)
+        if len(tris) == 0 :
+            return None
+        hit, t, e1, e2 = self.__intersect(tris, o, d)
+        hits = np.flatnonzero(hit & (t <= distance))
+        hits = hits[np.argsort(t[hits], kind = 'stable')]
+        return o, d, tris, t, e1, e2, hits
+
+    @staticmethod
+    def __result(o, d, tris, t, e1, e2, tri_face, i) :
+        normal = Vector(_cross(e1[i], e2[i])).normalized()
+        dist = float(t[i])
+        return Vector(o + d * dist), normal, int(tri_face[tris[i]]), dist
+
+    def ray_cast(self, origin, direction, distance = np.inf) :
+        """Same results as BVHTree.ray_cast : (location, normal, face index, distance) or Nones."""
+        r = self.__hits(origin, direction, distance)
+        if r is None or len(r[-1]) == 0 :
+            return None, None, None, None
+        o, d, tris, t, e1, e2, hits = r
+        return self.__result(o, d, tris, t, e1, e2, self.tri_face, hits[0])
+
+    def ray_cast_all(self, origin, direction, distance = np.inf, filter_func = None, limit = None) :
+        """Every hit along the ray from one traversal, nearest first, as ray_cast tuples.
+
+        filter_func(face index) -> bool drops hits, limit stops after that many accepted hits.
+        """
+        r = self.__hits(origin, direction, distance)
+        if r is None :
+            return []
+        o, d, tris, t, e1, e2, hits = r
+        tri_face = self.tri_face
+        results = []
+        for i in hits.tolist() :
+            if filter_func is not None and not filter_func(int(tri_face[tris[i]])) :
+                continue
+            results.append(self.__result(o, d, tris, t, e1, e2, tri_face, i))
+            if limit is not None and len(results) >= limit :
+                break
+        return results
@@ -15,3 +15,5 @@
 from .QMesh import QMesh , SelectStack
 from .QSnap import QSnap
 from .ElementItem import ElementItem
+from .QMeshJournal import QMeshJournal
+from .QDepthBuffer import QDepthBuffer
@@ -14,6 +14,7 @@
 import bpy
 import mathutils
 import time
+import functools
 from .QMesh import *
 from .utils import draw_util
 from .subtools import *
@@ -34,6 +35,13 @@ class PQ_Gizmo_Preselect(bpy.types.Gizmo):
         self.subtool = None
         self.tool_table = [None, None, None, None]
         self.tool = None
+        self.hover_key = None
+        self.hover_time = 0.0
+        self.hover_query_count = 0
+        self.hover_hit_count = 0
+        # 間引いたカーソル位置.間隔が空いたら再描画の時に拾い直す
+        self.pending_location = None
+        self.pending_timer = False
 
     def __del__(self):
         pass
@@ -66,6 +74,31 @@ class PQ_Gizmo_Preselect(bpy.types.Gizmo):
         self.mouse_pos = mathutils.Vector(location) 
         if context.region == self.region :
             return -1
+
+        # カーソルもビューもメッシュも変わっていなければ前回の結果をそのまま使う
+        self.hover_query_count += 1
+        key = self.get_hover_key( context , location )
+        if key is not None and key == self.hover_key :
+            self.hover_hit_count += 1
+            return -1
+        rate = self.preferences.hover_pick_rate
+        now = time.time()
+        if rate > 0 and self.hover_key is not None and now - self.hover_time < 1.0 / rate :
+            # 最後の位置を取りこぼさないように,間隔が空いたら再描画させて拾う
+            self.pending_location = mathutils.Vector(location)
+            if not self.pending_timer :
+                self.pending_timer = True
+                bpy.app.timers.register( functools.partial( self.pending_redraw , context.area ) , first_interval = self.hover_time + 1.0 / rate - now )
+            return -1
+
+        self.pick( context , location )
+        return -1
+
+    def pick( self , context , location ) :
+        self.pending_location = None
+        self.hover_key = None
+        self.hover_time = time.time()
+
         if self.bmo == None :
             self.bmo = QMesh(context.active_object, self.preferences)
         self.bmo.CheckValid(context)
@@ -87,20 +120,52 @@ class PQ_Gizmo_Preselect(bpy.types.Gizmo):
         else :
             self.DrawHighlight = None
 
-        return -1
+        self.hover_key = self.get_hover_key( context , location )
+
+    def pending_redraw( self , area ) :
+        try :
+            self.pending_timer = False
+            if self.pending_location is not None :
+                area.tag_redraw()
+        except ReferenceError :
+            # ギズモかエリアが先に消えた
+            pass
+        return None
+
+    def get_hover_key( self , context , location ) :
+        bmo = self.bmo
+        if bmo == None or bmo.invalid or bmo.obj != context.active_object or not bmo.bm.is_valid :
+            return None
+        region = context.region
+        rv3d = context.region_data
+        shading = bmo.get_shading(context)
+        return ( round(location[0]) , round(location[1]) ,
+                 tuple( tuple(r) for r in rv3d.perspective_matrix ) , region.width , region.height ,
+                 bmo.journal.version( *QMeshJournal.ALL ) , bmo.is_mirror_mode ,
+                 shading.show_backface_culling , context.scene.tool_settings.use_snap ,
+                 self.subtool , self.preferences.distance_to_highlight , self.preferences.loopcut_division )
 
     def draw(self, context):
         if PQ_GizmoGroup_Base.running_polyquilt  :
             self.DrawHighlight = None
+            self.pending_location = None
+        elif self.pending_location is not None and not self.pending_timer :
+            self.pick( context , self.pending_location )
 
         if self.DrawHighlight != None :
             self.DrawHighlight()
 
-    def refresh( self , context ):
+    def refresh( self , context , depsgraph = None ):
+        if self.bmo != None :
+            self.bmo.depsgraph_updated( depsgraph )
+        self.clear_hover()
+
+    def clear_hover( self ) :
         if self.bmo != None :
-            self.bmo.invalid = True
             self.currentElement = ElementItem.Empty()
             self.DrawHighlight = None
+        self.hover_key = None
+        self.pending_location = None
 
     def recive_event( self , context , event ):
         subtool = self.maintool
@@ -188,9 +253,9 @@ class PQ_GizmoGroup_Base(bpy.types.GizmoGroup):
         gz.init(context, self.my_tool)
         PQ_GizmoGroup_Base.child_gizmos.append(gz)
 
-    def refresh(self, context) :
+    def refresh(self, context, depsgraph = None) :
         if hasattr(self, "gizmo") :
-            self.gizmo.refresh(context)
+            self.gizmo.refresh(context, depsgraph)
 
     @classmethod
     def set_cursor(cls, cursor = 'DEFAULT'):
@@ -209,9 +274,15 @@ class PQ_GizmoGroup_Base(bpy.types.GizmoGroup):
             gizmo.recive_event(context, event)
 
     @classmethod
-    def depsgraph_update_post(cls, scene):
+    def depsgraph_update_post(cls, scene, depsgraph = None):
+        for gizmo in cls.child_gizmos:
+            gizmo.refresh(bpy.context, depsgraph)
+
+    @classmethod
+    def depsgraph_update_pre(cls, scene):
+        # 無効かどうかは評価の後で決める
         for gizmo in cls.child_gizmos:
-            gizmo.refresh(bpy.context)
+            gizmo.clear_hover()
 
 
 class PQ_GizmoGroup_Preselect(PQ_GizmoGroup_Base):
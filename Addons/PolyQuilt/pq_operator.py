@@ -180,6 +180,7 @@ class MESH_OT_poly_quilt(bpy.types.Operator):
                 return {'PASS_THROUGH'}
 
         context.area.tag_redraw()
+        QSnap.begin_frame()
 
         MESH_OT_poly_quilt.handle_remove()
 
@@ -199,12 +200,15 @@ class MESH_OT_poly_quilt(bpy.types.Operator):
             ret = self.currentSubTool.Update(context, event)
             context.window.cursor_set( self.currentSubTool.CurrentCursor() )
 
+        # サブツールの編集はここでまとめてビューに送る
+        self.bmo.FlushUpdate()
+
         if self.preferences.is_debug :
             self.count = self.count + 1
             self.time = time.time() - t
             if self.maxTime < self.time :
                 self.maxTime = self.time
-            self.debugStr = "eventValue = " + str(event.value) + " type = "+ str(event.type) + " - " + str(self.count) + " time = " + str(self.time) + " max = " + str(self.maxTime)
+            self.debugStr = "eventValue = " + str(event.value) + " type = "+ str(event.type) + " - " + str(self.count) + " time = " + str(self.time) + " max = " + str(self.maxTime) + " mirror = " + str(self.bmo.mirror_query_count) + " flush = " + str(self.bmo.flush_count) + " snap = " + QSnap.stats() + " hover = " + str(self.preselect.hover_hit_count) + "/" + str(self.preselect.hover_query_count)
 
         if ret == 'FINISHED' or ret == 'CANCELLED' :
             pass
@@ -276,8 +280,11 @@ class MESH_OT_poly_quilt(bpy.types.Operator):
         self.AddTimerEvent(context)
         PQ_GizmoGroup_Base.running_polyquilt = True
         QSnap.update(context)
-        
-        return { self.currentSubTool.Update(context, event) }
+
+        ret = self.currentSubTool.Update(context, event)
+        # 最初のイベントでの編集もupdateと同じくここでビューに送る
+        self.bmo.FlushUpdate()
+        return { ret }
 
     def cancel( self , context):
         MESH_OT_poly_quilt.handle_remove()
@@ -391,12 +398,13 @@ class MESH_OT_poly_quilt_daemon(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
     @staticmethod
-    def depsgraph_update_post_handler( scene):
-        PQ_GizmoGroup_Base.depsgraph_update_post( scene )
+    def depsgraph_update_post_handler( scene , depsgraph = None ):
+        QSnap.depsgraph_updated( depsgraph )
+        PQ_GizmoGroup_Base.depsgraph_update_post( scene , depsgraph )
 
     @staticmethod
     def depsgraph_update_pre_handler( scene):
-        PQ_GizmoGroup_Base.depsgraph_update_post( scene )
+        PQ_GizmoGroup_Base.depsgraph_update_pre( scene )
 
 class MESH_OT_poly_quilt_brush_size(bpy.types.Operator):
     """Change Brush Size"""
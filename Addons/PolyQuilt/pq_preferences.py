@@ -161,6 +161,13 @@ class PolyQuiltPreferences(AddonPreferences):
         min=1.0,
         max=10.0) # type: ignore
 
+    hover_pick_rate : bpy.props.IntProperty(
+        name="Hover Pick Rate",
+        description="Maximum highlight picks per second while hovering (0 = unlimited)",
+        default=0,
+        min=0,
+        max=240) # type: ignore
+
     highlight_vertex_size : FloatProperty(
         name="Highlight Vertex Size",
         description="Highlight Vertex Size",
@@ -238,6 +245,13 @@ class PolyQuiltPreferences(AddonPreferences):
         min=0.0,
         max=1.0) # type: ignore
 
+    brush_spacing : bpy.props.FloatProperty(
+        name="Brush Spacing",
+        description="Distance between relax and delete brush samples along a stroke, relative to the brush radius",
+        default=0.1,
+        min=0.01,
+        max=1.0) # type: ignore
+
     fix_to_x_zero : bpy.props.BoolProperty(
               name = "fix_to_x_zero",
               default = False,
@@ -329,6 +343,9 @@ class PolyQuiltPreferences(AddonPreferences):
         row.label(text="Distance to Highlight")
         row.prop(self, "distance_to_highlight" , text = "Distance" )
         row = box.row()
+        row.label(text="Hover Pick Rate")
+        row.prop(self, "hover_pick_rate" , text = "Rate" )
+        row = box.row()
         row.label(text="Highlight Vertex Size", icon = 'VERTEXSEL' )
         row.prop(self, "highlight_vertex_size" , text = "Size" )
         row = box.row()
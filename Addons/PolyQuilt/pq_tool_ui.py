@@ -119,6 +119,7 @@ def draw_settings_ui(context, layout, tool  , ui ):
 
         col.prop( preferences, "brush_size" , text = "Brush Size" , expand = True, slider = True , icon_only = False )
         col.prop( preferences, "brush_strength" , text = "Brush Strength" , expand = True, slider = True , icon_only = False )
+        col.prop( preferences, "brush_spacing" , text = "Brush Spacing" , expand = True, slider = True , icon_only = False )
 #        shading = get_shading()
 #        if shading.type == 'SOLID':        
 #            layout.prop( shading , "show_backface_culling", icon_value = custom_icon("icon_opt_backcull"))
@@ -241,3 +242,4 @@ class VIEW3D_PT_tools_polyquilt_options( Panel):
         col.label( text = "Brush" )        
         col.prop( preferences, "brush_size" , text = "Brush Size" , expand = True, slider = True , icon_only = False )
         col.prop( preferences, "brush_strength" , text = "Brush Strength" , expand = True, slider = True , icon_only = False )
+        col.prop( preferences, "brush_spacing" , text = "Brush Spacing" , expand = True, slider = True , icon_only = False )
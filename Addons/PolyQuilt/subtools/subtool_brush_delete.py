@@ -21,6 +21,7 @@ import bpy_extras
 import collections
 from ..utils import pqutil
 from ..utils import draw_util
+from ..utils.stroke_util import BrushStroke
 from ..QMesh import *
 from .subtool import SubToolEx
 from ..utils.dpi import *
@@ -35,6 +36,7 @@ class SubToolBrushDelete(SubToolEx) :
         self.mirror_tbl = {}
         matrix = self.bmo.obj.matrix_world        
         self.remove_faces = self.collect_faces( bpy.context , self.startMousePos )
+        self.stroke = BrushStroke( self.startMousePos , self.radius * self.preferences.brush_spacing )
         if self.bmo.is_mirror_mode :
             mirror = { self.bmo.find_mirror( f ) for f in self.remove_faces }
             mirror = { m for m in mirror if m != None }
@@ -57,15 +59,12 @@ class SubToolBrushDelete(SubToolEx) :
 
     def OnUpdate( self , context , event ) :
         if event.type == 'MOUSEMOVE':
-            faces = self.collect_faces( context , self.mouse_pos )
-            if self.bmo.is_mirror_mode :
-                mirror = { self.bmo.find_mirror( f ) for f in faces if f not in self.remove_faces }
-                mirror = { m for m in mirror if m != None }
-                self.remove_faces  = self.remove_faces  | mirror
-            self.remove_faces = self.remove_faces | faces
-
+            self.stroke.add( self.mouse_pos )
+        elif event.type == 'TIMER' :
+            self.ApplyStroke( context )
         elif event.type == self.rootTool.buttonType :
             if event.value == 'RELEASE' :
+                self.ApplyStroke( context , finish = True )
                 if self.remove_faces :
                     self.bmo.delete_faces( list( self.remove_faces ) )
                     self.bmo.UpdateMesh()
@@ -76,6 +75,18 @@ class SubToolBrushDelete(SubToolEx) :
 
         return 'RUNNING_MODAL'
 
+    def is_animated( self , context ) :
+        return self.stroke.has_pending
+
+    def ApplyStroke( self , context , finish = False ) :
+        for p in self.stroke.samples( finish ) :
+            faces = self.collect_faces( context , p )
+            if self.bmo.is_mirror_mode :
+                mirror = { self.bmo.find_mirror( f ) for f in faces if f not in self.remove_faces }
+                mirror = { m for m in mirror if m != None }
+                self.remove_faces  = self.remove_faces  | mirror
+            self.remove_faces = self.remove_faces | faces
+
     def OnDraw( self , context  ) :
         color = self.preferences.delete_color 
         draw_util.draw_circle2D( self.mouse_pos , self.radius , color , fill = False , subdivide = 64 , dpi= False , width = 1.0 )
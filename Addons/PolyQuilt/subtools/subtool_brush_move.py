@@ -35,23 +35,30 @@ class SubToolBrushMove(SubToolEx) :
         self.mirror_tbl = {}
         matrix = self.bmo.obj.matrix_world        
         self.verts = self.CollectVerts( bpy.context , self.startMousePos )
+        # 最後に頂点へ反映したカーソル位置
+        self.applied_pos = self.startMousePos.copy()
 
         if self.bmo.is_mirror_mode :
             self.mirrors = { vert : self.bmo.find_mirror( vert ) for vert in self.verts }
         else :
             self.mirrors = {}
+        self.moved_verts = set( self.verts.keys() ) | set( m for m in self.mirrors.values() if m != None )
 
     @staticmethod
     def Check( root , target ) :
         return True
 
     def OnUpdate( self , context , event ) :
-        if event.type == 'MOUSEMOVE':
-            self.UpdateVerts(context)
+        if event.type == 'TIMER' :
+            # 移動量は今のカーソル位置だけで決まるので,間隔は空けずにタイマーごとに反映する
+            if self.is_animated( context ) :
+                self.UpdateVerts(context)
         elif event.type == self.rootTool.buttonType : 
             if event.value == 'RELEASE' :
+                if self.is_animated( context ) :
+                    self.UpdateVerts(context)
                 if self.verts :
-                    self.bmo.UpdateMesh()
+                    self.bmo.UpdateMesh(changes = (QMeshJournal.COORD,), verts = self.moved_verts)
                     return 'FINISHED'
                 return 'CANCELLED'
         elif event.value == 'RELEASE' :
@@ -59,6 +66,9 @@ class SubToolBrushMove(SubToolEx) :
 
         return 'RUNNING_MODAL'
 
+    def is_animated( self , context ) :
+        return self.mouse_pos != self.applied_pos
+
     @classmethod
     def DrawHighlight( cls , gizmo , element ) :
         def Draw() :
@@ -80,49 +90,34 @@ class SubToolBrushMove(SubToolEx) :
         pass
 
     def CollectVerts( self , context , coord ) :
-        rv3d = context.region_data
-        region = context.region
-        halfW = region.width / 2.0
-        halfH = region.height / 2.0
         matrix_world = self.bmo.obj.matrix_world
-        matrix = rv3d.perspective_matrix @ matrix_world
         radius = self.radius
-        bm = self.bmo.bm
-        verts = bm.verts
-
-        select_stack = SelectStack(context, bm)
-        context.tool_settings.mesh_select_mode = (True, False, False)
-        bpy.ops.view3d.select_circle(
-            x = int(coord.x),
-            y = int(coord.y),
-            radius = int(radius),
-            wait_for_input=False,
-            mode='SET')
+        verts = self.bmo.bm.verts
+
+        # 選択を使わずに投影済みの頂点から集める
+        xray = self.bmo.get_shading(context).show_xray
+        indices , points = self.bmo.highlight.CollectBrushVerts( coord , radius , occlusion = not xray )
+        targets = [ verts[i] for i in indices.tolist() ]
 
         new_vec = mathutils.Vector
         pw = (self.strength * self.strength ) * 8
 
-        def ProjVert( vt ) :
+        # 見えるかどうかはまとめて調べる(深度バッファで決まらない頂点だけレイを飛ばす)
+        visible = QSnap.is_target_array( context , [ matrix_world @ vert.co for vert in targets ] )
+        visible = { vert for vert , is_visible in zip( targets , visible.tolist() ) if is_visible }
+
+        def ProjVert( vt , p ) :
             co = vt.co
-            if not QSnap.is_target(matrix_world @ co, None):
+            if vt not in visible :
                 return None
 
-            pv = matrix @ co.to_4d()
-            w = pv.w
-            if w < 0.0 :
-                return None
-            p = new_vec( (pv.x * halfW / w + halfW , pv.y * halfH / w + halfH ) )
+            p = new_vec( p )
             r = (coord - p).length
-            if r > radius :
-                return None
-
             x = (radius - r) / radius
             r = (1-x) ** pw
             return ( p , r , matrix_world @ co , co )
 
-        coords = { vert : ProjVert(vert) for vert in verts if vert.select }
-
-        select_stack.pop()
+        coords = { vert : ProjVert( vert , p ) for vert , p in zip( targets , points.tolist() ) }
 
         return { v : x for v,x in coords.items() if x }
 
@@ -130,6 +125,7 @@ class SubToolBrushMove(SubToolEx) :
         is_fix_zero = self.preferences.fix_to_x_zero or self.bmo.is_mirror_mode        
         region = context.region
         rv3d = context.region_data
+        self.applied_pos = self.mouse_pos.copy()
         move = self.mouse_pos - self.startMousePos
         matrix = self.bmo.obj.matrix_world         
         matrix_inv = self.bmo.obj.matrix_world.inverted()         
@@ -138,12 +134,17 @@ class SubToolBrushMove(SubToolEx) :
         zero_pos = self.bmo.zero_pos
         mirror_pos = self.bmo.mirror_pos
 
+        targets = []
         for v,(p,r,co,orig) in self.verts.items() :
             coord = p + move
             x = region_2d_to_location_3d( region = region , rv3d = rv3d , coord = coord , depth_location = co)
-            x = co.lerp( x , 1 - r )
-            x = QSnap.adjust_point( x )
-            x = matrix_inv @ x
+            targets.append( co.lerp( x , 1 - r ) )
+
+        # 頂点ごとに木を引く前の変換と絞り込みはまとめて行う
+        keys = list( self.verts.keys() )
+        locations , normals , indices = QSnap.find_nearest_array( targets )
+        for v , x , orig in zip( keys , locations.tolist() , ( item[3] for item in self.verts.values() ) ) :
+            x = matrix_inv @ mathutils.Vector( x )
             if is_fix_zero and is_x_zero_pos(orig) :
                 x.x = 0 
             v.co = x
@@ -161,7 +162,7 @@ class SubToolBrushMove(SubToolEx) :
                     else :
                         mirror.co = mirror_pos(vert.co)
 
-        self.bmo.UpdateMesh()        
+        self.bmo.MarkDirty(changes = (QMeshJournal.COORD,), verts = self.moved_verts)
 
     @classmethod
     def GetCursor(cls) :
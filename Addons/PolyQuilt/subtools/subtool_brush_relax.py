@@ -19,8 +19,10 @@ import bmesh
 import copy
 import bpy_extras
 import collections
+import numpy as np
 from ..utils import pqutil
 from ..utils import draw_util
+from ..utils.stroke_util import BrushStroke
 from ..QMesh import *
 from .subtool import SubToolEx
 from ..utils.dpi import *
@@ -34,7 +36,11 @@ class SubToolBrushRelax(SubToolEx):
         self.occlusion_tbl = {}
         self.mirror_tbl = {}
         self.dirty = False
+        self.moved = set()
+        # 前にビューへ送ってから動かした頂点
+        self.pending = set()
         self.effective_boundary = self.GetEffectiveBoundary()
+        self.stroke = BrushStroke(self.startMousePos, self.radius * self.preferences.brush_spacing)
 
     def GetEffectiveBoundary(self):
         ct = self.currentTarget
@@ -73,11 +79,15 @@ class SubToolBrushRelax(SubToolEx):
 
     def OnUpdate(self, context, event):
         if event.type == 'MOUSEMOVE':
-            self.DoRelax(context, self.mouse_pos)
+            self.stroke.add(self.mouse_pos)
+        elif event.type == 'TIMER':
+            self.ApplyStroke(context)
         elif event.type == self.rootTool.buttonType: 
             if event.value == 'RELEASE':
+                self.ApplyStroke(context, finish = True)
                 if self.dirty:
-                    self.bmo.UpdateMesh()
+                    verts = self.bmo.bm.verts
+                    self.bmo.UpdateMesh(changes = (QMeshJournal.COORD,), verts = [verts[i] for i in self.moved])
                     return 'FINISHED'
                 return 'CANCELLED'
         elif event.value == 'RELEASE':
@@ -85,6 +95,19 @@ class SubToolBrushRelax(SubToolEx):
 
         return 'RUNNING_MODAL'
 
+    def is_animated(self, context):
+        return self.stroke.has_pending
+
+    def ApplyStroke(self, context, finish = False):
+        # 溜まったサンプルをまとめて処理してビューの更新は間引く
+        for p in self.stroke.samples(finish):
+            self.DoRelax(context, p)
+        if self.stroke.need_update() and not finish and self.pending:
+            # 座標はwrite_coでジャーナルに記録済みなので,法線とビューの更新だけ頼んでモーダルの最後に送ってもらう
+            verts = self.bmo.bm.verts
+            self.bmo.ScheduleUpdate(changes = (QMeshJournal.COORD,), verts = [verts[i] for i in self.pending])
+            self.pending = set()
+
     def OnDraw(self, context):
         width = 2.0 if self.effective_boundary else 1.0
         draw_util.draw_circle2D(
@@ -100,157 +123,65 @@ class SubToolBrushRelax(SubToolEx):
         pass
 
     def CollectVerts(self, context, coord):
-        rv3d = context.region_data
-        region = context.region
-        halfW = region.width / 2.0
-        halfH = region.height / 2.0
         matrix_world = self.bmo.obj.matrix_world
-        matrix = rv3d.perspective_matrix @ matrix_world
         radius = self.radius
-        bm = self.bmo.bm
-        verts = bm.verts
-
-        select_stack = SelectStack(context, bm)
-        context.tool_settings.mesh_select_mode = (True, False, False)
-        bpy.ops.view3d.select_circle(
-            x = int(coord.x),
-            y = int(coord.y),
-            radius = int(radius),
-            wait_for_input=False,
-            mode='SET')
-
-        occlusion_tbl_get = self.occlusion_tbl.get
-        new_vec = mathutils.Vector
-
-        only_sel = self.preferences.only_select
+        verts = self.bmo.bm.verts
 
-        coords = []
-        cm = {}
-        for vt in verts:
-            if not vt.select:
-                continue
-            if only_sel:
-                if not select_stack.vert_selection[vt.index]:
-                    continue
+        # 選択を使わずに投影済みの頂点から集める
+        xray = self.bmo.get_shading(context).show_xray
+        indices, points = self.bmo.highlight.CollectBrushVerts(coord, radius, self.preferences.only_select, occlusion = not xray)
 
-            co = vt.co
-            is_occlusion = occlusion_tbl_get(vt)
-            if is_occlusion is None:
-                is_occlusion = QSnap.is_target(matrix_world @ co, None)
-                self.occlusion_tbl[vt] = is_occlusion
-                if not is_occlusion:
-                    continue
+        preferences = self.preferences
+        fixed = self.bmo.relax.fixed_mask(indices, preferences.fix_path_end, preferences.fix_sharp_edge, preferences.fix_bound_edge)
+        indices = indices[~fixed]
+        points = points[~fixed]
+        targets = [ verts[i] for i in indices.tolist() ]
 
-            if self.IsFixedVert(vt):
-                continue
-
-            pv = matrix @ co.to_4d()
-            w = pv.w
-            if w < 0.0:
-                continue
-            px = pv.x * halfW / w + halfW
-            py = pv.y * halfH / w + halfH
-            p = new_vec((px, py))
-            r = (coord - p).length
-            if r > radius :
-                continue
-
-            x = (radius - r) / radius
-            x2 = x ** 2
-            cm[vt] = [x2, co.copy()]
-
-        select_stack.pop()
-
-        return cm
-    
-    def IsFixedVert(self, vt):
-        if self.preferences.fix_path_end:
-            if len(vt.link_edges) == 1:
-                return True
+        # まだ調べていない頂点だけまとめて見えるか調べる
+        unknown = [ vt for vt in targets if vt not in self.occlusion_tbl ]
+        if unknown :
+            states = QSnap.is_target_array(context, [ matrix_world @ vt.co for vt in unknown ])
+            for vt, is_visible in zip(unknown, states.tolist()) :
+                self.occlusion_tbl[vt] = is_visible
 
-        fix_sharp = self.preferences.fix_sharp_edge
-        fix_bound = self.preferences.fix_bound_edge
-        if fix_sharp or fix_bound:
-            for e in vt.link_edges:
-                if fix_sharp:
-                    if not e.smooth:
-                        return True
-                if fix_bound:
-                    if e.is_boundary:
-                        return True
+        occlusion_tbl = self.occlusion_tbl
+        visible = np.fromiter((occlusion_tbl[vt] for vt in targets), dtype = bool, count = len(targets))
 
-        return False
+        indices = indices[visible]
+        r = np.sqrt(((points[visible] - np.array((coord.x, coord.y))) ** 2).sum(axis = 1))
+        weights = ((radius - r) / radius) ** 2
+        return indices, weights
 
     def DoRelax(self, context, coord) :
         is_fix_zero = self.preferences.fix_to_x_zero or self.bmo.is_mirror_mode
-        coords = self.CollectVerts(context, coord)
-        if coords:
-            self.dirty = True
-        if self.bmo.is_mirror_mode:
-            mirrors = {vert : self.bmo.find_mirror(vert) for vert, coord in coords.items()}
-
-        if self.effective_boundary:
-            boundary = {c for c in coords.keys() if c.is_boundary}
-
-            result = {}
-            for v in boundary:
-                if len(v.link_faces) == 1:
-                    continue
-                le = [e.other_vert(v).co for e in v.link_edges if e.is_boundary]
-                result[v] = self.getAvgPos(le)
-            for v, co in result.items():
-                v.co = co
-
-            targetVerts = list(coords.keys() - boundary)
-        else:
-            inside = [c for c in coords.keys() if not c.is_boundary]
-            targetVerts = inside
-
-        bmesh.ops.smooth_vert(
-            self.bmo.bm,
-            verts = targetVerts,
-            factor = self.preferences.brush_strength,
-            mirror_clip_x = is_fix_zero,
-            mirror_clip_y = False,
-            mirror_clip_z = False,
-            clip_dist = 0.0001,
-            use_axis_x = True,
-            use_axis_y = True,
-            use_axis_z = True)
-
-        matrix_world = self.bmo.obj.matrix_world
-        is_x_zero_pos = self.bmo.is_x_zero_pos
-        zero_pos = self.bmo.zero_pos
-        mirror_pos = self.bmo.mirror_pos
-        for v , (f,orig) in coords.items():
-            p = QSnap.adjust_local(matrix_world, v.co, is_fix_zero)
-            s = orig.lerp(p, f)
-            if is_fix_zero and is_x_zero_pos(s):
-                s = zero_pos(s)
-            v.co = s
-
-        if self.bmo.is_mirror_mode:
-            for vert , mirror in mirrors.items():
-                if mirror == None:
-                    continue
-                if mirror in coords:
-                    ms = coords[mirror][0]
-                    vs = coords[vert][0]
-                    if vs >= ms:
-                        mirror.co = mirror_pos(vert.co)
-                    else:
-                        vert.co = mirror_pos(mirror.co)
-                else:
-                    mirror.co = mirror_pos(vert.co)
-
-        bmesh.update_edit_mesh(self.bmo.obj.data, loop_triangles = False, destructive = False)
-
-    def getAvgPos(self, le):
-        tv = mathutils.Vector((0, 0, 0))
-        for te in le:
-            tv = tv + te
-        ap = tv * (1 / len(le))
-        return ap
+        indices, weights = self.CollectVerts(context, coord)
+        if len(indices) == 0:
+            return
+        self.dirty = True
+
+        # 境界の平均,内側のスムーズ,フォールオフ,ミラーをまとめて計算して一度に書き戻す
+        bmo = self.bmo
+        arrays = bmo.arrays
+        orig = arrays.co[indices].astype(np.float64)
+        relaxed = bmo.relax.relax(indices, arrays.co, self.preferences.brush_strength, self.effective_boundary, clip_x = is_fix_zero)
+        relaxed = QSnap.adjust_local_array(bmo.obj.matrix_world, relaxed, is_fix_zero)
+        result = orig + (relaxed - orig) * weights[:, None]
+        if is_fix_zero:
+            dist = context.scene.tool_settings.double_threshold
+            result[np.abs(result[:, 0]) < dist, 0] = 0.0
+
+        if bmo.is_mirror_mode:
+            rows, dst = bmo.relax.mirror_targets(indices, weights)
+            mirrored = result[rows] * np.array((-1.0, 1.0, 1.0))
+            # 相手も動かす頂点なら計算結果を上書きする
+            keep = ~np.isin(indices, dst)
+            indices = np.concatenate((indices[keep], dst))
+            result = np.concatenate((result[keep], mirrored))
+
+        bmo.write_co(indices, result)
+        self.moved.update(indices.tolist())
+        self.pending.update(indices.tolist())
+        self.stroke.dirty = True
 
     @classmethod
     def GetCursor(cls) :
@@ -18,6 +18,7 @@ import mathutils
 import bmesh
 import bpy_extras
 import collections
+import numpy as np
 from ..utils import pqutil
 from ..utils import draw_util
 from ..QMesh import *
@@ -35,7 +36,10 @@ class SubToolEdgeSlice(SubTool) :
         l1 = (self.bmo.local_to_world_pos(target.element.verts[1].co) - target.hitPosition).length
         self.reference_point = 0 if l0 > l1 else 1
         self.fixCenter = False
-        self.split_deges , self.draw_deges , self.endTriangles , self.fixCenter = self.CalcSlice( self.bmo , self.currentEdge)
+        self.ring , self.fixCenter = self.CalcSlice( self.bmo , self.currentEdge)
+        self.endTriangles = self.ring.end_triangles
+        self.draw_key = None
+        self.draw_func = None
         self.is_forcus = True
         self.sliceRate = self.CalcSplitRate( bpy.context , mouse_pos , self.currentEdge )
 
@@ -55,7 +59,7 @@ class SubToolEdgeSlice(SubTool) :
         mode = gizmo.get_attr("loopcut_mode")
 
         if target != None and gizmo.bmo != None :
-            split_deges , draw_deges , endTriangles , fixCenter = cls.CalcSlice( gizmo.bmo , target.element )
+            ring , fixCenter = cls.CalcSlice( gizmo.bmo , target.element )
             co = target.world_co
 
             l0 = (gizmo.bmo.local_to_world_pos(target.element.verts[0].co) - target.hitPosition).length
@@ -63,7 +67,7 @@ class SubToolEdgeSlice(SubTool) :
             reference_point = 0 if l0 > l1 else 1
 
             sliceRate = ( co[0] - target.hitPosition ).length / ( co[0] - co[1] ).length
-            func = cls.DrawFunc( gizmo.bmo , target , draw_deges , sliceRate , gizmo.preferences , mode , reference_point )
+            func = cls.DrawFunc( gizmo.bmo , target , ring , sliceRate , gizmo.preferences , mode , reference_point )
             def draw() :
                 func()           
                 with draw_util.push_pop_projection2D() :
@@ -73,13 +77,11 @@ class SubToolEdgeSlice(SubTool) :
         return None
 
     @classmethod
-    def DrawFunc( cls , bmo , currentEdge , cut_deges , sliceRate : float , preferences , mode , reference_point ) :
+    def DrawFunc( cls , bmo , currentEdge , ring , sliceRate : float , preferences , mode , reference_point ) :
         if sliceRate > 0 and sliceRate < 1 :
             def color_split( alpha = 1.0 ):
                 col = preferences.split_color            
                 return (col[0],col[1],col[2],col[3] * alpha )
-            def calc_slice_rate( edge , refarence , rate ) :
-                return SubToolEdgeSlice.calc_slice_rate( currentEdge.element , reference_point , edge , refarence , rate , mode )
 
             size = preferences.highlight_vertex_size          
             width = preferences.highlight_line_width
@@ -87,14 +89,15 @@ class SubToolEdgeSlice(SubTool) :
             pos = currentEdge.verts[0].co + ( currentEdge.verts[1].co- currentEdge.verts[0].co) * sliceRate
             pos = bmo.local_to_world_pos( pos )
 
-            lines = []
-            for cuts in cut_deges :
-                v0 = cuts[0].verts[0].co.lerp( cuts[0].verts[1].co , calc_slice_rate( cuts[0] , cuts[2] , sliceRate ) )
-                v1 = cuts[1].verts[0].co.lerp( cuts[1].verts[1].co , calc_slice_rate( cuts[1] , cuts[3] , sliceRate ) )
-                v0 = bmo.local_to_world_pos( v0 )
-                v1 = bmo.local_to_world_pos( v1 )
-                lines.append(v0)
-                lines.append(v1)
+            # リングの全ての辺の切断位置を一度に補間する
+            edges = ring.draw_edges.ravel()
+            rates = cls.CalcSliceRates( bmo , currentEdge.element , reference_point , edges , ring.draw_refs.ravel() , sliceRate , mode )
+            co = bmo.arrays.co.astype(np.float64)
+            ev = bmo.arrays.edge_verts[edges]
+            p0 = co[ev[:,0]]
+            lines = p0 + ( co[ev[:,1]] - p0 ) * rates[:,None]
+            matrix = np.array( bmo.obj.matrix_world )
+            lines = ( lines @ matrix[:3,:3].T + matrix[:3,3] ).tolist()
             
             snaps = []
             for i in range( preferences.loopcut_division ) :
@@ -139,8 +142,12 @@ class SubToolEdgeSlice(SubTool) :
 
     def OnDraw3D( self , context  ) :
         if self.currentTarget.isEdge :
-            func = SubToolEdgeSlice.DrawFunc( self.bmo , self.currentTarget , self.draw_deges , self.sliceRate , self.preferences , self.operator.loopcut_mode , self.reference_point )
-            func()
+            # 切断位置が変わったときだけ線を作り直す
+            key = ( self.sliceRate , self.operator.loopcut_mode , self.bmo.journal.version( QMeshJournal.COORD , QMeshJournal.TOPOLOGY ) )
+            if self.draw_key != key :
+                self.draw_key = key
+                self.draw_func = SubToolEdgeSlice.DrawFunc( self.bmo , self.currentTarget , self.ring , self.sliceRate , self.preferences , self.operator.loopcut_mode , self.reference_point )
+            self.draw_func()
     @staticmethod
     def calc_slice_rate( currentEdge , reference_point , edge , refarence , rate , mode ) :
         if mode == 'EVEN' :
@@ -152,6 +159,22 @@ class SubToolEdgeSlice(SubTool) :
                 rate = max( min( ( len0 / len1 * rate ) , 1.0 ) , 0.0 )
         return rate if refarence == 0 else 1.0 - rate
 
+    @staticmethod
+    def CalcSliceRates( bmo , currentEdge , reference_point , edges , refarences , rate , mode ) :
+        # calc_slice_rateを辺の配列に対してまとめて計算する
+        rates = np.full( len(edges) , rate , dtype = np.float64 )
+        if mode == 'EVEN' and len(edges) > 0 :
+            co = bmo.arrays.co.astype(np.float64)
+            ev = bmo.arrays.edge_verts[edges]
+            len0 = currentEdge.calc_length()
+            len1 = np.linalg.norm( co[ev[:,1]] - co[ev[:,0]] , axis = 1 )
+            with np.errstate( divide = 'ignore' , invalid = 'ignore' ) :
+                if reference_point == 0 :
+                    rates = 1 - np.clip( len0 / len1 * ( 1 - rate ) , 0.0 , 1.0 )
+                else :
+                    rates = np.clip( len0 / len1 * rate , 0.0 , 1.0 )
+        return np.where( refarences == 0 , rates , 1.0 - rates )
+
     def CalcSplitRate( self , context ,coord , baseEdge ) :
         p0 = baseEdge.verts[0].co
         p1 = baseEdge.verts[1].co
@@ -181,74 +204,15 @@ class SubToolEdgeSlice(SubTool) :
 
     @classmethod
     def CalcSlice( cls , bmo , currentEdge ) :
-        check_edges = []
-        draw_deges = []
-        split_deges = []
-        endTriangles = {}
-        fixCenter = False
-
-        startEdges = [ (currentEdge,0) ]
-
-        if bmo.is_mirror_mode :
-            mirrorEdge = bmo.find_mirror(currentEdge,False)
-            if mirrorEdge is not None :
-                if mirrorEdge != currentEdge :
-                    mirrorVert = bmo.find_mirror(currentEdge.verts[0])
-                    startEdges.append( (mirrorEdge, 0 if mirrorEdge.verts[0] == mirrorVert else 1 ) )
-                else :
-                    fixCenter = True
-
-        for startEdge in startEdges :
-            if len(startEdge[0].link_faces) > 2 :
-                continue
-            for startFace in startEdge[0].link_faces :
-
-                vidx = startEdge[1]
-                face = startFace
-                edge = startEdge[0]
-                for i in range(0,4096) :              
-                    if( face == None or edge == None  ) :
-                        break
-
-                    if edge.index not in check_edges :
-                        check_edges.append(edge.index)
-                        split_deges.append( (edge ,vidx ) )
-
-                    if len( face.loops ) != 4 :
-                        if len( face.loops ) == 3 :
-                            if face not in endTriangles :
-                                endTriangles[face] = (edge.verts[0].index,edge.verts[1].index , [ v for v in face.verts if v not in edge.verts ][0].index )
-                            else :
-                                endTriangles[face] = None
-                        break
-
-                    loop = [ l for l in face.loops if l.edge == edge ][-1]
-                    opposite = loop.link_loop_next.link_loop_next
-                    pidx = 1 if ( loop.vert == edge.verts[vidx]) == (opposite.edge.verts[0] == opposite.vert) else 0                    
-                    draw_deges.append( (loop.edge,opposite.edge ,vidx , pidx ) )
-                    vidx = pidx
-
-                    if len( opposite.edge.link_faces ) == 2 :
-                        face = [ f for f in opposite.edge.link_faces if f != face ][-1]
-                        edge = opposite.edge
-                    else :
-                        if opposite.edge.index not in check_edges :                        
-                            split_deges.append( (opposite.edge ,vidx ) )
-                            check_edges.append( opposite.edge.index )
-                        break
-
-                    if startEdge[0].index == edge.index :
-                        break
-               
-
-        return split_deges , draw_deges , endTriangles , fixCenter
+        # リングはトポロジが変わるまでキャッシュされる
+        return bmo.loops.quad_ring( currentEdge )
 
     def DoSlice( self , startEdge , sliceRate ) :
-        edges = []
-        _slice = {}
-        for split_dege in self.split_deges :
-            edges.append( split_dege[0] )
-            _slice[ split_dege[0] ] = SubToolEdgeSlice.calc_slice_rate( self.currentEdge ,self.reference_point, split_dege[0] , split_dege[1] , sliceRate , self.operator.loopcut_mode )
+        ring = self.ring
+        rates = SubToolEdgeSlice.CalcSliceRates( self.bmo , self.currentEdge , self.reference_point , ring.split_edges , ring.split_refs , sliceRate , self.operator.loopcut_mode )
+        bm_edges = self.bmo.bm.edges
+        edges = [ bm_edges[i] for i in ring.split_edges.tolist() ]
+        _slice = { e : r for e , r in zip( edges , rates.tolist() ) }
 
         ret = bmesh.ops.subdivide_edges(
              self.bmo.bm ,
@@ -56,7 +56,7 @@ class SubToolEdgeSlide(SubTool) :
                         if self.rates[i] >= sys.float_info.epsilon and self.rates[i] == max_rate :
                             p = self.initial_poss[vert].lerp( self.other_poss[vert][i] , self.rates[i] )
                             vert.co = p
-            self.bmo.UpdateMesh()
+            self.bmo.MarkDirty(changes = (QMeshJournal.COORD,), verts = self.vetrs.keys())
 
         elif event.type == 'RIGHTMOUSE' :
             if event.value == 'PRESS' :
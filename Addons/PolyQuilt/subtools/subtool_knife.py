@@ -19,11 +19,16 @@ import mathutils
 import bmesh
 import bpy_extras
 import collections
+import numpy as np
 from ..utils import pqutil
 from ..utils import draw_util
 from ..QMesh import *
 from .subtool import SubTool
 
+def _plane_array(plane) :
+    # pqutil.Plane の法線は単位長なので,そのまま距離に使える
+    return np.array(plane.origin, dtype = np.float64), np.array(plane.vector, dtype = np.float64)
+
 class SubToolKnife(SubTool) :
     name = "KnifeTool2"
 
@@ -98,80 +103,107 @@ class SubToolKnife(SubTool) :
         return slice_plane, plane0, plane1, ray0, ray1
 
     def calc_slice(self, slice_plane, plane0, plane1, ray0, ray1):
-        rv0 = ray0.vector
-        rv1 = ray1.vector
-        rvm = rv0 + rv1
-        slice_plane_intersect_line = slice_plane.intersect_line
-        plane0_distance_point = plane0.distance_point
-        plane1_distance_point = plane1.distance_point
-        epsilon = sys.float_info.epsilon
-
-        matrix = self.bmo.obj.matrix_world
-        ed = {}
-        for edge in self.bmo.edges:
-            if edge.hide:
-                continue
-
-            v0 = edge.verts[0]
-            v1 = edge.verts[1]
-
-            if self.preferences.knife_only_select:
-                if not edge.select:
-                    continue
-
-            p0 = v0.co
-            p1 = v1.co
-            p = slice_plane_intersect_line(p0, p1)
-            if not p:
-                continue
-
-            a0 = plane0_distance_point(p)
-            a1 = plane1_distance_point(p)
-            if (a0 > epsilon and a1 > epsilon):
-                continue
-            if (a0 < -epsilon and a1 < -epsilon):
-                continue
+        bmo = self.bmo
+        bmo.ensure_lookup_table()
+        arrays = bmo.arrays
+        if len(arrays.edge_verts) != len(bmo.bm.edges) :
+            bmo.reload_tree()
+            arrays = bmo.arrays
 
-            ed[edge] = matrix @ p
-        return ed
+        epsilon = sys.float_info.epsilon
+        slice_epsilon = 0.001
+        origin, normal = _plane_array(slice_plane)
+
+        # 辺のバウンディングボックスが切断面の幅に掛からないものを先に落とす
+        center, half = arrays.edge_bounds
+        mask = ~arrays.edge_hide
+        if self.preferences.knife_only_select:
+            mask &= arrays.edge_select
+        mask &= np.abs((center - origin) @ normal) <= half @ np.abs(normal) + slice_epsilon
+        indices = np.flatnonzero(mask)
+
+        # 残った辺と切断面の交点(Plane.intersect_lineと同じ判定)
+        co = arrays.co.astype(np.float64)
+        ev = arrays.edge_verts[indices]
+        p0 = co[ev[:, 0]]
+        p1 = co[ev[:, 1]]
+        d0 = (p0 - origin) @ normal
+        d1 = (p1 - origin) @ normal
+        dot = (p1 - p0) @ normal
+        hit = np.abs(dot) > np.finfo(np.float32).eps
+        hit &= ~((d0 > slice_epsilon) & (d1 > slice_epsilon))
+        hit &= ~((d0 < -slice_epsilon) & (d1 < -slice_epsilon))
+        indices = indices[hit]
+        p = p0[hit] + (p1[hit] - p0[hit]) * (-d0[hit] / dot[hit])[:, None]
+
+        # ナイフの両端の面の間にあるか
+        origin0, normal0 = _plane_array(plane0)
+        origin1, normal1 = _plane_array(plane1)
+        a0 = (p - origin0) @ normal0
+        a1 = (p - origin1) @ normal1
+        inside = ~((a0 > epsilon) & (a1 > epsilon)) & ~((a0 < -epsilon) & (a1 < -epsilon))
+
+        matrix = np.array(bmo.obj.matrix_world)
+        world = p[inside] @ matrix[:3, :3].T + matrix[:3, 3]
+        edges = bmo.bm.edges
+        return { edges[i] : mathutils.Vector(w) for i, w in zip(indices[inside].tolist(), world.tolist()) }
+
+    def knife_faces(self, cut_edges, slice_plane, plane0, plane1, threshold) :
+        # 切る辺に接する面と,切断面上(threshold以内)の頂点をナイフの幅の中に持つ面だけを渡す
+        faces = { f for e in cut_edges for f in e.link_faces if not f.hide }
+
+        bmo = self.bmo
+        arrays = bmo.arrays
+        co = arrays.co.astype(np.float64)
+        origin, normal = _plane_array(slice_plane)
+        d = (co - origin) @ normal
+        near = np.flatnonzero((np.abs(d) <= threshold) & ~arrays.vert_hide)
+        p = co[near]
+        origin0, normal0 = _plane_array(plane0)
+        origin1, normal1 = _plane_array(plane1)
+        a0 = (p - origin0) @ normal0
+        a1 = (p - origin1) @ normal1
+        epsilon = sys.float_info.epsilon
+        inside = ~((a0 > epsilon) & (a1 > epsilon)) & ~((a0 < -epsilon) & (a1 < -epsilon))
+        verts = bmo.bm.verts
+        for i in near[inside].tolist() :
+            faces.update( f for f in verts[i].link_faces if not f.hide )
+        return list(faces)
 
-    def DoKnife(self, context, e0, e1 ) :
+    def bisect(self, cut_edges, slice_plane, plane0, plane1, use_snap_center) :
         bm = self.bmo.bm
         threshold = bpy.context.scene.tool_settings.double_threshold
-        plane, plane0, plane1, ray0, ray1 = self.make_slice_planes(context, e0, e1)
-        faces = [ face for face in self.bmo.faces if not face.hide ]
-        elements = list(self.cut_edges.keys()) + faces
+        edges = list(cut_edges)
+        elements = edges + self.knife_faces(edges, slice_plane, plane0, plane1, threshold)
 
         ret = bmesh.ops.bisect_plane(
             bm,
             geom=elements,
             dist=threshold,
-            plane_co=plane.origin,
-            plane_no=plane.vector,
-            use_snap_center=True,
+            plane_co=slice_plane.origin,
+            plane_no=slice_plane.vector,
+            use_snap_center=use_snap_center,
             clear_outer=False,
             clear_inner=False)
         for e in ret['geom_cut'] :
             e.select_set(True)
-        return
         if QSnap.is_active() :
             QSnap.adjust_verts( self.bmo.obj , [ v for v in ret['geom_cut'] if isinstance( v , bmesh.types.BMVert ) ] , self.preferences.fix_to_x_zero )
+        self.bmo.MarkDirty()
+
+    def DoKnife(self, context, e0, e1 ) :
+        slice_plane, plane0, plane1, ray0, ray1 = self.make_slice_planes(context, e0, e1)
+        if self.cut_edges :
+            self.bisect(self.cut_edges.keys(), slice_plane, plane0, plane1, True)
 
         if self.bmo.is_mirror_mode :
-            slice_plane, plane0, plane1, ray0, ray1 = self.make_slice_planes(context,e0 , e1)
+            # 最初の切断でトポロジが変わっているのでミラー側の交差は作り直す
             slice_plane.x_mirror()
             plane0.x_mirror()
             plane1.x_mirror()
-            self.bmo.UpdateMesh()
             cut_edges_mirror = self.calc_slice(slice_plane, plane0, plane1, ray0, ray1)
             if cut_edges_mirror :
-                faces = [ face for face in self.bmo.faces if face.hide is False ]
-                elements = list(cut_edges_mirror.keys()) + faces[:]
-                ret = bmesh.ops.bisect_plane(bm,geom=elements,dist=threshold,plane_co= slice_plane.origin ,plane_no= slice_plane.vector ,use_snap_center=False,clear_outer=False,clear_inner=False)
-                for e in ret['geom_cut'] :
-                    e.select_set(True)
-                    if QSnap.is_active() :
-                        QSnap.adjust_verts( self.bmo.obj , [ v for v in ret['geom_cut'] if isinstance( v , bmesh.types.BMVert ) ] , self.preferences.fix_to_x_zero )
+                self.bisect(cut_edges_mirror.keys(), slice_plane, plane0, plane1, False)
 
     @classmethod
     def GetCursor(cls) :
@@ -46,6 +46,11 @@ class SubToolMove(SubTool) :
         else :
             self.mirror_pair = { v : None for v in startTarget.verts }
 
+        self.moved_verts = set( self.target_orig.keys() ) | set( v for v in self.mirror_pair.values() if v != None )
+        if self.bmo.is_mirror_mode and startTarget.mirror is not None :
+            mirror = startTarget.mirror
+            self.moved_verts |= { mirror } if startTarget.isVert else set( mirror.verts )
+
         self.normal_ray = pqutil.Ray( self.startPos , startTarget.normal ).world_to_object( self.bmo.obj )
         self.normal_ray.origin = self.startPos
         self.screen_space_plane = pqutil.Plane.from_screen( bpy.context , startTarget.hitPosition )
@@ -55,7 +60,7 @@ class SubToolMove(SubTool) :
         self.ChangeRay(op.move_type )
         self.repeat = False
         self.MoveTo( bpy.context , self.mouse_pos )
-        self.bmo.UpdateMesh(False)
+        self.bmo.MarkDirty(False, (QMeshJournal.COORD,), self.moved_verts)
         self.is_snap = False
 
         # ignore snap target
@@ -135,12 +140,12 @@ class SubToolMove(SubTool) :
                             self.currentTarget.mirror.verts[0].co = self.bmo.zero_pos(self.currentTarget.mirror.verts[0].co)
                             self.currentTarget.mirror.verts[1].co = self.bmo.zero_pos(self.currentTarget.mirror.verts[1].co)
 
-            self.bmo.UpdateMesh(False)
+            self.bmo.MarkDirty(False, (QMeshJournal.COORD,), self.moved_verts)
         elif event.type == 'LEFTMOUSE' : 
             if event.value == 'RELEASE' :
                 threshold = bpy.context.scene.tool_settings.double_threshold
-                verts = set( self.target_orig.keys() ) | set( v for v in self.mirror_pair.values() if v != None )
-                self.bmo.UpdateMesh()
+                verts = self.moved_verts
+                self.bmo.UpdateMesh(changes = (QMeshJournal.COORD,), verts = verts)
                 if self.snapTarget.isVert :
                     verts = verts | self.bmo.find_near(self.bmo.obj.matrix_world @ self.snapTarget.element.co)
                 elif self.snapTarget.isEdge : 
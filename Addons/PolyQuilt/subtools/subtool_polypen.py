@@ -141,15 +141,18 @@ class SubToolPolyPen(SubTool) :
         vt = [ p.intersect_ray( r ) for r,p in zip(rt , finP.Plane) ]
         vt = [ QSnap.view_adjust( p ) for p in vt ]
 
+        moved = set()
         for v , p in zip( fin1.Verts , vt ) :
             if self.bmo.is_mirror_mode :
                 mirror = self.bmo.find_mirror(v)
 
             self.bmo.set_positon( v , p , is_world = True )
+            moved.add( v )
 
             if self.bmo.is_mirror_mode and mirror != None :
                 self.bmo.set_positon( mirror , self.bmo.mirror_world_pos( p ) , is_world = True )
-            self.bmo.UpdateMesh()
+                moved.add( mirror )
+        self.bmo.MarkDirty( changes = (QMeshJournal.COORD,) , verts = moved )
 
         self.startData[-1] = self.CalcHead( fin1.Verts , fin1.Center )
 
@@ -0,0 +1,87 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import mathutils
+
+__all__ = ['BrushStroke']
+
+class BrushStroke :
+    """Queue of cursor positions of a brush stroke, resampled at a fixed spacing.
+
+    Mouse moves only queue positions. The brush takes the samples on the
+    operator timer, at most max_samples per tick, so the cost of a tick
+    does not depend on how many events came in since the last one.
+    """
+
+    # 1回のタイマーで処理するサンプル数の上限
+    max_samples = 8
+
+    def __init__( self , start , spacing : float , update_interval = 1.0 / 30.0 ) :
+        self.last = mathutils.Vector( start )
+        self.pending = []
+        self.spacing = max( spacing , 1.0 )
+        self.update_interval = update_interval
+        self.update_time = 0.0
+        self.dirty = False
+
+    def add( self , pos ) :
+        pos = mathutils.Vector( pos )
+        if self.pending and self.pending[-1] == pos :
+            return
+        self.pending.append( pos )
+
+    @property
+    def has_pending( self ) -> bool :
+        """True when a sample or a viewport update is waiting."""
+        if self.dirty :
+            return True
+        last = self.last
+        return any( ( p - last ).length >= self.spacing for p in self.pending )
+
+    def samples( self , finish = False ) :
+        """Points every spacing along the queued path. finish takes all of it, up to its end."""
+        result = []
+        last = self.last
+        queue = self.pending
+        end = queue[-1] if queue else None
+        i = 0
+        while i < len( queue ) and ( finish or len( result ) < self.max_samples ) :
+            p = queue[i]
+            d = ( p - last ).length
+            if d >= self.spacing :
+                last = last.lerp( p , self.spacing / d )
+                result.append( last )
+            else :
+                # 間隔に満たない点は次の点とまとめる
+                i += 1
+        # 終点は離すときのために残しておく
+        self.pending = queue[i:] if i < len( queue ) else queue[-1:]
+        if finish :
+            if end is not None and ( end - last ).length > 0.0 :
+                last = end
+                result.append( last )
+            self.pending = []
+        self.last = last
+        return result
+
+    def need_update( self , force = False ) -> bool :
+        """True when edits are waiting and the viewport may be updated now."""
+        if not self.dirty :
+            return False
+        now = time.time()
+        if not force and now - self.update_time < self.update_interval :
+            return False
+        self.update_time = now
+        self.dirty = False
+        return True
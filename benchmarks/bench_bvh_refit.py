@@ -0,0 +1,71 @@
+# Keeping the picking tree up to date after a vertex move: BVHTree.FromBMesh rebuild against QTriangleBVH.refit.
+#
+#   blender -b --factory-startup --python benchmarks/bench_bvh_refit.py -- [triangles ...] [--frames N]
+#
+# triangles defaults to 10000 100000 1000000 (flat grids of about that many triangles).
+
+import os
+import sys
+import time
+import math
+import bmesh
+import numpy as np
+from mathutils.bvhtree import BVHTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Addons'))
+from PolyQuilt.QMesh.QTriangleBVH import QTriangleBVH
+
+def bench(triangles, frames) :
+    segments = max(int(math.sqrt(triangles / 2.0)), 1)
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments + 1, y_segments = segments + 1, size = 1.0)
+    bm.verts.ensure_lookup_table()
+    co = np.array( [ tuple(v.co) for v in bm.verts ] , dtype = np.float32 )
+
+    t = time.perf_counter()
+    tree = QTriangleBVH.FromBMesh(bm, co)
+    t_build = time.perf_counter() - t
+
+    # ドラッグの代わりに真ん中の50頂点を毎フレーム持ち上げる
+    center = (segments + 1) * (segments // 2) + segments // 2
+    drag = np.arange(center - 25, center + 25)
+    t_rebuild = 0.0
+    t_refit = 0.0
+    for frame in range(frames) :
+        co = co.copy()
+        co[drag, 2] += 0.01
+        for i in drag.tolist() :
+            bm.verts[i].co.z = float(co[i, 2])
+
+        t = time.perf_counter()
+        bvh = BVHTree.FromBMesh(bm)
+        t_rebuild += time.perf_counter() - t
+
+        t = time.perf_counter()
+        tree.refit(co)
+        t_refit += time.perf_counter() - t
+
+    # 動かした頂点の上から撃って両方の木が同じ面に当たるか
+    mismatch = 0
+    for i in drag.tolist() :
+        origin = (float(co[i, 0]) + 1e-4, float(co[i, 1]) + 1e-4, 1.0)
+        a = bvh.ray_cast(origin, (0.0, 0.0, -1.0))
+        b = tree.ray_cast(origin, (0.0, 0.0, -1.0))
+        if (a[0] is None) != (b[0] is None) or (a[0] is not None and abs(a[3] - b[3]) > 1e-4) :
+            mismatch += 1
+
+    print('%9d tris  build %8.1f ms  rebuild %8.2f ms/frame  refit %8.2f ms/frame  ray mismatches %d' % (
+        len(tree.tris), t_build * 1000.0, t_rebuild * 1000.0 / frames, t_refit * 1000.0 / frames, mismatch))
+    bm.free()
+
+def main() :
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    frames = 10
+    if '--frames' in argv :
+        i = argv.index('--frames')
+        frames = int(argv[i + 1])
+        del argv[i:i + 2]
+    for triangles in ( [ int(a) for a in argv ] or [10000, 100000, 1000000] ) :
+        bench(triangles, frames)
+
+main()
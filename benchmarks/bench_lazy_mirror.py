@@ -0,0 +1,84 @@
+# Mirror queries per pick with X mirror on: an ElementItem for every candidate against promoting only the winner.
+#
+#   blender -b --factory-startup --python benchmarks/bench_lazy_mirror.py -- [segments] [picks] [radius]
+#
+# segments defaults to 300 (a 300x300 grid), radius is in edge lengths (default 4).
+# Without a region the screen radius is emulated with a radius in the grid plane.
+
+import os
+import sys
+import time
+import bpy
+import bmesh
+import numpy as np
+from mathutils import Vector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Addons'))
+from PolyQuilt.QMesh.QMesh import QMesh
+from PolyQuilt.QMesh.ElementItem import ElementItem, ElementCandidate
+
+def main() :
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    segments = int(argv[0]) if len(argv) > 0 else 300
+    picks = int(argv[1]) if len(argv) > 1 else 200
+    radius = (float(argv[2]) if len(argv) > 2 else 4.0) * 2.0 / segments
+
+    for obj in list(bpy.data.objects) :
+        bpy.data.objects.remove(obj)
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments + 1, y_segments = segments + 1, size = 1.0)
+    mesh = bpy.data.meshes.new('grid')
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.use_mirror_x = True
+    obj = bpy.data.objects.new('grid', mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    bpy.ops.object.mode_set(mode = 'EDIT')
+
+    qmesh = QMesh(obj, None)
+    qmesh.ensure_lookup_table()
+    kdtree = qmesh.kdtree
+    matrix_world = obj.matrix_world
+
+    rng = np.random.default_rng(0)
+    centers = [ Vector((x, y, 0.0)) for x, y in rng.uniform(-0.9, 0.9, (picks, 2)).tolist() ]
+
+    def collect(center) :
+        # CollectVerts / CollectEdge の代わりに半径内の頂点とそのエッジを近い順に
+        hits = sorted(kdtree.find_range(center, radius), key = lambda h : h[2])
+        verts = [ qmesh.bm.verts[i] for co, i, d in hits ]
+        edges = list({ e : None for v in verts for e in v.link_edges }.keys())
+        return [ [ ElementCandidate(e, center.to_2d(), matrix_world @ center, 0) for e in elements ] for elements in (verts, edges) ]
+
+    def eager(candidates) :
+        # 以前の動き: 候補ごとに ElementItem を作るとその場でミラーを探していた
+        items = []
+        for c in candidates :
+            item = ElementItem.FromCandidate(qmesh, c)
+            item.setup_mirror()
+            items.append(item)
+        return items[0].mirror if items else None
+
+    def lazy(candidates) :
+        # 採用された候補だけ ElementItem にしてミラーを引く
+        return ElementItem.FromCandidate(qmesh, candidates[0]).mirror if candidates else None
+
+    collected = [ collect(c) for c in centers ]
+    print('verts %d  candidates per pick: verts %.1f edges %.1f' % (len(qmesh.bm.verts),
+        np.mean([ len(v) for v, e in collected ]), np.mean([ len(e) for v, e in collected ])))
+
+    results = {}
+    for name, pick in (('eager', eager), ('lazy', lazy)) :
+        # 前の計測で作られたミラーの対応表は捨てる
+        qmesh.mirror_map.clear()
+        qmesh.mirror_query_count = 0
+        t = time.perf_counter()
+        results[name] = [ (pick(v), pick(e)) for v, e in collected ]
+        elapsed = time.perf_counter() - t
+        print('%-8s %8.2f queries/pick %10.3f ms/pick' % (name, qmesh.mirror_query_count / picks, elapsed * 1000.0 / picks))
+
+    print('same mirrors: %s' % (results['eager'] == results['lazy']))
+    bpy.ops.object.mode_set(mode = 'OBJECT')
+
+main()
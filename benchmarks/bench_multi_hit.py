@@ -0,0 +1,77 @@
+# Picking through hidden layers: BVHTree.ray_cast re-cast past each hidden face against one QTriangleBVH.ray_cast_all.
+#
+#   blender -b --factory-startup --python benchmarks/bench_multi_hit.py -- [layers ...] [--segments N] [--rays N]
+#
+# layers defaults to 2 10 40 stacked grids with every layer but the bottom one hidden.
+# segments defaults to 100 per grid and rays to 50.
+
+import os
+import sys
+import time
+import bmesh
+import numpy as np
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Addons'))
+from PolyQuilt.QMesh.QTriangleBVH import QTriangleBVH
+
+def recast(bvh, faces, origin, vector) :
+    # 以前のPickFaceと同じく,隠れた面に当たったら少し進めて撃ち直す
+    pos, nrm, index, dist = bvh.ray_cast(origin, vector)
+    prePos = origin
+    while (index is not None):
+        if (prePos - pos).length < 0.00001:
+            break
+        prePos = pos
+        if faces[index].hide is False:
+            return index
+        origin = origin + vector * 0.00001
+        pos, nrm, index, dist = bvh.ray_cast(origin, vector)
+    return None
+
+def multi_hit(tree, faces, origin, vector) :
+    hits = tree.ray_cast_all(origin, vector, filter_func = lambda index : faces[index].hide is False, limit = 1)
+    return hits[0][2] if hits else None
+
+def bench(layers, segments, rays) :
+    bm = bmesh.new()
+    for layer in range(layers) :
+        geom = bmesh.ops.create_grid(bm, x_segments = segments + 1, y_segments = segments + 1, size = 1.0)
+        bmesh.ops.translate(bm, vec = (0.0, 0.0, 0.01 * (layers - layer)), verts = geom['verts'])
+    bm.faces.ensure_lookup_table()
+    faces = bm.faces
+    per_layer = len(faces) // layers
+    for face in faces[:per_layer * (layers - 1)] :
+        face.hide = True
+
+    co = np.array( [ tuple(v.co) for v in bm.verts ] , dtype = np.float32 )
+    bvh = BVHTree.FromBMesh(bm)
+    tree = QTriangleBVH.FromBMesh(bm, co)
+
+    rng = np.random.default_rng(0)
+    origins = [ Vector((x, y, 1.0)) for x, y in rng.uniform(-0.9, 0.9, (rays, 2)).tolist() ]
+    vector = Vector((0.0, 0.0, -1.0))
+
+    results = {}
+    times = {}
+    for name, pick, target in (('re-cast', recast, bvh), ('multi-hit', multi_hit, tree)) :
+        t = time.perf_counter()
+        results[name] = [ pick(target, faces, o, vector) for o in origins ]
+        times[name] = (time.perf_counter() - t) * 1000.0 / rays
+    print('%3d layers %8d faces  re-cast %8.3f ms/pick  multi-hit %8.3f ms/pick  same picks %s' % (
+        layers, len(faces), times['re-cast'], times['multi-hit'], results['re-cast'] == results['multi-hit']))
+    bm.free()
+
+def main() :
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    options = { '--segments' : 100, '--rays' : 50 }
+    for key in options :
+        if key in argv :
+            i = argv.index(key)
+            options[key] = int(argv[i + 1])
+            del argv[i:i + 2]
+    for layers in ( [ int(a) for a in argv ] or [2, 10, 40] ) :
+        bench(layers, options['--segments'], options['--rays'])
+
+main()
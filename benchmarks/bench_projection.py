@@ -0,0 +1,101 @@
+# Projecting a mesh for the highlight: the old per-vertex dict loop against QMeshArrays.project.
+#
+#   blender -b --factory-startup --python benchmarks/bench_projection.py -- [segments] [repeats]
+#
+# segments defaults to 550 (a 550x550 grid, about 300k verts).
+
+import os
+import sys
+import time
+import math
+import bmesh
+import numpy as np
+from mathutils import Matrix, Vector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Addons'))
+from PolyQuilt.QMesh.QMeshJournal import QMeshJournal
+from PolyQuilt.QMesh.QMeshArrays import QMeshArrays
+
+WIDTH = 1920
+HEIGHT = 1080
+
+def perspective_matrix(angle) :
+    # 斜め上からグリッドを見るperspective_matrix
+    near, far = 0.01, 100.0
+    f = 1.0 / math.tan(math.radians(25.0))
+    proj = Matrix( ( ( f * HEIGHT / WIDTH , 0.0 , 0.0 , 0.0 ) ,
+                     ( 0.0 , f , 0.0 , 0.0 ) ,
+                     ( 0.0 , 0.0 , (far + near) / (near - far) , 2.0 * far * near / (near - far) ) ,
+                     ( 0.0 , 0.0 , -1.0 , 0.0 ) ) )
+    view = Matrix.Translation((0.0, 0.0, -2.5)) @ Matrix.Rotation(-0.9, 4, 'X') @ Matrix.Rotation(angle, 4, 'Z')
+    return proj @ view
+
+def dict_path(bm, pj_matrix) :
+    # 以前のUpdatViewHighlightと同じ処理
+    halfW = WIDTH / 2.0
+    halfH = HEIGHT / 2.0
+    mat_scaleX = Matrix.Scale(halfW, 4, (1.0, 0.0, 0.0))
+    mat_scaleY = Matrix.Scale(halfH, 4, (0.0, 1.0, 0.0))
+    matrix = mat_scaleX @ mat_scaleY @ pj_matrix
+    halfWH = Vector((halfW, halfH))
+
+    viewPos = {}
+    for p in bm.verts:
+        pv = matrix @ p.co.to_4d()
+        if pv[3] > 0.0:
+            v2 = pv.to_2d() / pv[3] + halfWH
+            viewPos[p] = v2
+
+    viewEdges = {}
+    for e in bm.edges:
+        if e.hide:
+            continue
+        ev0 = e.verts[0]
+        ev1 = e.verts[1]
+        if not ev0 in viewPos or not ev1 in viewPos:
+            continue
+        viewEdges[e] = [viewPos[ev0], viewPos[ev1]]
+    return { v : p for v, p in viewPos.items() if p and not v.hide }, viewEdges
+
+def main() :
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    segments = int(argv[0]) if len(argv) > 0 else 550
+    repeats = int(argv[1]) if len(argv) > 1 else 5
+
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments + 1, y_segments = segments + 1, size = 1.0)
+    bm.verts.ensure_lookup_table()
+    bm.edges.ensure_lookup_table()
+    print('verts %d edges %d' % (len(bm.verts), len(bm.edges)))
+
+    journal = QMeshJournal()
+    arrays = QMeshArrays(bm, journal)
+
+    def cold(matrix) :
+        # 編集の後: 配列を取り直してから投影する
+        journal.mark((QMeshJournal.COORD,))
+        return arrays.project(matrix, WIDTH, HEIGHT)
+
+    def orbit(matrix) :
+        # ビューを回しただけ: 配列はそのまま
+        return arrays.project(matrix, WIDTH, HEIGHT)
+
+    matrices = [ perspective_matrix(0.1 * i) for i in range(repeats) ]
+    for name, func in (('dict', lambda m : dict_path(bm, m)), ('arrays (edit)', cold), ('arrays (orbit)', orbit)) :
+        total = 0.0
+        for m in matrices :
+            t = time.perf_counter()
+            func(m)
+            total += time.perf_counter() - t
+        print('%-16s %10.1f ms/view' % (name, total * 1000.0 / repeats))
+
+    # 両方の結果が同じか
+    verts, edges = dict_path(bm, matrices[-1])
+    proj = orbit(matrices[-1])
+    valid = np.flatnonzero(proj.valid_verts)
+    expect = np.array( [ tuple(verts[bm.verts[i]]) for i in valid.tolist() ] , dtype = np.float64 )
+    error = np.abs(expect - proj.verts[valid]).max() if len(valid) else 0.0
+    print('verts %d/%d edges %d/%d max xy difference %g px' % (len(valid), len(verts), int(proj.valid_edges.sum()), len(edges), error))
+    bm.free()
+
+main()
@@ -0,0 +1,150 @@
+# Cost of one relax brush sample on 5,000 affected verts against a 60 fps frame budget.
+#
+#   blender -b --factory-startup --python benchmarks/bench_relax.py -- [segments] [affected] [ticks]
+#
+# segments defaults to 700 (a 700x700 grid, about 490k verts), affected to 5000 and ticks to 20.
+# A tick runs BrushStroke.max_samples samples like the relax brush on the operator timer.
+# Without a region the view side is timed with a fixed projection: a full projection and
+# grid build per sample against patching the written verts.
+
+import os
+import sys
+import math
+import time
+import bpy
+import bmesh
+import numpy as np
+from mathutils import Matrix
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Addons'))
+from PolyQuilt.QMesh.QMesh import QMesh
+from PolyQuilt.QMesh.QMeshJournal import QMeshJournal
+from PolyQuilt.QMesh.QMeshArrays import ViewProjection, project_points
+from PolyQuilt.QMesh.QScreenGrid import QScreenGrid
+from PolyQuilt.utils.stroke_util import BrushStroke
+
+WIDTH = 1920
+HEIGHT = 1080
+BUDGET = 1000.0 / 60.0
+
+def view_matrix() :
+    # 真上から少し離れてグリッド全体を見る
+    f = 1.0 / math.tan(math.radians(25.0))
+    proj = Matrix( ( ( f * HEIGHT / WIDTH , 0.0 , 0.0 , 0.0 ) ,
+                     ( 0.0 , f , 0.0 , 0.0 ) ,
+                     ( 0.0 , 0.0 , -1.0002 , -0.020002 ) ,
+                     ( 0.0 , 0.0 , -1.0 , 0.0 ) ) )
+    return proj @ Matrix.Translation((0.0, 0.0, -2.5))
+
+def project(co, edges, matrix) :
+    xy, depth, front = project_points(co, matrix, WIDTH, HEIGHT)
+    return ViewProjection(xy, front.copy(), edges, front[edges[:, 0]] & front[edges[:, 1]], depth, front)
+
+def main() :
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    segments = int(argv[0]) if len(argv) > 0 else 700
+    affected = int(argv[1]) if len(argv) > 1 else 5000
+    ticks = int(argv[2]) if len(argv) > 2 else 20
+    samples = BrushStroke.max_samples
+
+    for obj in list(bpy.data.objects) :
+        bpy.data.objects.remove(obj)
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments + 1, y_segments = segments + 1, size = 1.0)
+    mesh = bpy.data.meshes.new('grid')
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.use_mirror_x = True
+    obj = bpy.data.objects.new('grid', mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    bpy.ops.object.mode_set(mode = 'EDIT')
+
+    qmesh = QMesh(obj, None)
+    qmesh.ensure_lookup_table()
+    arrays = qmesh.arrays
+    rng = np.random.default_rng(0)
+    co = arrays.co.copy()
+    co[:, 2] = rng.normal(0.0, 0.002, len(co))
+    arrays.write_co(np.arange(len(co)), co)
+
+    # ブラシの円の代わりに中心から近いaffected個
+    d2 = (arrays.co[:, :2] ** 2).sum(axis = 1)
+    indices = np.sort(np.argsort(d2, kind = 'stable')[:affected])
+    weights = ((1.0 - np.sqrt(d2[indices] / d2[indices].max())) ** 2)
+
+    # 初回に作られるキャッシュ(CSR,辺のフラグ,ミラーの対応)は外して計る
+    t = time.perf_counter()
+    qmesh.relax.relax(indices, arrays.co, 0.5, True)
+    qmesh.relax.mirror_targets(indices, weights)
+    print('verts %d affected %d  first sample with cache builds %.1f ms' % (len(arrays.co), len(indices), (time.perf_counter() - t) * 1000.0))
+
+    parts = { 'fixed_mask' : 0.0 , 'relax' : 0.0 , 'mirror' : 0.0 , 'write_co' : 0.0 , 'flush' : 0.0 }
+    for tick in range(ticks) :
+        moved = set()
+        for sample in range(samples) :
+            t0 = time.perf_counter()
+            fixed = qmesh.relax.fixed_mask(indices, True, True, False)
+            rows = indices[~fixed]
+            w = weights[~fixed]
+            t1 = time.perf_counter()
+            orig = arrays.co[rows].astype(np.float64)
+            relaxed = qmesh.relax.relax(rows, arrays.co, 0.5, True, clip_x = True)
+            result = orig + (relaxed - orig) * w[:, None]
+            t2 = time.perf_counter()
+            src, dst = qmesh.relax.mirror_targets(rows, w)
+            keep = ~np.isin(rows, dst)
+            written = np.concatenate((rows[keep], dst))
+            result = np.concatenate((result[keep], result[src] * np.array((-1.0, 1.0, 1.0))))
+            t3 = time.perf_counter()
+            qmesh.write_co(written, result)
+            moved.update(written.tolist())
+            t4 = time.perf_counter()
+            parts['fixed_mask'] += t1 - t0
+            parts['relax'] += t2 - t1
+            parts['mirror'] += t3 - t2
+            parts['write_co'] += t4 - t3
+        # タイマーごとに1回,法線とビューの更新を送る
+        t = time.perf_counter()
+        verts = qmesh.bm.verts
+        qmesh.ScheduleUpdate(changes = (QMeshJournal.COORD,), verts = [ verts[i] for i in moved ])
+        qmesh.FlushUpdate()
+        parts['flush'] += time.perf_counter() - t
+
+    count = ticks * samples
+    per_sample = sum(v for k, v in parts.items() if k != 'flush') * 1000.0 / count
+    for name, total in parts.items() :
+        per = total * 1000.0 / (ticks if name == 'flush' else count)
+        print('%-12s %8.3f ms/%s' % (name, per, 'tick' if name == 'flush' else 'sample'))
+    per_tick = per_sample * samples + parts['flush'] * 1000.0 / ticks
+    print('%-12s %8.3f ms/sample  %8.3f ms/tick of %d samples  budget %.1f ms: %s' % (
+        'kernel', per_sample, per_tick, samples, BUDGET, 'ok' if per_tick <= BUDGET else 'over'))
+
+    # ビュー側: サンプルごとに全体を投影し直してグリッドを作るのと,書いた頂点だけ直すのと
+    matrix = view_matrix()
+    edges = arrays.edge_verts
+    t = time.perf_counter()
+    for sample in range(samples) :
+        proj = project(arrays.co, edges, matrix)
+        QScreenGrid(proj, WIDTH, HEIGHT)
+    t_full = (time.perf_counter() - t) * 1000.0 / samples
+
+    proj = project(arrays.co, edges, matrix)
+    grid = QScreenGrid(proj, WIDTH, HEIGHT)
+    # 最初の move_verts は頂点 -> エッジ の対応を作るので別に計る
+    t = time.perf_counter()
+    grid.move_verts(indices)
+    t_first = (time.perf_counter() - t) * 1000.0
+    kept = True
+    t = time.perf_counter()
+    for sample in range(samples) :
+        xy, depth, front = project_points(arrays.co[indices], matrix, WIDTH, HEIGHT)
+        proj.verts[indices] = xy
+        proj.depth[indices] = depth
+        kept &= grid.move_verts(indices)
+    t_patch = (time.perf_counter() - t) * 1000.0 / samples
+    print('%-12s %8.3f ms/sample full projection and grid  %8.3f ms/sample patched (first %.1f ms, grid kept %s)' % (
+        'view', t_full, t_patch, t_first, kept))
+    bpy.ops.object.mode_set(mode = 'OBJECT')
+
+main()
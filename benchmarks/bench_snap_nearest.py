@@ -0,0 +1,74 @@
+# Snapping 50k verts onto a 2M triangle scan: adjust_point per vert against one find_nearest_array call.
+#
+#   blender -b --factory-startup --python benchmarks/bench_snap_nearest.py -- [segments] [points]
+#
+# segments defaults to 1000 (a displaced 1000x1000 grid, 2M triangles), points to 50000.
+
+import os
+import sys
+import time
+import bpy
+import bmesh
+import numpy as np
+from mathutils import Vector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Addons'))
+from PolyQuilt.QMesh.QSnap import QSnap
+
+def add_object(name, bm) :
+    mesh = bpy.data.meshes.new(name)
+    bm.to_mesh(mesh)
+    bm.free()
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+def main() :
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    segments = int(argv[0]) if len(argv) > 0 else 1000
+    count = int(argv[1]) if len(argv) > 1 else 50000
+
+    for obj in list(bpy.data.objects) :
+        bpy.data.objects.remove(obj)
+
+    # スキャンの代わりに波打たせたグリッド
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments + 1, y_segments = segments + 1, size = 1.0)
+    for v in bm.verts :
+        v.co.z = 0.1 * np.sin(v.co.x * 9.0) * np.cos(v.co.y * 7.0)
+    scan = add_object('scan', bm)
+    scan.location = (0.2, 0.0, 0.0)
+    scan.rotation_euler = (0.0, 0.0, 0.3)
+
+    # 編集中のオブジェクト(スナップの対象にはならない)
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size = 0.1)
+    active = add_object('retopo', bm)
+    bpy.context.view_layer.objects.active = active
+    bpy.context.scene.tool_settings.use_snap = True
+    bpy.context.view_layer.update()
+
+    t = time.perf_counter()
+    QSnap.add_ref(bpy.context)
+    print('triangles %d  tree build %.3f s' % (len(scan.data.polygons) * 2, time.perf_counter() - t))
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-0.9, 0.9, (count, 3))
+    points[:, 2] = rng.normal(0.0, 0.05, count)
+    vectors = [ Vector(p) for p in points.tolist() ]
+
+    t = time.perf_counter()
+    single = [ QSnap.adjust_point(p) for p in vectors ]
+    t_single = time.perf_counter() - t
+
+    t = time.perf_counter()
+    location, normal, index = QSnap.find_nearest_array(points)
+    t_batch = time.perf_counter() - t
+
+    print('%-20s %10.3f s' % ('adjust_point', t_single))
+    print('%-20s %10.3f s' % ('find_nearest_array', t_batch))
+    error = np.abs(np.array([ tuple(p) for p in single ]) - location).max()
+    print('max location difference %g, misses %d' % (error, int((index < 0).sum())))
+    QSnap.remove_ref()
+
+main()
@@ -0,0 +1,58 @@
+# Per-frame cost of the normal update of UpdateMesh for a drag of 50 verts.
+#
+#   blender -b --factory-startup --python benchmarks/bench_update_mesh.py -- [segments] [frames]
+#
+# segments defaults to 1000 (a 1000x1000 grid, 1M faces).
+
+import os
+import sys
+import time
+import bmesh
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Addons'))
+from PolyQuilt.QMesh.QMeshOperators import QMeshOperators
+
+def main() :
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    segments = int(argv[0]) if len(argv) > 0 else 1000
+    frames = int(argv[1]) if len(argv) > 1 else 30
+
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments + 1, y_segments = segments + 1, size = 1.0)
+    bm.verts.ensure_lookup_table()
+    bm.edges.ensure_lookup_table()
+    bm.faces.ensure_lookup_table()
+    bm.normal_update()
+    print('verts %d faces %d' % (len(bm.verts), len(bm.faces)))
+
+    # グリッドの真ん中の50頂点を持ち上げる
+    center = (segments + 1) * (segments // 2) + segments // 2
+    drag = [ bm.verts[center + i] for i in range(-25, 25) ]
+
+    def full() :
+        bm.verts.ensure_lookup_table()
+        bm.edges.ensure_lookup_table()
+        bm.faces.ensure_lookup_table()
+        bm.normal_update()
+
+    def partial() :
+        QMeshOperators.partial_normal_update(drag)
+
+    for name, update in (('full', full), ('partial', partial)) :
+        total = 0.0
+        for frame in range(frames) :
+            for v in drag :
+                v.co.z += 0.001
+            t = time.perf_counter()
+            update()
+            total += time.perf_counter() - t
+        print('%-8s %10.3f ms/frame' % (name, total * 1000.0 / frames))
+
+    # 部分更新の結果が全体の更新と同じか
+    normals = [ v.normal.copy() for v in drag ]
+    bm.normal_update()
+    error = max((a - v.normal).length for a, v in zip(normals, drag))
+    print('max normal error %g' % error)
+    bm.free()
+
+main()